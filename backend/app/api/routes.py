@@ -1,62 +1,330 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from app.models.schemas import AnalyzeResponse, ValidationStatus
-from app.services.ocr import OCRService
-from app.services.image import load_image_from_bytes, preprocess_image, load_pdf_pages_from_bytes
-from app.services.parser import parse_rib
+from app.services.executor import get_executor, ExecutorSaturated
+from app.services.document import (
+    DocumentSource, analyze_document, document_results, first_valid_pages, is_supported, merge_streams
+)
+from app.services.pipeline import reparse_stored
+from app.services.jobs import get_job_store, get_job_workers
+from app.services.text_store import get_text_store
+from app.services.cache import get_result_cache
+from app.services.upload import InvalidUpload, ReceivedForm, UploadTooLarge, receive_uploads
+from app.services.metrics import REGISTRY, timed
+from app.core import config
 
 router = APIRouter()
 
 from fastapi.responses import StreamingResponse
 import json
 import asyncio
+import itertools
+from typing import Optional
 
-@router.post("/analyze")
-async def analyze_rib(file: UploadFile = File(...)):
+def profile_or_400(profile: Optional[str]) -> str:
+    """OCR profile asked by a request (config.OCR_PROFILE when omitted)."""
+    profile = (profile or config.OCR_PROFILE).lower()
+    try:
+        config.ocr_profile(profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return profile
+
+ANALYZE_MODES = ("all", "first_valid")
+
+def first_valid_or_400(mode: str) -> bool:
+    if mode not in ANALYZE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(ANALYZE_MODES)}")
+    return mode == "first_valid"
+
+def multipart_body(**properties) -> dict:
+    """OpenAPI request body of the routes reading their multipart form themselves."""
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "properties": properties}}}}}
+
+BINARY = {"type": "string", "format": "binary"}
+
+async def receive_or_4xx(request: Request, **options) -> ReceivedForm:
+    """Spool the uploaded files of a request: 413 above RIB_MAX_UPLOAD_MB, 400 if malformed."""
+    try:
+        with timed("upload_read"):
+            return await receive_uploads(request, **options)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"Error reading upload: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/analyze", openapi_extra=multipart_body(file=BINARY))
+async def analyze_rib(request: Request, timings: bool = False, profile: Optional[str] = None,
+                      mode: str = "all", probe: bool = False):
     """
-    Analyze an uploaded RIB image or PDF.
+    Analyze an uploaded RIB image or PDF (multipart field `file`).
     Returns a STREAM of results (one per page) using NDJSON.
+    With `timings`, each analyzed page carries its stage durations (ms).
+    `profile` selects the OCR models (accurate, balanced, fast, optionally "-int8").
+    With `mode=first_valid`, the stream ends after the first page holding a
+    valid IBAN and RIB key; `probe` then tries the likely RIB pages first.
     """
-    if not file.content_type.startswith("image/") and file.content_type != "application/pdf":
+    profile = profile_or_400(profile)
+    first_valid = first_valid_or_400(mode)
+    form = await receive_or_4xx(request, max_files=1)
+    uploads = form.uploads("file")
+    if not uploads:
+        form.close()
+        raise HTTPException(status_code=400, detail="Missing file")
+    upload = uploads[0]
+    if not is_supported(upload.content_type):
+        form.close()
         raise HTTPException(status_code=400, detail="File must be an image or PDF")
-    
+    is_pdf = upload.is_pdf
+
+    # Same bytes already analyzed with the current pipeline: replay the stored pages
+    cache = get_result_cache()
+    doc_hash = upload.sha256
+    cached_pages = cache.get_document(doc_hash, profile, first_valid)
+    if cached_pages is not None:
+        upload.close()
+        if first_valid:
+            cached_pages = list(first_valid_pages(cached_pages))
+        REGISTRY.inc("rib_pages_total", len(cached_pages), outcome="cached")
+
+        async def replay_results():
+            for result in cached_pages:
+                yield json.dumps(result) + "\n"
+
+        return StreamingResponse(replay_results(), media_type="application/x-ndjson")
+
+    executor = get_executor()
     try:
-        contents = await file.read()
-        is_pdf = file.content_type == "application/pdf"
-        
-        if is_pdf:
-            images = load_pdf_pages_from_bytes(contents)
-        else:
-            img = load_image_from_bytes(contents)
-            images = [img] if img is not None else []
-                
-        if not images:
+        executor.acquire()
+    except ExecutorSaturated as e:
+        upload.close()
+        print(f"Rejecting upload, server saturated: {e}")
+        raise HTTPException(status_code=503, detail="Server busy, retry later", headers={"Retry-After": "5"})
+
+    source = None
+    try:
+        # Only open the document here: pages are rendered lazily while streaming
+        source = await run_in_threadpool(DocumentSource, upload.path, is_pdf)
+        if not source.page_count:
              raise HTTPException(status_code=400, detail="Invalid file content or empty PDF")
+    except Exception as e:
+        if source is not None:
+            source.close()
+        upload.close()
+        executor.release()
+        if isinstance(e, HTTPException):
+            raise
+        print(f"Error initializing analysis: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def generate_results():
+        try:
+            async for result in document_results(source, is_pdf, executor, doc_hash, timings, profile,
+                                                 first_valid, probe):
+                # Yield as JSON line
+                yield json.dumps(result) + "\n"
+        finally:
+            source.close()
+            upload.close()
+            executor.release()
+
+    return StreamingResponse(generate_results(), media_type="application/x-ndjson")
+
+
+@router.post("/analyze/batch", openapi_extra=multipart_body(
+    files={"type": "array", "items": BINARY}, file_ids={"type": "array", "items": {"type": "string"}}))
+async def analyze_batch(request: Request, timings: bool = False, profile: Optional[str] = None, mode: str = "all",
+                        probe: bool = False):
+    """
+    Analyze several RIB images or PDFs in one request.
+    Files are processed concurrently (as many as there are OCR workers, their
+    pages sharing the pool) and the results stream back as NDJSON in
+    completion order, each tagged with `file_id` (the matching `file_ids`
+    entry, the file position otherwise) and `file_name`.
+    A file that cannot be analyzed (or larger than RIB_MAX_UPLOAD_MB, then
+    not stored) yields one line with an `error` field.
+    `timings`, `profile`, `mode` and `probe` as for /analyze (per file).
+    """
+    profile = profile_or_400(profile)
+    first_valid = first_valid_or_400(mode)
+    form = await receive_or_4xx(request, skip_too_large=True)
+    files = form.uploads("files")
+    file_ids = form.values("file_ids") or None
+    if not files or (file_ids is not None and len(file_ids) != len(files)):
+        form.close()
+        raise HTTPException(status_code=400, detail="Expected files, and file_ids with one entry per file")
+
+    # The whole batch counts as one request for admission control
+    executor = get_executor()
+    try:
+        executor.acquire()
+    except ExecutorSaturated as e:
+        form.close()
+        print(f"Rejecting batch upload, server saturated: {e}")
+        raise HTTPException(status_code=503, detail="Server busy, retry later", headers={"Retry-After": "5"})
+
+    async def analyze_file(position: int, upload):
+        tag = {"file_id": file_ids[position] if file_ids is not None else str(position),
+               "file_name": upload.filename}
+        try:
+            if upload.error:
+                yield {**tag, "error": upload.error}
+                return
+            if not is_supported(upload.content_type):
+                yield {**tag, "error": "File must be an image or PDF"}
+                return
+            async for result in analyze_document(upload.path, upload.is_pdf, executor, upload.sha256, timings, profile,
+                                                   first_valid, probe):
+                yield {**result, **tag}
+        except Exception as e:
+            print(f"Error analyzing {upload.filename}: {e}")
+            yield {**tag, "error": str(e)}
+        finally:
+            upload.close()
+
+    async def generate_results():
+        try:
+            streams = (analyze_file(position, upload) for position, upload in enumerate(files))
+            async for line in merge_streams(streams, executor.max_workers):
+                yield json.dumps(line) + "\n"
+        finally:
+            form.close()
+            executor.release()
 
-        async def generate_results():
-            ocr_service = OCRService()
-            for idx, image in enumerate(images):
-                try:
-                    # Preprocess & OCR & Parse
-                    processed_image = preprocess_image(image)
-                    raw_text = ocr_service.predict(processed_image)
-                    result = parse_rib(raw_text)
-                    
-                    if is_pdf:
-                        result.page_number = idx + 1
-                    
-                    # Yield as JSON line
-                    yield json.dumps(result.dict()) + "\n"
-                    
-                    # Small sleep to ensure event loop yields if processing many files
-                    await asyncio.sleep(0.01)
-                except Exception as e:
-                    print(f"Error on page {idx}: {e}")
-                    # We can yield an error object or just skip
-                    continue
-
-        return StreamingResponse(generate_results(), media_type="application/x-ndjson")
+    return StreamingResponse(generate_results(), media_type="application/x-ndjson")
 
+
+@router.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters of the result cache."""
+    return get_result_cache().stats()
+
+
+@router.post("/reparse")
+async def reparse(doc_hash: Optional[str] = None, limit: Optional[int] = None):
+    """
+    Re-run the parser over stored OCR text (no OCR), one NDJSON line per page.
+    Optionally restricted to one document (SHA-256 of the uploaded file).
+    """
+    if get_text_store() is None:
+        raise HTTPException(status_code=404, detail="OCR text store is disabled (set RIB_TEXT_STORE)")
+
+    async def generate_results():
+        pages = reparse_stored(doc_hash, limit)
+        while True:
+            # Parse in the threadpool, a few hundred pages at a time
+            chunk = await run_in_threadpool(lambda: list(itertools.islice(pages, 200)))
+            if not chunk:
+                break
+            for item in chunk:
+                yield json.dumps(item) + "\n"
+
+    return StreamingResponse(generate_results(), media_type="application/x-ndjson")
+
+
+def job_store_or_404():
+    store = get_job_store()
+    if store is None:
+        raise HTTPException(status_code=404, detail="Background jobs are disabled (set RIB_JOBS_DB)")
+    return store
+
+
+@router.post("/jobs", openapi_extra=multipart_body(
+    files={"type": "array", "items": BINARY}, priority={"type": "integer", "default": 0}))
+async def create_job(request: Request):
+    """
+    Queue files (multipart field `files`) for background analysis, higher
+    `priority` first. Returns the job summary; results are read from
+    /jobs/{job_id}/results.
+    """
+    store = job_store_or_404()
+    job_id = await run_in_threadpool(store.create)
+    try:
+        # Files spooled straight into the job directory
+        form = await receive_or_4xx(request, directory=store.job_dir(job_id))
+        files = form.uploads("files")
+        priority = form.values("priority")
+        if not files or not all(value.lstrip("-").isdigit() for value in priority):
+            raise HTTPException(status_code=400, detail="Expected files and an integer priority")
+        for position, upload in enumerate(files):
+            await run_in_threadpool(store.add_file, job_id, position, upload)
     except Exception as e:
-        print(f"Error initializing analysis: {e}")
+        await run_in_threadpool(store.delete, job_id)
+        if isinstance(e, HTTPException):
+            raise
+        print(f"Error storing job upload: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    # Priority only read now: the field may come after the files
+    await run_in_threadpool(store.activate, job_id, int(priority[0]) if priority else 0)
+    get_job_workers().notify()
+    return await run_in_threadpool(store.summary, job_id)
+
+
+@router.get("/jobs")
+async def list_jobs(limit: int = 100):
+    """Most recent jobs first."""
+    return await run_in_threadpool(job_store_or_404().recent, limit)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and per-file progress of a job."""
+    summary = await run_in_threadpool(job_store_or_404().summary, job_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return summary
+
+
+@router.get("/jobs/{job_id}/results")
+async def job_results(job_id: str, offset: int = 0, follow: bool = False):
+    """
+    NDJSON result lines of a job (same format as /analyze/batch, file_id being
+    the file position), starting at line `offset`. With `follow`, the stream
+    stays open until the job is finished.
+    """
+    store = job_store_or_404()
+    if await run_in_threadpool(store.summary, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def generate_results():
+        position = offset
+        while True:
+            lines = await run_in_threadpool(store.results, job_id, position)
+            for line in lines:
+                yield line + "\n"
+            position += len(lines)
+            if lines:
+                continue
+            summary = await run_in_threadpool(store.summary, job_id)
+            if not follow or summary is None or summary["status"] in ("done", "cancelled"):
+                # Lines written between the last read and the final status
+                if follow and summary is not None:
+                    for line in await run_in_threadpool(store.results, job_id, position):
+                        yield line + "\n"
+                break
+            await asyncio.sleep(1)
+
+    return StreamingResponse(generate_results(), media_type="application/x-ndjson")
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Skip the queued files of a job; running files stop after their current page."""
+    store = job_store_or_404()
+    if not await run_in_threadpool(store.cancel, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await run_in_threadpool(store.summary, job_id)
+
 
+@router.delete("/jobs/{job_id}")
+async def delete_job(job_id: str):
+    """Cancel a job and remove its files and results."""
+    store = job_store_or_404()
+    await run_in_threadpool(store.cancel, job_id)
+    if not await run_in_threadpool(store.delete, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"deleted": job_id}
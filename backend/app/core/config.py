@@ -0,0 +1,158 @@
+"""
+Runtime settings of the backend, read once from environment variables.
+"""
+import os
+import sys
+
+
+def _env_int(name: str, default: int, minimum: int = 0) -> int:
+    try:
+        return max(minimum, int(os.getenv(name, default)))
+    except ValueError:
+        print(f"Invalid value for {name}, using default {default}")
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        print(f"Invalid value for {name}, using default {default}")
+        return default
+
+
+# PDF rasterization: scale of a full page, capped to a maximum bitmap side in pixels
+RENDER_SCALE = _env_float("RIB_RENDER_SCALE", 2.0)
+RENDER_MAX_SIDE = _env_int("RIB_RENDER_MAX_SIDE", 4000)
+# Region of interest: "off" renders full pages, "text" uses the PDF text layer
+# to render only the IBAN/BIC block, at ROI_SCALE
+ROI_MODE = os.getenv("RIB_ROI", "off").lower()
+ROI_SCALE = _env_float("RIB_ROI_SCALE", 3.0)
+
+# Digital PDFs: parse the embedded text layer first and skip OCR when it
+# yields a checksum-valid IBAN
+TEXT_LAYER = os.getenv("RIB_TEXT_LAYER", "1").lower() not in ("0", "false", "no", "off")
+
+# Image preprocessing before OCR: "none", "fast" or "quality"
+PREPROCESS_PRESET = os.getenv("RIB_PREPROCESS", "none").lower()
+
+# Pages per DocTR forward pass for multi-page documents
+OCR_BATCH_SIZE = _env_int("RIB_OCR_BATCH_SIZE", 4, minimum=1)
+
+# Worker pool running preprocess -> OCR -> parse outside the event loop
+# "thread": shares one model in-process, "process": one model per worker process
+EXECUTOR_MODE = os.getenv("RIB_EXECUTOR", "thread").lower()
+MAX_WORKERS = _env_int("RIB_MAX_WORKERS", 1, minimum=1)
+# Requests allowed to wait for a worker before new uploads get a 503
+MAX_QUEUE = _env_int("RIB_MAX_QUEUE", 8)
+# Torch intra-op threads per worker process (0 = share the CPU cores evenly)
+TORCH_THREADS = _env_int("RIB_TORCH_THREADS", 0)
+
+# Bounded OCR-confusion search when no IBAN passes mod-97 as read
+# (time budget per page, 0 disables; maximum edit cost of a repair)
+CORRECTION_BUDGET_MS = _env_int("RIB_CORRECTION_BUDGET_MS", 50)
+CORRECTION_MAX_COST = _env_int("RIB_CORRECTION_MAX_COST", 4)
+
+# Uploads are spooled to temporary files in UPLOAD_DIR (system default when
+# empty), rejected with a 413 above MAX_UPLOAD_MB per file (0: no limit)
+UPLOAD_DIR = os.getenv("RIB_UPLOAD_DIR", "")
+MAX_UPLOAD_MB = _env_int("RIB_MAX_UPLOAD_MB", 200)
+
+# Load the OCR model in the background at startup and run one inference
+# (readiness reported by /health/ready)
+OCR_WARMUP = os.getenv("RIB_OCR_WARMUP", "1").lower() not in ("0", "false", "no", "off")
+
+
+def bundled_models_dir() -> str:
+    """models/ bundled with the PyInstaller build (next to static/), if any."""
+    if getattr(sys, 'frozen', False):
+        models_dir = os.path.join(sys._MEIPASS, "models")
+        if os.path.isdir(models_dir):
+            return models_dir
+    return ""
+
+
+# Offline mode: directory with the <arch>.pt weights written by
+# scripts/export_models.py, loaded instead of downloading the pretrained models
+# (the weights bundled with the desktop build by default)
+OCR_MODELS_DIR = os.getenv("RIB_OCR_MODELS_DIR", "") or bundled_models_dir()
+
+# OCR model profiles: DocTR (detection, recognition) architectures, heaviest
+# first. A "-int8" suffix (e.g. "fast-int8") quantizes the recognition model
+# to int8 (dynamic quantization, CPU).
+OCR_PROFILES = {
+    "accurate": ("db_resnet50", "crnn_vgg16_bn"),
+    "balanced": ("db_resnet50", "crnn_mobilenet_v3_large"),
+    "fast": ("db_mobilenet_v3_large", "crnn_mobilenet_v3_small"),
+}
+QUANTIZED_SUFFIX = "-int8"
+
+
+def ocr_profile(name: str) -> tuple[str, str, bool]:
+    """(detection arch, recognition arch, quantized) of a profile name, ValueError if unknown."""
+    base = name[:-len(QUANTIZED_SUFFIX)] if name.endswith(QUANTIZED_SUFFIX) else name
+    if base not in OCR_PROFILES:
+        choices = ", ".join(OCR_PROFILES)
+        raise ValueError(f"Unknown OCR profile {name!r} (choose from {choices}, optionally with {QUANTIZED_SUFFIX})")
+    return (*OCR_PROFILES[base], base != name)
+
+
+def _env_profile(name: str, default: str) -> str:
+    value = (os.getenv(name) or default).lower()
+    if not value:
+        return value
+    try:
+        ocr_profile(value)
+    except ValueError as e:
+        print(f"{e}, using default {default or 'none'}")
+        return default
+    return value
+
+
+def ocr_model_id(profile: str) -> str:
+    """Identity of the OCR models of a profile, part of every cached result."""
+    det_arch, reco_arch, quantized = ocr_profile(profile)
+    return f"{det_arch}+{reco_arch}" + ("+int8" if quantized else "")
+
+
+def cascade_profile(profile: str) -> str:
+    """Light profile tried before `profile` in cascade mode, empty when there is no cascade."""
+    return CASCADE_PROFILE if CASCADE_PROFILE and CASCADE_PROFILE != profile else ""
+
+
+def pipeline_version(profile: str) -> str:
+    # Bump the leading number when parser or preprocessing changes would alter cached results
+    version = f"10:{ocr_model_id(profile)}:roi-{ROI_MODE}:text-{int(TEXT_LAYER)}:pre-{PREPROCESS_PRESET}"
+    if cascade_profile(profile):
+        version += f":cascade-{ocr_model_id(CASCADE_PROFILE)}@{CASCADE_SCALE:g}"
+    return version
+
+
+# Cascade: OCR pages with the light CASCADE_PROFILE first and run the requested
+# profile only on pages it does not read as a valid IBAN with a valid French RIB
+# key (empty disables). Escalated PDF pages are rendered again at CASCADE_SCALE
+# when it is above RENDER_SCALE.
+CASCADE_PROFILE = _env_profile("RIB_CASCADE_PROFILE", "")
+CASCADE_SCALE = _env_float("RIB_CASCADE_SCALE", RENDER_SCALE)
+
+
+# Profile of /analyze requests that do not ask for one
+OCR_PROFILE = _env_profile("RIB_OCR_PROFILE", "accurate")
+OCR_MODEL_ID = ocr_model_id(OCR_PROFILE)
+PIPELINE_VERSION = pipeline_version(OCR_PROFILE)
+
+# Result cache: in-memory LRU (0 disables) and optional SQLite tier
+CACHE_MAX_ENTRIES = _env_int("RIB_CACHE_SIZE", 512)
+CACHE_DB_PATH = os.getenv("RIB_CACHE_DB", "")
+CACHE_DB_MAX_ENTRIES = _env_int("RIB_CACHE_DB_MAX_ENTRIES", 100000)
+CACHE_TTL_SECONDS = _env_int("RIB_CACHE_TTL", 7 * 24 * 3600)
+
+# SQLite store of raw OCR text per page, used to re-run the parser without OCR
+TEXT_STORE_PATH = os.getenv("RIB_TEXT_STORE", "")
+
+# Background jobs (POST /api/v1/jobs): SQLite queue of uploaded files, drained by
+# JOB_WORKERS concurrent documents sharing the worker pool (empty path disables)
+JOBS_DB_PATH = os.getenv("RIB_JOBS_DB", "")
+JOB_WORKERS = _env_int("RIB_JOB_WORKERS", MAX_WORKERS, minimum=1)
+# OCR profile of background jobs (e.g. "fast" for bulk imports)
+JOB_OCR_PROFILE = _env_profile("RIB_JOB_OCR_PROFILE", OCR_PROFILE)
@@ -1,70 +1,143 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router as api_router
+from app.services.executor import get_executor
+from app.services.bank_registry import get_bank_registry
+from app.services.jobs import get_job_store, get_job_workers
+from app.services.cache import get_result_cache
+from app.services.metrics import REGISTRY
+from app.services.warmup import get_readiness
+from app.core import config
 import os
+import sys
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 
-app = FastAPI(title="RIB Extraction API")
+def job_files_by_status() -> dict:
+    store = get_job_store()
+    if store is None:
+        return {}
+    return {(("status", status),): count for status, count in store.file_counts().items()}
 
-# Allow CORS for Frontend
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], # In production, set to specific frontend URL
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Scrape-time values of the worker pool, result cache, job queue and OCR readiness
+REGISTRY.callback("rib_requests_in_flight", "Uploads being analyzed or waiting for a worker",
+                  lambda: {(): get_executor().stats()["active_requests"]})
+REGISTRY.callback("rib_requests_capacity", "Uploads accepted before answering 503",
+                  lambda: {(): get_executor().max_workers + get_executor().max_queue})
+REGISTRY.callback("rib_cache_lookups_total", "Result cache lookups",
+                  lambda: {(("result", outcome),): get_result_cache().stats()[outcome] for outcome in ("hits", "misses")},
+                  kind="counter")
+REGISTRY.callback("rib_cache_memory_entries", "Documents in the in-memory result cache",
+                  lambda: {(): get_result_cache().stats()["memory_entries"]})
+REGISTRY.callback("rib_job_files", "Files of background jobs by status", job_files_by_status)
+REGISTRY.callback("rib_ocr_ready", "1 once the OCR model is loaded and warmed up",
+                  lambda: {(): int(get_readiness().ready)})
 
-app.include_router(api_router, prefix="/api/v1")
+# Service routes answered by the backend itself, never by the SPA catch-all
+SERVICE_PATHS = ("metrics", "health", "health/ready")
 
-import sys
-from fastapi import HTTPException
-
-# Paths for static files (Frontend)
-if getattr(sys, 'frozen', False):
-    # Running in a bundle (PyInstaller)
-    base_dir = sys._MEIPASS
-    static_dir = os.path.join(base_dir, "static")
-else:
+def default_static_dir() -> str:
+    """Paths for static files (Frontend)"""
+    if getattr(sys, 'frozen', False):
+        # Running in a bundle (PyInstaller)
+        return os.path.join(sys._MEIPASS, "static")
     # Running in normal Python environment
     # In dev, static might be inside backend/static or just /app/static in docker
     static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
     if not os.path.exists(static_dir):
-         static_dir = "/app/static"
+        static_dir = "/app/static"
+    return static_dir
+
+def create_app(static_dir: str = None) -> FastAPI:
+    """
+    Build the API. Service routes (/metrics, /health, /health/ready) are
+    registered before the SPA catch-all so they are never answered by index.html.
+    """
+    app = FastAPI(title="RIB Extraction API")
+
+    # Allow CORS for Frontend
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"], # In production, set to specific frontend URL
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app.include_router(api_router, prefix="/api/v1")
+
+    @app.get("/metrics")
+    def metrics():
+        """Stage latency histograms, page counters and queue gauges (Prometheus text format)."""
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/health")
+    def health_check():
+        """
+        Health check endpoint to verify backend status.
+        Liveness: always "ok" while the server answers; `ocr.ready` tells
+        whether the model is loaded (see /health/ready).
+        """
+        return {"status": "ok", "service": "RIB-App Backend", "ocr_engine": "DocTR", "ocr": get_readiness().stats(),
+                "executor": get_executor().stats(), "reference_data": get_bank_registry().stats()}
+
+    @app.get("/health/ready")
+    def readiness_check():
+        """Readiness: 200 once the OCR model is warmed up, 503 before (or if loading failed)."""
+        stats = get_readiness().stats()
+        return JSONResponse(stats, status_code=200 if stats["ready"] else 503)
 
-# Only mount static files if the directory exists
-if os.path.exists(static_dir):
+    @app.on_event("startup")
+    def start_warmup():
+        # Background thread: the server binds without waiting for the model
+        if config.OCR_WARMUP:
+            get_readiness().start(get_executor())
+
+    @app.on_event("startup")
+    async def start_job_workers():
+        workers = get_job_workers()
+        if workers is not None:
+            await workers.start()
+
+    @app.on_event("shutdown")
+    async def shutdown_executor():
+        workers = get_job_workers()
+        if workers is not None:
+            await workers.stop()
+        get_executor().shutdown()
+
+    if static_dir is None:
+        static_dir = default_static_dir()
+    # Only mount static files if the directory exists
+    # (dev mode: static files not mounted, frontend runs separately)
+    if os.path.exists(static_dir):
+        mount_frontend(app, static_dir)
+    return app
+
+def mount_frontend(app: FastAPI, static_dir: str):
+    """Serve the exported frontend; must come after every other route (catch-all)."""
     # Mount /_next and other static folders if they exist
     next_dir = os.path.join(static_dir, "_next")
     if os.path.exists(next_dir):
         app.mount("/_next", StaticFiles(directory=next_dir), name="static_next")
-    
+
     # Catch-all for SPA
     @app.get("/{full_path:path}")
     async def serve_spa(full_path: str):
-        # Prevent intercepting API calls (prefix /api/v1)
-        if full_path.startswith("api/"):
+        # Prevent intercepting API calls (prefix /api/v1) and service routes
+        if full_path.startswith("api/") or full_path.rstrip("/") in SERVICE_PATHS:
             raise HTTPException(status_code=404, detail="API route not found")
 
         # Check if a specific file exists in static (e.g. favicon.ico, etc.)
         file_path = os.path.join(static_dir, full_path)
         if os.path.isfile(file_path):
             return FileResponse(file_path)
-        
+
         # Otherwise return index.html for client-side routing
         index_path = os.path.join(static_dir, "index.html")
         if os.path.exists(index_path):
              return FileResponse(index_path)
-        
+
         return {"error": "Frontend not found (index.html missing)", "path_checked": index_path}
-else:
-    # Dev mode: Static files not mounted, frontend runs separately
-    pass
 
-@app.get("/health")
-def health_check():
-    """
-    Health check endpoint to verify backend status.
-    """
-    return {"status": "ok", "service": "RIB-App Backend", "ocr_engine": "DocTR"}
+app = create_app()
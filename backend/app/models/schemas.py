@@ -19,7 +19,12 @@ class AnalyzeResponse(BaseModel):
     extraction_method: Optional[str] = Field(None, description="Method used to find the IBAN (Direct, Corrected, Reconstructed)")
     checksum_valid: bool = Field(False, description="Indicates if the found IBAN passed the checksum validation")
     rib_key_valid: Optional[bool] = Field(None, description="Indicates if the French RIB key is valid (France only)")
+    ocr_confidence: Optional[float] = Field(None, ge=0, le=1, description="Lowest OCR recognition confidence of the IBAN words (page average if rebuilt)")
     validation_details: Optional[list[str]] = Field(None, description="List of specific validation errors or details")
     page_number: Optional[int] = Field(None, description="Page number if extracted from a multi-page document")
+    file_id: Optional[str] = Field(None, description="File the page belongs to (batch analysis only)")
+    file_name: Optional[str] = Field(None, description="Uploaded file name (batch analysis only)")
+    ocr_profile: Optional[str] = Field(None, description="OCR model profile that read the page (None for PDF text layers)")
+    timings: Optional[dict[str, float]] = Field(None, description="Duration of each pipeline stage in milliseconds (timings=true only)")
     data: RibData
     message: Optional[str] = None
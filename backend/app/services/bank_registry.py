@@ -0,0 +1,98 @@
+"""
+In-memory registry of French bank reference data (app/resources).
+
+Files are parsed once into dictionaries and reloaded only when they
+change on disk, so lookups from parse_rib are plain dict reads.
+"""
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources")
+
+# name in the registry -> JSON file in the resources directory
+# banks:    {"30004": "BNP Paribas"}                      (5-digit bank code)
+# bics:     {"BNPAFRPP": "BNP PARIBAS"}                    (BIC8)
+# branches: {"3000400815": "BNP PARIBAS PARIS OPERA"}      (bank code + guichet, optional)
+RESOURCE_FILES = {
+    "banks": "banks_fr.json",
+    "bics": "bics_fr.json",
+    "branches": "branches_fr.json",
+}
+
+
+class BankRegistry:
+    def __init__(self, resources_dir: str = RESOURCES_DIR, check_interval: float = 5.0):
+        self.resources_dir = resources_dir
+        # Minimum delay (seconds) between two checks of the files on disk
+        self.check_interval = check_interval
+        self._tables: dict[str, dict[str, str]] = {name: {} for name in RESOURCE_FILES}
+        self._mtimes: dict[str, Optional[float]] = {name: None for name in RESOURCE_FILES}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self.reload_if_changed(force=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.resources_dir, RESOURCE_FILES[name])
+
+    def _load(self, name: str) -> dict[str, str]:
+        path = self._path(name)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return {str(key).upper(): value for key, value in data.items()}
+        except Exception as e:
+            print(f"Error loading {RESOURCE_FILES[name]}: {e}")
+            return self._tables[name]
+
+    def reload_if_changed(self, force: bool = False):
+        """Reload the files whose modification time changed (at most every check_interval)."""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            self._last_check = now
+            for name in RESOURCE_FILES:
+                try:
+                    mtime = os.path.getmtime(self._path(name))
+                except OSError:
+                    mtime = None
+                if force or mtime != self._mtimes[name]:
+                    # Swap the whole dict: readers never see a half-loaded table
+                    self._tables[name] = self._load(name)
+                    self._mtimes[name] = mtime
+
+    def bank_name(self, bank_code: str) -> Optional[str]:
+        """Bank name from the 5-digit French bank code (IBAN characters 5-9)."""
+        self.reload_if_changed()
+        return self._tables["banks"].get(bank_code)
+
+    def branch_name(self, bank_code: str, branch_code: str) -> Optional[str]:
+        """Branch name from bank code + 5-digit guichet, if a branch dataset is installed."""
+        self.reload_if_changed()
+        return self._tables["branches"].get(f"{bank_code}{branch_code}")
+
+    def bic_name(self, bic: str) -> Optional[str]:
+        """Institution name from a BIC (8 or 11 characters, looked up by BIC8)."""
+        self.reload_if_changed()
+        return self._tables["bics"].get(bic[:8].upper())
+
+    def stats(self) -> dict:
+        return {name: len(table) for name, table in self._tables.items()}
+
+
+_registry: BankRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_bank_registry() -> BankRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = BankRegistry()
+    return _registry
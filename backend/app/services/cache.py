@@ -0,0 +1,158 @@
+"""
+Result cache for /analyze, keyed by the SHA-256 of the uploaded bytes.
+
+Two tiers: an in-memory LRU and an optional SQLite file that survives
+restarts. Entries are tied to the pipeline version of their OCR profile
+(config.pipeline_version) so a model or parser change never serves stale
+results, and a document read with the fast profile is not served to a
+request asking for the accurate one.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from app.core import config
+
+
+class ResultCache:
+    """
+    Per-page AnalyzeResponse dicts of already analyzed documents.
+
+    A document is a hit only when its page count and every page are
+    cached, so a hit can be streamed without rendering the file.
+    """
+
+    def __init__(self, max_entries: int = 512, db_path: str = "", db_max_entries: int = 100000,
+                 ttl_seconds: int = 7 * 24 * 3600, version: str = config.PIPELINE_VERSION):
+        self.max_entries = max_entries
+        self.db_max_entries = db_max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, created REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+            self._db.commit()
+
+    def _key(self, doc_hash: str, page: str, profile: Optional[str] = None) -> str:
+        version = self.version if profile in (None, config.OCR_PROFILE) else config.pipeline_version(profile)
+        return f"{version}:{doc_hash}:{page}"
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            if now - entry[0] <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                return entry[1]
+            del self._memory[key]
+        if self._db is not None:
+            row = self._db.execute("SELECT created, value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                if now - row[0] <= self.ttl_seconds:
+                    self._remember(key, row[0], row[1])
+                    return row[1]
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._db.commit()
+        return None
+
+    def _remember(self, key: str, created: float, value: str):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _set(self, key: str, value: str):
+        now = time.time()
+        self._remember(key, now, value)
+        if self._db is not None:
+            self._db.execute("INSERT OR REPLACE INTO results (key, created, value) VALUES (?, ?, ?)", (key, now, value))
+            self._db.commit()
+
+    def get_document(self, doc_hash: str, profile: Optional[str] = None,
+                     first_valid: bool = False) -> Optional[list[dict]]:
+        """
+        All cached pages of a document, or None (counted as a miss). With
+        `first_valid`, the pages stored by a first_valid analysis (up to its
+        first fully valid page) are a hit too.
+        """
+        with self._lock:
+            pages = None
+            for count_key in ("pages", "first_valid") if first_valid else ("pages",):
+                page_count = self._get(self._key(doc_hash, count_key, profile))
+                if page_count is None:
+                    continue
+                pages = []
+                for idx in range(int(page_count)):
+                    value = self._get(self._key(doc_hash, str(idx), profile))
+                    if value is None:
+                        pages = None
+                        break
+                    pages.append(value)
+                if pages is not None:
+                    break
+            if pages is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return [json.loads(value) for value in pages]
+
+    def set_page(self, doc_hash: str, page_index: int, result: dict, profile: Optional[str] = None):
+        with self._lock:
+            self._set(self._key(doc_hash, str(page_index), profile), json.dumps(result))
+
+    def set_page_count(self, doc_hash: str, page_count: int, profile: Optional[str] = None,
+                       first_valid: bool = False):
+        """
+        Mark a document as complete once all its pages are stored or, with
+        `first_valid`, once its first `page_count` pages (ending with the
+        first fully valid one) are.
+        """
+        with self._lock:
+            self._set(self._key(doc_hash, "first_valid" if first_valid else "pages", profile), str(page_count))
+            self._evict_db()
+
+    def _evict_db(self):
+        if self._db is None:
+            return
+        self._db.execute("DELETE FROM results WHERE created < ?", (time.time() - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.db_max_entries,),
+        )
+        self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_enabled": self._db is not None,
+                "version": self.version,
+            }
+
+
+_cache: ResultCache | None = None
+
+
+def get_result_cache() -> ResultCache:
+    """Shared cache configured from app.core.config."""
+    global _cache
+    if _cache is None:
+        _cache = ResultCache(config.CACHE_MAX_ENTRIES, config.CACHE_DB_PATH, config.CACHE_DB_MAX_ENTRIES,
+                             config.CACHE_TTL_SECONDS)
+    return _cache
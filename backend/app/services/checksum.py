@@ -0,0 +1,171 @@
+"""
+Allocation-light IBAN checksum (ISO 7064 mod 97-10).
+
+Used to reject candidate IBANs before any schwifty object is built:
+impossible lengths are skipped up front and the checksum is a single
+integer loop. scan_ibans finds every checksum-valid IBAN of a text in a
+single vectorized pass. schwifty remains the final confirmation.
+"""
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
+import numpy as np
+
+# IBAN length per country (SEPA countries accepted by the parser)
+IBAN_LENGTHS = MappingProxyType({
+    'AT': 20, 'BE': 16, 'BG': 22, 'CH': 21, 'CY': 28, 'CZ': 24, 'DE': 22, 'DK': 18, 'EE': 20,
+    'ES': 24, 'FI': 18, 'FR': 27, 'GB': 22, 'GR': 27, 'HR': 21, 'HU': 28, 'IE': 22, 'IS': 26,
+    'IT': 27, 'LI': 21, 'LT': 20, 'LU': 20, 'LV': 21, 'MC': 27, 'MT': 31, 'NL': 18, 'NO': 15,
+    'PL': 28, 'PT': 25, 'RO': 24, 'SE': 24, 'SI': 19, 'SK': 24, 'SM': 27,
+})
+
+# Numeric value of an IBAN character: '0'-'9' -> 0-9, 'A'-'Z' -> 10-35
+CHAR_VALUES = MappingProxyType({
+    **{chr(ord('0') + i): i for i in range(10)},
+    **{chr(ord('A') + i): 10 + i for i in range(26)},
+})
+
+
+def mod97_update(remainder: int, char: str) -> int:
+    """Append one IBAN character to a running mod-97 remainder."""
+    value = CHAR_VALUES[char]
+    # Letters expand to two digits
+    return (remainder * (100 if value > 9 else 10) + value) % 97
+
+
+def iban_mod97(iban: str) -> int:
+    """Mod-97 remainder of an IBAN (compact, upper case); 1 means valid."""
+    remainder = 0
+    # Rearranged form: BBAN, then country code and check digits
+    for char in iban[4:]:
+        remainder = mod97_update(remainder, char)
+    for char in iban[:4]:
+        remainder = mod97_update(remainder, char)
+    return remainder
+
+
+def iban_check_digits(country: str, bban: str) -> str:
+    """Check digits of the IBAN of `bban` (compact, upper case)."""
+    return f"{98 - iban_mod97(country + '00' + bban):02d}"
+
+
+def iban_length_ok(iban: str) -> bool:
+    return IBAN_LENGTHS.get(iban[:2]) == len(iban)
+
+
+def is_plausible_iban(iban: str) -> bool:
+    """
+    Fast structural check: known country, exact length, check digits and
+    mod-97. Does not validate the country-specific BBAN format (schwifty does).
+    """
+    if not iban_length_ok(iban) or not iban[2:4].isdigit():
+        return False
+    try:
+        return iban_mod97(iban) == 1
+    except KeyError:
+        # Character outside 0-9A-Z
+        return False
+
+
+class IbanHit(NamedTuple):
+    start: int       # position of the country code in the scanned text
+    iban: str
+    correction: str  # "none", "body" (OCR letters fixed in the whole body) or "key" (last 2 chars only)
+
+
+# 10^k mod 97 repeats with period 96
+POW10 = np.array([pow(10, k, 97) for k in range(96)], dtype=np.int32)
+INV_POW10 = np.array([pow(10, -k, 97) for k in range(96)], dtype=np.int32)
+# Character values indexed by ASCII code
+ASCII_VALUES = np.zeros(256, dtype=np.int32)
+for _char, _value in CHAR_VALUES.items():
+    ASCII_VALUES[ord(_char)] = _value
+
+# IBAN length indexed by the ASCII codes of the country code (0 = unknown country)
+LENGTH_TABLE = np.zeros((256, 256), dtype=np.int32)
+for _country, _length in IBAN_LENGTHS.items():
+    LENGTH_TABLE[ord(_country[0]), ord(_country[1])] = _length
+
+
+def prefix_remainders(codes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Rolling mod-97 remainders of every prefix of a text (ASCII codes of an
+    upper-case alphanumeric string), and the number of decimal digits of each
+    prefix (letters count as two digits). Computed in one vectorized pass:
+    P[k] = 10^E[k] * sum(v[i] * 10^-E[i+1]) mod 97.
+    """
+    values = ASCII_VALUES[codes]
+    digits = np.zeros(len(codes) + 1, dtype=np.int32)
+    np.cumsum(np.where(values > 9, 2, 1), out=digits[1:])
+    sums = np.zeros(len(codes) + 1, dtype=np.int32)
+    np.cumsum(values * INV_POW10[digits[1:] % 96] % 97, out=sums[1:])
+    return POW10[digits % 96] * (sums % 97) % 97, digits
+
+
+def _slice_mod97(remainders: np.ndarray, digits: np.ndarray, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Mod-97 remainders of text[start:end] for arrays of bounds, from the prefix remainders."""
+    return (remainders[end] - remainders[start] * POW10[(digits[end] - digits[start]) % 96]) % 97
+
+
+def scan_ibans(text: str, corrections: Optional[Mapping[str, str]] = None,
+               correct_countries: frozenset = frozenset({'FR'})) -> list[IbanHit]:
+    """
+    Single pass over an upper-case alphanumeric text (no spaces) reporting every
+    position where a prefix of the country's IBAN length passes mod-97.
+
+    The text is walked once to build rolling prefix remainders; the checksum
+    of every candidate is then derived in constant time, so the scan is linear
+    in the text length. For countries in `correct_countries`, the same pass is
+    done over the text with the OCR `corrections` (letter -> digit) applied, and
+    candidates are also checked with the corrections applied to the whole body,
+    or to the last two (key) characters only. Hits of one start are listed in
+    that order of preference.
+    """
+    codes = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+    if len(codes) < 4:
+        return []
+    # Candidate starts: known country code followed by 2 check digits, full length available
+    is_digit = (codes >= 48) & (codes <= 57)
+    lengths = LENGTH_TABLE[codes[:-3], codes[1:-2]] * (is_digit[2:-1] & is_digit[3:])
+    start = np.flatnonzero(lengths)
+    end = start + lengths[start]
+    keep = end <= len(codes)
+    start, end = start[keep], end[keep]
+    if not len(start):
+        return []
+    bban = start + 4
+
+    # Rearranged IBAN: BBAN, then country code and check digits (6 digits)
+    values = ASCII_VALUES[codes]
+    header = (values[start] * 100 + values[start + 1]) * 100 + values[start + 2] * 10 + values[start + 3]
+
+    raw_rem, raw_digits = prefix_remainders(codes)
+    raw_ok = (_slice_mod97(raw_rem, raw_digits, bban, end) * 1000000 + header) % 97 == 1
+
+    body_ok = key_ok = np.zeros(len(start), dtype=bool)
+    correctable = np.zeros(len(start), dtype=bool)
+    for country in correct_countries:
+        correctable |= (codes[start] == ord(country[0])) & (codes[start + 1] == ord(country[1]))
+    fixed_text = text.translate(str.maketrans(dict(corrections or {})))
+    if correctable.any() and fixed_text != text:
+        fixed_codes = np.frombuffer(fixed_text.encode("ascii"), dtype=np.uint8)
+        fixed_rem, fixed_digits = prefix_remainders(fixed_codes)
+        changed = np.zeros(len(codes) + 1, dtype=np.int32)
+        np.cumsum(codes != fixed_codes, out=changed[1:])
+        body = _slice_mod97(fixed_rem, fixed_digits, bban, end)
+        body_ok = correctable & (changed[end] > changed[bban]) & ((body * 1000000 + header) % 97 == 1)
+        # Raw body followed by the corrected key digits
+        key = (_slice_mod97(raw_rem, raw_digits, bban, end - 2)
+               * POW10[(fixed_digits[end] - fixed_digits[end - 2]) % 96]
+               + _slice_mod97(fixed_rem, fixed_digits, end - 2, end)) % 97
+        key_ok = correctable & (changed[end] > changed[end - 2]) & ((key * 1000000 + header) % 97 == 1)
+
+    hits: list[IbanHit] = []
+    for idx in np.flatnonzero(raw_ok | body_ok | key_ok):
+        s, e = int(start[idx]), int(end[idx])
+        if raw_ok[idx]:
+            hits.append(IbanHit(s, text[s:e], "none"))
+        if body_ok[idx]:
+            hits.append(IbanHit(s, text[s:s + 4] + fixed_text[s + 4:e], "body"))
+        if key_ok[idx]:
+            hits.append(IbanHit(s, text[s:e - 2] + fixed_text[e - 2:e], "key"))
+    return hits
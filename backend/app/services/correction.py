@@ -0,0 +1,259 @@
+"""
+Bounded OCR-confusion search for French-format IBANs (FR, MC).
+
+Used when no IBAN of the text passes mod-97 as read. A candidate window
+(check digits + BBAN) is repaired with per-character confusions (letter
+read instead of a digit, look-alike digits) and at most one inserted or
+deleted character. Every digit weighs linearly in the IBAN mod-97, so
+instead of enumerating digits the search picks the slot that changes and
+solves its new value from the checksum. Candidates are ranked by edit cost.
+
+On digits the RIB key is the same mod-97 equation as the IBAN check (its
+weights are powers of 10): once a digit is solved from the IBAN, the key
+only checks the check digits. Such repairs, like the position of a missing
+or extra character, are chosen by the checksum rather than verified by it,
+so best_correction only accepts letters read as their look-alike digit.
+A RIB read without its IBAN has no check digits to compare: its repairs
+only pass the RIB key (check_computed).
+"""
+import time
+from itertools import product
+from types import MappingProxyType
+from typing import NamedTuple, Optional
+import numpy as np
+
+from app.services.checksum import CHAR_VALUES, INV_POW10, POW10
+
+# Digits a character is commonly confused with by the OCR
+CONFUSIONS = MappingProxyType({
+    'O': '0', 'Q': '0', 'D': '0', 'C': '0', 'U': '0',
+    'I': '1', 'L': '1', 'J': '1', 'Z': '2', 'A': '4',
+    'S': '5', 'G': '6', 'T': '7', 'B': '8',
+    '0': '689', '1': '7', '2': '7', '3': '8', '5': '6',
+    '6': '058', '7': '12', '8': '0369', '9': '08',
+})
+# A letter in a digit slot is certainly an OCR error, a look-alike digit only maybe
+LETTER_CONFUSION_COST = 1
+DIGIT_CONFUSION_COST = 2
+# Missing or extra character
+INDEL_COST = 2
+# Any other character in place of the digit
+SUBSTITUTION_COST = 4
+DEFAULT_MAX_COST = 4
+
+CORRECTABLE_COUNTRIES = frozenset({'FR', 'MC'})
+# Body slots: check digits, bank (5n), branch (5n), account (11c), RIB key (2n)
+BODY_SIZE = 25
+ACCOUNT_SLOTS = range(12, 23)
+# Account letters with a digit confusion double the hypotheses to try
+# (letter kept or misread digit); past this count only the extremes are tried
+MAX_AMBIGUOUS_LETTERS = 3
+
+# Cost of reading an ASCII character where the digit d was printed
+EDIT_COSTS = np.full((128, 10), SUBSTITUTION_COST, dtype=np.int64)
+for _digit in range(10):
+    EDIT_COSTS[ord(str(_digit)), _digit] = 0
+for _char, _digits in CONFUSIONS.items():
+    for _digit in _digits:
+        EDIT_COSTS[ord(_char), int(_digit)] = DIGIT_CONFUSION_COST if _char.isdigit() else LETTER_CONFUSION_COST
+# Digit assumed for each character before solving: itself or its first confusion
+BASE_DIGITS = np.zeros(128, dtype=np.int64)
+for _digit in range(10):
+    BASE_DIGITS[ord(str(_digit))] = _digit
+for _char, _digits in CONFUSIONS.items():
+    if not _char.isdigit():
+        BASE_DIGITS[ord(_char)] = int(_digits[0])
+# Account letters in the RIB key formula (official table)
+RIB_LETTER_VALUES = MappingProxyType({
+    **{char: index % 9 + 1 for index, char in enumerate("ABCDEFGHIJKLMNOPQR")},
+    **{char: index % 8 + 2 for index, char in enumerate("STUVWXYZ")},
+})
+
+# 89 * bank + 15 * branch + 3 * account + key == 0 (mod 97)
+RIB_WEIGHTS = np.array(
+    [0, 0]
+    + [89 * pow(10, 4 - k, 97) % 97 for k in range(5)]
+    + [15 * pow(10, 4 - k, 97) % 97 for k in range(5)]
+    + [3 * pow(10, 10 - k, 97) % 97 for k in range(11)]
+    + [10, 1],
+    dtype=np.int64,
+)
+
+
+class Correction(NamedTuple):
+    iban: str
+    cost: int
+    edits: tuple[str, ...]  # e.g. "C>0@21" (substitution), "+4@9" (insertion), "-7@12" (deletion)
+    check_computed: bool = False  # check digits computed, not read: only the RIB key was checked
+
+
+def _variants(window: str, start: int):
+    """
+    Body read as is, with one extra character dropped, or with one missing
+    character, from slot `start` on (2 when the check digits were not read).
+    """
+    size = BODY_SIZE - start
+    prefix = '00' if start else ''
+    if len(window) >= size:
+        yield 0, prefix + window[:size], None, ()
+    if len(window) >= size + 1:
+        chars = window[:size + 1]
+        for pos in range(size + 1):
+            yield INDEL_COST, prefix + chars[:pos] + chars[pos + 1:], None, (f"-{chars[pos]}@{start + pos + 2}",)
+    if len(window) >= size - 1:
+        chars = window[:size - 1]
+        for pos in range(size):
+            # Placeholder, its digit is solved from the checksums
+            yield INDEL_COST, prefix + chars[:pos] + '0' + chars[pos:], start + pos, ()
+
+
+def _letter_hypotheses(chars: str):
+    """Sets of account slots whose letters are kept as letters."""
+    letters = [k for k in ACCOUNT_SLOTS if chars[k].isalpha()]
+    fixed = frozenset(k for k in letters if chars[k] not in CONFUSIONS)
+    ambiguous = [k for k in letters if chars[k] in CONFUSIONS]
+    if len(ambiguous) > MAX_AMBIGUOUS_LETTERS:
+        yield fixed
+        yield fixed | frozenset(ambiguous)
+        return
+    for keep in product((False, True), repeat=len(ambiguous)):
+        yield fixed | frozenset(k for k, kept in zip(ambiguous, keep) if kept)
+
+
+def search_corrections(country: str, window: str, max_cost: int = DEFAULT_MAX_COST,
+                       deadline: Optional[float] = None, check_digits: bool = True,
+                       verified_only: bool = False) -> list[Correction]:
+    """
+    Repaired IBANs for a country code followed by the characters read after
+    it (`window`, alphanumeric, upper case), cheapest first. Without
+    `check_digits`, the window starts at the BBAN (RIB printed without its
+    IBAN) and the check digits are computed.
+
+    Letters are read as their confusable digit, or kept as letters in the
+    account number. One changed slot is solved from the IBAN equation
+    instead of enumerated, for all slots of a variant at once. With
+    `verified_only`, only letters read as their look-alike digit (checked
+    by the checksums, not solved from them) are returned. Stops early when
+    `deadline` (time.perf_counter) is reached.
+    """
+    if country not in CORRECTABLE_COUNTRIES or not window.isascii():
+        return []
+    # Rearranged IBAN: BBAN, country code (4 digits), check digits
+    iban_target = (1 - (CHAR_VALUES[country[0]] * 100 + CHAR_VALUES[country[1]]) * 100) % 97
+    results: dict[str, Correction] = {}
+
+    for base_cost, chars, inserted, indel_edits in _variants(window, 0 if check_digits else 2):
+        # The checksum picks where a character is missing or extra, it cannot confirm it;
+        # without check digits a missing one would be solved from the RIB key alone
+        if (base_cost and verified_only) or (inserted is not None and not check_digits):
+            continue
+        codes = np.frombuffer(chars.encode("ascii"), dtype=np.uint8) & 127
+        for kept in _letter_hypotheses(chars):
+            if deadline is not None and time.perf_counter() > deadline:
+                return _ranked(results)
+            _search_variant(country, chars, codes, inserted, kept, base_cost, indel_edits,
+                            iban_target, max_cost, results, not check_digits, verified_only)
+
+    return _ranked(results)
+
+
+def _ranked(results: dict) -> list[Correction]:
+    return sorted(results.values(), key=lambda correction: (correction.cost, len(correction.edits)))
+
+
+def _search_variant(country: str, chars: str, codes: np.ndarray, inserted: Optional[int], kept: frozenset,
+                    base_cost: int, indel_edits: tuple, iban_target: int, max_cost: int, results: dict,
+                    derive_check: bool, verified_only: bool):
+    """
+    Solve one read variant / letter hypothesis, adding the repairs within
+    budget to `results`. With `derive_check`, only the RIB key constrains
+    the BBAN (nothing is solved) and the check digits are computed afterwards.
+    """
+    base = BASE_DIGITS[codes]
+    change_costs = EDIT_COSTS[codes]
+    if inserted is not None:
+        change_costs[inserted] = 0
+    read_costs = change_costs[np.arange(BODY_SIZE), base]
+    # Kept letters are neither edits nor solvable
+    kept_slots = np.array(sorted(kept), dtype=np.int64)
+    read_costs[kept_slots] = 0
+    cost = base_cost + int(read_costs.sum())
+    # Any other character read for a digit would only be guessed from the checksums
+    if verified_only and int(read_costs.max()) > LETTER_CONFUSION_COST:
+        return
+    # Solving can at best cancel the most expensive read
+    if cost - (0 if verified_only or derive_check or indel_edits else int(read_costs.max())) > max_cost:
+        return
+
+    # Kept letters count as two digits in the IBAN
+    widths = np.ones(BODY_SIZE, dtype=np.int64)
+    widths[kept_slots] = 2
+    iban_values, rib_values = base.copy(), base.copy()
+    for k in kept:
+        iban_values[k] = CHAR_VALUES[chars[k]]
+        rib_values[k] = RIB_LETTER_VALUES[chars[k]]
+    exponents = np.empty(BODY_SIZE, dtype=np.int64)
+    exponents[:2] = (1, 0)
+    exponents[2:] = 6 + np.cumsum(widths[:1:-1])[::-1] - widths[2:]
+    iban_weights = POW10[exponents % 96].astype(np.int64)
+    residuals = np.array([(iban_target - iban_weights @ iban_values) % 97, -(RIB_WEIGHTS @ rib_values) % 97])
+    solvable = np.ones(BODY_SIZE, dtype=bool)
+    solvable[kept_slots] = False
+
+    solutions = []
+    checked = residuals[1:] if derive_check else residuals
+    if inserted is None and not checked.any() and cost <= max_cost:
+        solutions.append(((), (), cost))
+    # One slot solved from the IBAN equation (the RIB key then only checks the check
+    # digits): a read as is or a missing character, never on top of a dropped one
+    if not (derive_check or verified_only or (indel_edits and inserted is None)):
+        slots = np.flatnonzero(solvable) if inserted is None else np.array([inserted])
+        deltas = residuals[0] * INV_POW10[exponents[slots] % 96] % 97
+        ok = (RIB_WEIGHTS[slots] * deltas - residuals[1]) % 97 == 0
+        solutions += _accepted(slots, deltas, ok, base, read_costs, change_costs, cost, inserted, max_cost)
+
+    for solved, values, total in solutions:
+        body = [chars[k] if k in kept else str(digit) for k, digit in enumerate(base)]
+        edits = list(indel_edits)
+        for slot, value in zip(solved, values):
+            body[slot] = str(value)
+            edits.append(f"+{value}@{slot + 2}" if slot == inserted else f"{chars[slot]}>{value}@{slot + 2}")
+        edits += [f"{chars[k]}>{base[k]}@{k + 2}" for k in range(BODY_SIZE) if read_costs[k] and k not in solved]
+        if derive_check:
+            # Check digits making the whole IBAN mod-97 equal to 1 (02 to 98)
+            check = (iban_target - int(iban_weights[2:] @ iban_values[2:])) % 97
+            body[:2] = f"{check if check > 1 else check + 97:02d}"
+        iban = country + ''.join(body)
+        known = results.get(iban)
+        if known is None or total < known.cost:
+            results[iban] = Correction(iban, total, tuple(edits), derive_check)
+
+
+def _accepted(slots: np.ndarray, deltas: np.ndarray, ok: np.ndarray, base: np.ndarray, read_costs: np.ndarray,
+              change_costs: np.ndarray, cost: int, inserted: Optional[int], max_cost: int) -> list:
+    """Solved slot changes giving digits within the edit budget, as (slots, digits, cost)."""
+    value = (base[slots] + deltas) % 97
+    # A solved slot must change the digit, otherwise the read as is covers it
+    ok &= (value <= 9) & ((deltas != 0) | (slots == inserted))
+    value = np.minimum(value, 9)
+    total = cost + change_costs[slots, value] - read_costs[slots]
+    ok &= total <= max_cost
+    return [((int(slots[k]),), (int(value[k]),), int(total[k])) for k in np.flatnonzero(ok)]
+
+
+def best_correction(windows, max_cost: int = DEFAULT_MAX_COST, budget_ms: int = 50,
+                    verified_only: bool = True) -> Optional[Correction]:
+    """
+    Cheapest repair over candidate (country, window, check digits read)
+    tuples, tried in order within `budget_ms`. A window whose cheapest
+    repairs tie is ambiguous and skipped: the checksums cannot tell them
+    apart. Only verified repairs (letters) unless `verified_only` is False.
+    """
+    deadline = time.perf_counter() + budget_ms / 1000
+    for country, window, check_digits in windows:
+        if time.perf_counter() > deadline:
+            break
+        corrections = search_corrections(country, window, max_cost, deadline, check_digits, verified_only)
+        if corrections and (len(corrections) == 1 or corrections[1].cost > corrections[0].cost):
+            return corrections[0]
+    return None
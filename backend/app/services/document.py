@@ -0,0 +1,415 @@
+"""
+One uploaded document (PDF or image) going through the analysis pipeline.
+
+DocumentSource prepares pages on demand (text layer first, rendering
+otherwise) and stream_document drives the worker pool, yielding results
+in page order (in cascade mode, escalating the pages a light OCR profile
+did not read reliably). document_results stores them in the result cache,
+optionally stopping at the first fully valid page, and analyze_document
+replays that cache for uploaded bytes. merge_streams runs several documents
+at once (batch uploads), yielding results as they finish.
+"""
+import asyncio
+from typing import AsyncIterator, Iterable, Iterator, Optional, Union
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from app.core import config
+from app.services.cache import get_result_cache
+from app.services.executor import PipelineExecutor
+from app.services.metrics import REGISTRY, collect, observe_timings, timed, timings_ms
+from app.services.image import (
+    load_image_from_bytes, load_image_from_file, open_pdf, render_pdf_page, extract_pdf_page_text, close_pdf
+)
+from app.models.schemas import ValidationStatus
+from app.services.parser import parse_rib
+from app.services.pipeline import merge_timings, process_pages
+
+TEXT_LAYER_METHOD = "PDF Text Layer"
+# Text layer markers of a RIB page (probed first with mode=first_valid)
+RIB_PAGE_MARKERS = ("IDENTITE BANCAIRE", "IDENTITÉ BANCAIRE")
+
+
+def text_layer_result(text: str) -> Optional[dict]:
+    """
+    Parse the embedded text of a digital PDF page.
+    Only a checksum-valid IBAN is trusted, anything else goes through OCR.
+    """
+    if not text or not text.strip():
+        return None
+    result = parse_rib(text)
+    if not result.checksum_valid:
+        return None
+    result.extraction_method = f"{TEXT_LAYER_METHOD} ({result.extraction_method})"
+    return result.dict()
+
+
+class DocumentSource:
+    """
+    Pages of an uploaded file, given as a path (spooled upload) or bytes.
+    Blocking methods: call them from a thread.
+    """
+
+    def __init__(self, source: Union[str, bytes], is_pdf: bool):
+        self.is_pdf = is_pdf
+        self._pdf = None
+        self._image = None
+        # Text layers already read by probe_order, by page
+        self._texts: dict[int, str] = {}
+        if is_pdf:
+            with timed("pdf_open"):
+                self._pdf = open_pdf(source)
+            self.page_count = len(self._pdf) if self._pdf is not None else 0
+        else:
+            with timed("image_decode"):
+                self._image = load_image_from_file(source) if isinstance(source, str) else load_image_from_bytes(source)
+            self.page_count = 1 if self._image is not None else 0
+
+    def prepare(self, page_nums: list[int]) -> tuple[list[Optional[dict]], list[Optional[np.ndarray]], list[dict]]:
+        """
+        Prepare the pages `page_nums`.
+        Returns (text-layer results, images to OCR, stage timings): for each
+        page exactly one of the first two is set, unless the page could not
+        be rendered.
+        """
+        if not self.is_pdf:
+            image, self._image = self._image, None
+            return [None], [image], [{}]
+
+        roi_scale = config.ROI_SCALE if config.ROI_MODE == "text" else None
+        shortcuts, images, timings = [], [], []
+        for page_num in page_nums:
+            if self._pdf is None:
+                # Closed while this chunk was waiting (analysis stopped early)
+                shortcuts.append(None)
+                images.append(None)
+                timings.append({})
+                continue
+            with collect() as page_timings:
+                result = None
+                if config.TEXT_LAYER:
+                    try:
+                        text = self._texts.pop(page_num, None)
+                        if text is None:
+                            with timed("pdf_text_layer"):
+                                text = extract_pdf_page_text(self._pdf, page_num)
+                        result = text_layer_result(text)
+                    except Exception as e:
+                        print(f"Error reading text layer of page {page_num}: {e}")
+                image = None
+                if result is None:
+                    try:
+                        with timed("pdf_render"):
+                            image = render_pdf_page(self._pdf, page_num, config.RENDER_SCALE, roi_scale, config.RENDER_MAX_SIDE)
+                    except Exception as e:
+                        print(f"Error rendering PDF page {page_num}: {e}")
+            shortcuts.append(result)
+            images.append(image)
+            timings.append(page_timings)
+        return shortcuts, images, timings
+
+    def probe_order(self) -> list[int]:
+        """
+        Page order for mode=first_valid probing: pages whose text layer names
+        a RIB, the first and last pages, pages mentioning an IBAN, then the
+        others. The text layers read here are reused by prepare().
+        """
+        if not self.is_pdf or self.page_count <= 2:
+            return list(range(self.page_count))
+        marked, mentions = [], []
+        for page_num in range(self.page_count):
+            try:
+                with timed("pdf_text_layer"):
+                    text = extract_pdf_page_text(self._pdf, page_num)
+            except Exception as e:
+                print(f"Error reading text layer of page {page_num}: {e}")
+                continue
+            self._texts[page_num] = text
+            upper = text.upper()
+            if any(marker in upper for marker in RIB_PAGE_MARKERS):
+                marked.append(page_num)
+            elif "IBAN" in upper:
+                mentions.append(page_num)
+        order = marked + [0, self.page_count - 1] + mentions + list(range(self.page_count))
+        return list(dict.fromkeys(order))
+
+    def render(self, page_nums: list[int], scale: float) -> tuple[list[Optional[np.ndarray]], list[dict]]:
+        """Render PDF pages again at another scale (cascade escalation), with their timings."""
+        roi_scale = config.ROI_SCALE * scale / config.RENDER_SCALE if config.ROI_MODE == "text" else None
+        images, timings = [], []
+        for page_num in page_nums:
+            image = None
+            with collect() as page_timings:
+                try:
+                    with timed("pdf_render"):
+                        image = render_pdf_page(self._pdf, page_num, scale, roi_scale, config.RENDER_MAX_SIDE)
+                except Exception as e:
+                    print(f"Error rendering PDF page {page_num}: {e}")
+            images.append(image)
+            timings.append(page_timings)
+        return images, timings
+
+    def close(self):
+        if self._pdf is not None:
+            close_pdf(self._pdf)
+            self._pdf = None
+        self._image = None
+        self._texts.clear()
+
+
+def fully_valid(result: Optional[dict]) -> bool:
+    """
+    A valid IBAN whose French RIB key (if any) is valid too: trusted from a
+    light cascade tier, and ends a mode=first_valid analysis.
+    """
+    return (result is not None and result["status"] == ValidationStatus.VALID
+            and result["checksum_valid"] and result["rib_key_valid"] is not False)
+
+
+def cascade_rank(result: Optional[dict]) -> tuple:
+    if result is None:
+        return (False, False, False, 0.0)
+    return (fully_valid(result), result["status"] == ValidationStatus.VALID,
+            bool(result["data"].get("iban")), result["confidence_score"])
+
+
+def tag_tier(result: Optional[dict], tier: str):
+    if result is not None:
+        result["extraction_method"] = f"{tier} ({result['extraction_method']})"
+
+
+async def stream_document(source: DocumentSource, executor: PipelineExecutor, doc_hash: Optional[str] = None,
+                          profile: Optional[str] = None, order: Optional[list[int]] = None,
+                          batch_size: Optional[int] = None) -> AsyncIterator[tuple[int, Optional[dict]]]:
+    """
+    Analyze every page of `source` with the OCR `profile` and yield
+    (page_index, result) in page order (or in `order`, a permutation of the
+    page indexes), result being None for pages that failed.
+
+    Up to max_workers chunks of `batch_size` pages are in flight at once.
+    Chunks are prepared just before submission, so memory does not grow with
+    the page count, and chunks not started yet are cancelled when the caller
+    stops iterating.
+
+    In cascade mode (config.CASCADE_PROFILE), pages are first read with the
+    light profile and only those it does not read reliably go through
+    `profile`, rendered again at CASCADE_SCALE for PDFs. The tier that
+    produced each answer prefixes its extraction_method and is counted in
+    rib_cascade_pages_total.
+    """
+    profile = profile or config.OCR_PROFILE
+    cascade = config.cascade_profile(profile)
+    order = list(range(source.page_count)) if order is None else order
+    batch_size = executor.chunk_size(source.page_count, batch_size or config.OCR_BATCH_SIZE)
+    chunks = [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+    pending = {}
+
+    async def escalate(page_nums: list[int], images: list, results: list) -> list:
+        retry = [idx for idx, (image, result) in enumerate(zip(images, results))
+                 if image is not None and not fully_valid(result)]
+        for idx, result in enumerate(results):
+            if idx not in retry and result is not None:
+                tag_tier(result, f"OCR {cascade}")
+                REGISTRY.inc("rib_cascade_pages_total", tier=cascade, accepted="1")
+        if not retry:
+            return results
+
+        tier = f"OCR {profile}"
+        retry_pages = [page_nums[idx] for idx in retry]
+        render_timings = [{}] * len(retry)
+        if source.is_pdf and config.CASCADE_SCALE > config.RENDER_SCALE:
+            tier += f" x{config.CASCADE_SCALE:g}"
+            retry_images, render_timings = await run_in_threadpool(source.render, retry_pages, config.CASCADE_SCALE)
+        else:
+            retry_images = [images[idx] for idx in retry]
+        print(f"Cascade: {len(retry)}/{len(images)} pages escalated to {tier} "
+              f"(pages {', '.join(str(page_num + 1) for page_num in retry_pages)})")
+        retried = await executor.run(process_pages, retry_images, batch_size, doc_hash, retry_pages, profile)
+        for idx, result, extra_timings in zip(retry, retried, render_timings):
+            first = results[idx]
+            if first is not None:
+                REGISTRY.inc("rib_cascade_pages_total", tier=cascade, accepted="0")
+            if result is not None:
+                REGISTRY.inc("rib_cascade_pages_total", tier=profile, accepted=str(int(fully_valid(result))))
+            spent = merge_timings(first and first.get("timings"), extra_timings, result and result.get("timings"))
+            if cascade_rank(result) < cascade_rank(first):
+                # The heavy tier did worse: keep the light answer
+                result = first
+                tag_tier(result, f"OCR {cascade}")
+            else:
+                tag_tier(result, tier)
+            if result is not None:
+                result["timings"] = spent
+            results[idx] = result
+        return results
+
+    async def submit(page_nums: list[int]):
+        shortcuts, images, timings = await run_in_threadpool(source.prepare, page_nums)
+        ocr_results = [None] * len(images)
+        if any(image is not None for image in images):
+            ocr_results = await executor.run(process_pages, images, batch_size, doc_hash, page_nums,
+                                             cascade or profile)
+            if cascade:
+                ocr_results = await escalate(page_nums, images, ocr_results)
+        if cascade and any(shortcut is not None for shortcut in shortcuts):
+            REGISTRY.inc("rib_cascade_pages_total", sum(shortcut is not None for shortcut in shortcuts),
+                         tier="text_layer", accepted="1")
+        results = [shortcut or ocr for shortcut, ocr in zip(shortcuts, ocr_results)]
+        for result, page_timings in zip(results, timings):
+            if result is not None:
+                result["timings"] = merge_timings(page_timings, result.get("timings"))
+        return results
+
+    try:
+        for position, page_nums in enumerate(chunks):
+            for ahead in range(position, min(position + executor.max_workers, len(chunks))):
+                if ahead not in pending:
+                    pending[ahead] = asyncio.ensure_future(submit(chunks[ahead]))
+            try:
+                results = await pending.pop(position)
+            except Exception as e:
+                print(f"Error on pages {', '.join(str(page_num + 1) for page_num in page_nums)}: {e}")
+                results = [None] * len(page_nums)
+            for idx, result in zip(page_nums, results):
+                yield idx, result
+    finally:
+        for task in pending.values():
+            task.cancel()
+
+
+def is_supported(content_type: Optional[str]) -> bool:
+    return bool(content_type) and (content_type.startswith("image/") or content_type == "application/pdf")
+
+
+def first_valid_pages(pages: Iterable[dict]) -> Iterator[dict]:
+    """Pages up to (and including) the first fully valid one."""
+    for result in pages:
+        yield result
+        if fully_valid(result):
+            break
+
+
+async def document_results(source: DocumentSource, is_pdf: bool, executor: PipelineExecutor, doc_hash: str,
+                           include_timings: bool = False, profile: Optional[str] = None,
+                           first_valid: bool = False, probe: bool = False) -> AsyncIterator[dict]:
+    """
+    Page results of an opened document as they are produced, stored in the
+    result cache. Stage timings go to the metrics, and to each result
+    ("timings", milliseconds) with `include_timings`.
+
+    With `first_valid`, pages are analyzed one at a time and the analysis
+    stops (cancelling the pages not started yet) after the first fully valid
+    result. `probe` then analyzes the likely RIB pages first
+    (DocumentSource.probe_order). The pages up to that result are cached for
+    later first_valid requests when none before it was skipped.
+    """
+    cache = get_result_cache()
+    complete = True
+    order = await run_in_threadpool(source.probe_order) if first_valid and probe else None
+    # One page per chunk: no OCR spent on the pages after the RIB
+    batch_size = 1 if first_valid else None
+    produced = 0
+    analyzed = set()
+    stop_page = None
+    results = stream_document(source, executor, doc_hash, profile, order, batch_size)
+    try:
+        async for idx, result in results:
+            produced += 1
+            if result is None:
+                # We can yield an error object or just skip
+                complete = False
+                REGISTRY.inc("rib_pages_total", outcome="failed")
+                continue
+            timings = result.pop("timings", None)
+            observe_timings(timings)
+            REGISTRY.inc("rib_pages_total", outcome=getattr(result["status"], "value", result["status"]))
+            if is_pdf:
+                result["page_number"] = idx + 1
+            cache.set_page(doc_hash, idx, result, profile)
+            analyzed.add(idx)
+            stop = first_valid and fully_valid(result)
+            if stop:
+                stop_page = idx
+            if include_timings:
+                result = {**result, "timings": timings_ms(timings or {})}
+            yield result
+            if stop:
+                break
+    finally:
+        await results.aclose()
+
+    if stop_page is not None and analyzed.issuperset(range(stop_page)):
+        # Every page before the RIB is stored: later first_valid requests replay them
+        cache.set_page_count(doc_hash, stop_page + 1, profile, first_valid=True)
+    if produced < source.page_count:
+        REGISTRY.inc("rib_pages_total", source.page_count - produced, outcome="skipped")
+    elif complete:
+        cache.set_page_count(doc_hash, source.page_count, profile)
+
+
+async def analyze_document(path: str, is_pdf: bool, executor: PipelineExecutor, doc_hash: str,
+                           include_timings: bool = False, profile: Optional[str] = None,
+                           first_valid: bool = False, probe: bool = False) -> AsyncIterator[dict]:
+    """
+    Page results of an uploaded file (path and SHA-256 of its contents),
+    replayed from the result cache when the same bytes were already
+    analyzed. Raises ValueError for a file without pages.
+    `first_valid` and `probe` as for document_results.
+    """
+    cached_pages = get_result_cache().get_document(doc_hash, profile, first_valid)
+    if cached_pages is not None:
+        if first_valid:
+            cached_pages = list(first_valid_pages(cached_pages))
+        REGISTRY.inc("rib_pages_total", len(cached_pages), outcome="cached")
+        for result in cached_pages:
+            yield result
+        return
+
+    source = await run_in_threadpool(DocumentSource, path, is_pdf)
+    try:
+        if not source.page_count:
+            raise ValueError("Invalid file content or empty PDF")
+        async for result in document_results(source, is_pdf, executor, doc_hash, include_timings, profile,
+                                             first_valid, probe):
+            yield result
+    finally:
+        source.close()
+
+
+async def merge_streams(streams: Iterable[AsyncIterator], limit: int) -> AsyncIterator:
+    """
+    Consume up to `limit` async iterators at once (next one started when
+    one is exhausted) and yield their items as they arrive.
+    The iterators must handle their own errors.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    finished = object()
+    pending = iter(streams)
+    tasks = set()
+
+    async def drain(stream: AsyncIterator):
+        try:
+            async for item in stream:
+                await queue.put(item)
+        finally:
+            await stream.aclose()
+            queue.put_nowait(finished)
+
+    def start_next() -> bool:
+        stream = next(pending, None)
+        if stream is None:
+            return False
+        tasks.add(asyncio.ensure_future(drain(stream)))
+        return True
+
+    running = sum(start_next() for _ in range(max(1, limit)))
+    try:
+        while running:
+            item = await queue.get()
+            if item is finished:
+                running -= 1
+                running += start_next()
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,133 @@
+"""
+Bounded worker pool keeping OCR and parsing off the uvicorn event loop.
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from app.core import config
+
+
+def _init_process_worker(torch_threads: int, load_lock):
+    """
+    Initializer of each process of the worker farm.
+    Pins the torch thread count and loads the OCR model up front, one
+    worker at a time so only the first one downloads the weights.
+    """
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+    from app.services.ocr import OCRService
+    with load_lock:
+        print(f"Worker {os.getpid()}: loading OCR model ({torch_threads} torch threads)")
+        OCRService()
+
+
+def torch_threads_per_worker(max_workers: int) -> int:
+    """Torch threads for each worker process so the farm uses every core once."""
+    if config.TORCH_THREADS > 0:
+        return config.TORCH_THREADS
+    return max(1, (os.cpu_count() or 1) // max_workers)
+
+
+class ExecutorSaturated(Exception):
+    """Raised when every worker is busy and the waiting queue is full."""
+
+
+class PipelineExecutor:
+    """
+    Thread or process pool with admission control.
+
+    In "process" mode the pool is a worker farm: each of the `max_workers`
+    processes owns its own OCR model, so pages of one document can be
+    recognized on several cores at once.
+
+    At most `max_workers` requests are processed at the same time and
+    `max_queue` more may wait for a worker. Beyond that, `acquire` fails
+    so the API can answer 503 instead of piling up work.
+    """
+
+    def __init__(self, mode: str = "thread", max_workers: int = 1, max_queue: int = 8):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown executor mode: {mode}")
+        self.mode = mode
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool: Executor | None = None
+        self._active = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> Executor:
+        with self._lock:
+            if self._pool is None:
+                if self.mode == "process":
+                    # spawn: forking a process that already imported torch is unsafe
+                    context = multiprocessing.get_context("spawn")
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=context,
+                        initializer=_init_process_worker,
+                        initargs=(torch_threads_per_worker(self.max_workers), context.Lock()),
+                    )
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rib-worker")
+            return self._pool
+
+    def chunk_size(self, page_count: int, batch_size: int) -> int:
+        """
+        Pages per task for a document: a full OCR batch, but small enough
+        that every worker of the farm gets a share of the document.
+        """
+        if self.mode != "process":
+            return batch_size
+        per_worker = -(-page_count // self.max_workers)
+        return max(1, min(batch_size, per_worker))
+
+    def acquire(self):
+        """Reserve a slot for one request, or raise ExecutorSaturated."""
+        with self._lock:
+            if self._active >= self.max_workers + self.max_queue:
+                raise ExecutorSaturated(f"{self._active} requests already in progress")
+            self._active += 1
+
+    def release(self):
+        with self._lock:
+            self._active = max(0, self._active - 1)
+
+    async def run(self, fn, *args):
+        """Run a blocking function in the pool and await its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, functools.partial(fn, *args))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "torch_threads": torch_threads_per_worker(self.max_workers) if self.mode == "process" else None,
+                "active_requests": self._active,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+_executor: PipelineExecutor | None = None
+
+
+def get_executor() -> PipelineExecutor:
+    """Shared executor configured from app.core.config."""
+    global _executor
+    if _executor is None:
+        _executor = PipelineExecutor(config.EXECUTOR_MODE, config.MAX_WORKERS, config.MAX_QUEUE)
+    return _executor
@@ -1,47 +1,206 @@
+import mmap
+import os
+import threading
+from typing import Optional, Union
 import cv2
 import numpy as np
 import pypdfium2 as pdfium
+from app.core import config
+from app.services.metrics import timed
+
+def to_rgb(image: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    """BGR image decoded by OpenCV -> RGB, in place (no new buffer)"""
+    if image is not None:
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+    return image
 
 def load_image_from_bytes(file_bytes: bytes) -> np.ndarray:
-    """Convert bytes trigger to OpenCV Image format"""
+    """Decode image bytes to an RGB array (the channel order DocTR expects)"""
     nparr = np.frombuffer(file_bytes, np.uint8)
     img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    return img
+    return to_rgb(img)
+
+def load_image_from_file(path: str) -> Optional[np.ndarray]:
+    """
+    Decode an image file to an RGB array through a memory map (the encoded
+    bytes are not read into memory)
+    """
+    if not os.path.getsize(path):
+        return None
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        encoded = np.frombuffer(mapped, dtype=np.uint8)
+        image = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+        # The map cannot be closed while the array exports it
+        del encoded
+    return to_rgb(image)
 
-def load_pdf_pages_from_bytes(file_bytes: bytes) -> list[np.ndarray]:
-    """Convert ALL pages of a PDF bytes to a list of OpenCV Image format"""
+# PDFium is not thread-safe: every call into it must hold this lock
+PDFIUM_LOCK = threading.Lock()
+
+def open_pdf(source: Union[str, bytes]) -> Optional[pdfium.PdfDocument]:
+    """
+    Open a PDF (file path or bytes) without rendering anything, None if the
+    file is invalid. From a path, PDFium reads the file on demand.
+    """
     try:
-        pdf = pdfium.PdfDocument(file_bytes)
-        if len(pdf) == 0:
-            return []
-        
-        cv_images = []
-        for page_num in range(len(pdf)):
-            page = pdf[page_num]
-            # Render at 2x scale for better OCR quality
-            bitmap = page.render(scale=2.0)
-            pil_image = bitmap.to_pil()
-            # Convert RGB (PIL) to BGR (OpenCV)
-            cv_img = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-            cv_images.append(cv_img)
-            
-        return cv_images
+        with PDFIUM_LOCK:
+            return pdfium.PdfDocument(source)
     except Exception as e:
-        print(f"Error converting PDF: {e}")
-        return []
-
-def preprocess_image(image: np.ndarray) -> np.ndarray:
-    """
-    Basic preprocessing pipeline for OCR:
-    1. Grayscale
-    2. Noise reduction
-    3. Thresholding (optional, DocTR handles RBG well but cleaner is better)
-    """
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    
-    # Denoising
-    denoised = cv2.fastNlMeansDenoising(gray, None, 10, 7, 21)
-    
-    # Optional: deskewing could be added here if DocTR struggles directly
-    
-    return image # DocTR actually works well on RGB, we return original for now or slightly enhanced
+        print(f"Error opening PDF: {e}")
+        return None
+
+# Labels marking the RIB block in a PDF text layer
+ROI_LABELS = ("IBAN", "BIC", "TITULAIRE", "DOMICILIATION", "GUICHET")
+# Vertical margin kept around the labels, as a fraction of the page height
+ROI_MARGIN = 0.08
+# Above this fraction of the page height, cropping is not worth it
+ROI_MAX_FRACTION = 0.7
+
+def adaptive_scale(width: float, height: float, scale: float, max_side: int) -> float:
+    """Lower the render scale of oversized pages so the bitmap stays under max_side pixels"""
+    longest = max(width, height)
+    if max_side and longest * scale > max_side:
+        return max_side / longest
+    return scale
+
+def find_rib_region(page: pdfium.PdfPage) -> Optional[tuple[float, float]]:
+    """
+    Locate the RIB block (IBAN/BIC/owner labels) using the PDF text layer.
+    Returns a (bottom, top) band in PDF points, or None if the page has no
+    usable text layer or the labels are spread over most of the page.
+    Must be called with PDFIUM_LOCK held.
+    """
+    height = page.get_height()
+    textpage = page.get_textpage()
+    try:
+        bottom, top = None, None
+        for label in ROI_LABELS:
+            # Whole words only: "BIC" must not match inside "bicyclette" or "Arabica"
+            searcher = textpage.search(label, match_case=False, match_whole_word=True)
+            try:
+                occurrence = searcher.get_next()
+                while occurrence:
+                    index, count = occurrence
+                    for char_index in (index, index + count - 1):
+                        _, char_bottom, _, char_top = textpage.get_charbox(char_index)
+                        bottom = char_bottom if bottom is None else min(bottom, char_bottom)
+                        top = char_top if top is None else max(top, char_top)
+                    occurrence = searcher.get_next()
+            finally:
+                searcher.close()
+    finally:
+        textpage.close()
+
+    if bottom is None:
+        return None
+    margin = ROI_MARGIN * height
+    bottom, top = max(0.0, bottom - margin), min(height, top + margin)
+    if top - bottom > ROI_MAX_FRACTION * height:
+        return None
+    return bottom, top
+
+def render_pdf_page(pdf: pdfium.PdfDocument, page_num: int, scale: float = 2.0,
+                    roi_scale: Optional[float] = None, max_side: int = 0) -> np.ndarray:
+    """
+    Render a single PDF page to an RGB array (the channel order DocTR expects).
+    The array is a view of the PDFium bitmap buffer: no PIL image, copy or
+    colour conversion per page.
+
+    With `roi_scale`, only the horizontal band holding the RIB labels (found
+    through the text layer) is rendered, at that higher scale. Pages without
+    a text layer fall back to the full page at `scale`.
+    """
+    with PDFIUM_LOCK:
+        page = pdf[page_num]
+        try:
+            width, height = page.get_size()
+            region = find_rib_region(page) if roi_scale else None
+            if region is not None:
+                bottom, top = region
+                render_scale = adaptive_scale(width, top - bottom, roi_scale, max_side)
+                # crop: amount removed from (left, bottom, right, top)
+                bitmap = page.render(scale=render_scale, crop=(0, bottom, 0, height - top), rev_byteorder=True)
+            else:
+                # Render at 2x scale for better OCR quality
+                # rev_byteorder: PDFium writes RGB instead of its native BGR
+                bitmap = page.render(scale=adaptive_scale(width, height, scale, max_side), rev_byteorder=True)
+            # The buffer is allocated by pypdfium2 (ctypes) and stays alive with
+            # the array after the PDFium bitmap handle is closed
+            image = bitmap.to_numpy()
+            bitmap.close()
+        finally:
+            page.close()
+    return image
+
+def extract_pdf_page_text(pdf: pdfium.PdfDocument, page_num: int) -> str:
+    """Text of the PDF text layer of a page (empty for scanned pages)"""
+    with PDFIUM_LOCK:
+        page = pdf[page_num]
+        try:
+            textpage = page.get_textpage()
+            try:
+                return textpage.get_text_range()
+            finally:
+                textpage.close()
+        finally:
+            page.close()
+
+def close_pdf(pdf: pdfium.PdfDocument):
+    with PDFIUM_LOCK:
+        pdf.close()
+
+def downscale(image: np.ndarray, max_side: int = 2500) -> np.ndarray:
+    """Shrink pages larger than max_side pixels (DocTR gains nothing from them)"""
+    height, width = image.shape[:2]
+    longest = max(height, width)
+    if longest <= max_side:
+        return image
+    ratio = max_side / longest
+    return cv2.resize(image, (int(width * ratio), int(height * ratio)), interpolation=cv2.INTER_AREA)
+
+def deskew(image: np.ndarray, min_angle: float = 0.3, max_angle: float = 15.0) -> np.ndarray:
+    """Rotate a slightly tilted scan back to horizontal"""
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    # Dark pixels (text) on a light background
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    coords = cv2.findNonZero(mask)
+    if coords is None:
+        return image
+    # The minAreaRect angle convention differs between OpenCV versions:
+    # fold it into (-45, 45] to get the smallest correcting rotation
+    angle = ((cv2.minAreaRect(coords)[-1] + 45) % 90) - 45
+    if abs(angle) < min_angle or abs(angle) > max_angle:
+        return image
+    height, width = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(image, matrix, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+def denoise(image: np.ndarray) -> np.ndarray:
+    """Cheap salt-and-pepper noise removal for scans"""
+    return cv2.medianBlur(image, 3)
+
+# Preprocessing presets: stages applied in order
+PREPROCESS_PRESETS = {
+    "none": (),
+    "fast": (downscale,),
+    "quality": (downscale, deskew, denoise),
+}
+
+def preprocess_image(image: np.ndarray, preset: Optional[str] = None) -> np.ndarray:
+    """
+    Preprocessing pipeline for OCR, as a preset of stages:
+    - none: the image as is (DocTR works well on clean RGB renders)
+    - fast: downscale oversized pages
+    - quality: downscale, deskew and median denoise (scans, photos)
+
+    Each stage is timed as "preprocess_<stage>" (e.g. preprocess_deskew).
+    """
+    if preset is None:
+        preset = config.PREPROCESS_PRESET
+    stages = PREPROCESS_PRESETS.get(preset)
+    if stages is None:
+        raise ValueError(f"Unknown preprocessing preset: {preset}")
+    for stage in stages:
+        with timed(f"preprocess_{stage.__name__}"):
+            image = stage(image)
+    return image
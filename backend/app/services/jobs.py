@@ -0,0 +1,333 @@
+"""
+Background analysis jobs for large imports.
+
+A job is a set of uploaded files queued in SQLite with a priority (the
+files themselves are kept next to the database until analyzed).
+JobWorkers drain the queue file by file (highest priority, then oldest job
+first) through the shared worker pool and append one NDJSON-ready line per
+page to the job results, so progress can be polled or followed. Files
+interrupted by a restart are queued again when the workers start.
+"""
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from app.core import config
+from app.services.document import analyze_document, is_supported
+from app.services.executor import PipelineExecutor, get_executor
+from app.services.upload import SpooledUpload
+
+# File states: queued -> running -> done | error | cancelled
+FILE_STATES = ("queued", "running", "done", "error", "cancelled")
+# Seconds between queue polls of an idle worker (a submission wakes it up)
+POLL_SECONDS = 2.0
+
+
+class JobStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.files_dir = db_path + ".files"
+        os.makedirs(self.files_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Job status: "uploading" until all files are stored, then "active" or "cancelled"
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, created REAL NOT NULL, priority INTEGER NOT NULL, status TEXT NOT NULL)"
+        )
+        # Spooled uploads are deleted once the file is finished
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_files ("
+            "job_id TEXT NOT NULL, position INTEGER NOT NULL, file_name TEXT, content_type TEXT, "
+            "path TEXT NOT NULL, doc_hash TEXT NOT NULL, status TEXT NOT NULL, error TEXT, "
+            "PRIMARY KEY (job_id, position))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS job_files_status ON job_files (status)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_results ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, position INTEGER NOT NULL, line TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS job_results_job ON job_results (job_id, seq)")
+        self._db.commit()
+
+    # --- Submission ---
+
+    def create(self, priority: int = 0) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute("INSERT INTO jobs (id, created, priority, status) VALUES (?, ?, ?, 'uploading')",
+                             (job_id, time.time(), priority))
+            self._db.commit()
+        os.makedirs(self.job_dir(job_id), exist_ok=True)
+        return job_id
+
+    def job_dir(self, job_id: str) -> str:
+        """Directory receiving the spooled uploads of a job."""
+        return os.path.join(self.files_dir, job_id)
+
+    def add_file(self, job_id: str, position: int, upload: SpooledUpload):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO job_files (job_id, position, file_name, content_type, path, doc_hash, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, 'queued')",
+                (job_id, position, upload.filename, upload.content_type, upload.path, upload.sha256),
+            )
+            self._db.commit()
+
+    def activate(self, job_id: str, priority: Optional[int] = None):
+        """Make an uploaded job visible to the workers (with its priority, if only known now)."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'active', priority = COALESCE(?, priority) WHERE id = ? AND status = 'uploading'",
+                (priority, job_id),
+            )
+            self._db.commit()
+
+    # --- Workers ---
+
+    def recover(self) -> int:
+        """
+        Startup: queue again the files left running by a stopped server
+        (dropping their partial results) and remove unfinished uploads.
+        Running files of cancelled jobs are marked cancelled instead (their
+        partial results kept, as when cancelled during a run).
+        """
+        with self._lock:
+            cancelled = self._db.execute(
+                "SELECT f.job_id, f.position, f.path FROM job_files f JOIN jobs j ON j.id = f.job_id "
+                "WHERE f.status = 'running' AND j.status = 'cancelled'"
+            ).fetchall()
+            self._db.executemany("UPDATE job_files SET status = 'cancelled' WHERE job_id = ? AND position = ?",
+                                 [row[:2] for row in cancelled])
+            self._db.execute(
+                "DELETE FROM job_results WHERE EXISTS (SELECT 1 FROM job_files f WHERE f.status = 'running' "
+                "AND f.job_id = job_results.job_id AND f.position = job_results.position)"
+            )
+            requeued = self._db.execute("UPDATE job_files SET status = 'queued' WHERE status = 'running'").rowcount
+            uploads = [row[0] for row in self._db.execute("SELECT id FROM jobs WHERE status = 'uploading'")]
+            for job_id in uploads:
+                self._delete(job_id)
+            self._db.commit()
+        for _, _, path in cancelled:
+            _remove(path)
+        return requeued
+
+    def claim(self) -> Optional[tuple]:
+        """Next queued file (job_id, position, file_name, content_type, path, doc_hash), marked running."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT f.job_id, f.position, f.file_name, f.content_type, f.path, f.doc_hash FROM job_files f "
+                "JOIN jobs j ON j.id = f.job_id WHERE f.status = 'queued' AND j.status = 'active' "
+                "ORDER BY j.priority DESC, j.created, f.position LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE job_files SET status = 'running' WHERE job_id = ? AND position = ?", row[:2])
+            self._db.commit()
+        return row
+
+    def add_result(self, job_id: str, position: int, line: dict):
+        with self._lock:
+            # A deleted job gets no more lines
+            self._db.execute(
+                "INSERT INTO job_results (job_id, position, line) SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM jobs WHERE id = ?)",
+                (job_id, position, json.dumps(line), job_id),
+            )
+            self._db.commit()
+
+    def finish_file(self, job_id: str, position: int, path: str, status: str, error: Optional[str] = None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE job_files SET status = ?, error = ? WHERE job_id = ? AND position = ?",
+                (status, error, job_id, position),
+            )
+            self._db.commit()
+        _remove(path)
+
+    def is_cancelled(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is None or row[0] == "cancelled"
+
+    # --- Client side ---
+
+    def cancel(self, job_id: str) -> bool:
+        """Stop a job: queued files are skipped, running ones stop after their current page."""
+        with self._lock:
+            updated = self._db.execute("UPDATE jobs SET status = 'cancelled' WHERE id = ?", (job_id,)).rowcount
+            skipped = [row[0] for row in self._db.execute(
+                "SELECT path FROM job_files WHERE job_id = ? AND status = 'queued'", (job_id,)
+            )]
+            self._db.execute("UPDATE job_files SET status = 'cancelled' WHERE job_id = ? AND status = 'queued'",
+                             (job_id,))
+            self._db.commit()
+        for path in skipped:
+            _remove(path)
+        return bool(updated)
+
+    def delete(self, job_id: str) -> bool:
+        with self._lock:
+            deleted = self._delete(job_id)
+            self._db.commit()
+        return deleted
+
+    def _delete(self, job_id: str) -> bool:
+        shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        self._db.execute("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+        self._db.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+        return bool(self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,)).rowcount)
+
+    def summary(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._db.execute("SELECT created, priority, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM job_files WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+            results = self._db.execute("SELECT COUNT(*) FROM job_results WHERE job_id = ?", (job_id,)).fetchone()[0]
+        created, priority, status = job
+        progress = {state: counts.get(state, 0) for state in FILE_STATES}
+        if status == "active":
+            if not progress["queued"] and not progress["running"]:
+                status = "done"
+            elif progress["queued"] == sum(progress.values()):
+                status = "queued"
+            else:
+                status = "running"
+        return {"id": job_id, "status": status, "priority": priority, "created": created,
+                "files": sum(progress.values()), "progress": progress, "results": results}
+
+    def file_counts(self) -> dict:
+        """Files of all jobs by status."""
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM job_files GROUP BY status").fetchall())
+        return {state: counts.get(state, 0) for state in FILE_STATES}
+
+    def recent(self, limit: int = 100) -> list[dict]:
+        with self._lock:
+            ids = [row[0] for row in self._db.execute(
+                "SELECT id FROM jobs WHERE status != 'uploading' ORDER BY created DESC LIMIT ?", (limit,)
+            )]
+        return [summary for summary in map(self.summary, ids) if summary is not None]
+
+    def results(self, job_id: str, offset: int = 0, limit: int = 1000) -> list[str]:
+        """Result lines (JSON) of a job in the order they were produced, from `offset`."""
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT line FROM job_results WHERE job_id = ? ORDER BY seq LIMIT ? OFFSET ?",
+                (job_id, limit, offset),
+            )]
+
+
+def _remove(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class JobWorkers:
+    """
+    Asyncio tasks draining the job queue, each running one document at a
+    time through the worker pool. Background work is not subject to the
+    upload admission limit (RIB_MAX_QUEUE).
+    """
+
+    def __init__(self, store: JobStore, executor: PipelineExecutor, count: int):
+        self.store = store
+        self.executor = executor
+        self.count = count
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def start(self):
+        requeued = await run_in_threadpool(self.store.recover)
+        if requeued:
+            print(f"Jobs: {requeued} interrupted file(s) queued again")
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.count)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """New files were queued."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                claimed = await run_in_threadpool(self.store.claim)
+                if claimed is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._process(*claimed)
+            except Exception as e:
+                # e.g. SQLite "database is locked": the worker stays alive, a file
+                # left running is queued again by recover() at the next start
+                print(f"Jobs: worker error: {e}")
+                await asyncio.sleep(POLL_SECONDS)
+
+    async def _process(self, job_id: str, position: int, file_name: Optional[str], content_type: Optional[str],
+                       path: str, doc_hash: str):
+        tag = {"file_id": str(position), "file_name": file_name}
+        status, error = "done", None
+        results = None
+        try:
+            if not is_supported(content_type):
+                raise ValueError("File must be an image or PDF")
+            results = analyze_document(path, content_type == "application/pdf", self.executor, doc_hash,
+                                       profile=config.JOB_OCR_PROFILE)
+            async for result in results:
+                await run_in_threadpool(self.store.add_result, job_id, position, {**result, **tag})
+                if await run_in_threadpool(self.store.is_cancelled, job_id):
+                    status = "cancelled"
+                    break
+        except Exception as e:
+            print(f"Job {job_id}: error analyzing {file_name}: {e}")
+            status, error = "error", str(e)
+            try:
+                await run_in_threadpool(self.store.add_result, job_id, position, {**tag, "error": error})
+            except Exception as store_error:
+                print(f"Job {job_id}: could not store the error of {file_name}: {store_error}")
+        finally:
+            if results is not None:
+                # Stops the pages still in flight when cancelled
+                await results.aclose()
+        await run_in_threadpool(self.store.finish_file, job_id, position, path, status, error)
+
+
+_store: JobStore | None = None
+_workers: JobWorkers | None = None
+
+
+def get_job_store() -> Optional[JobStore]:
+    """Shared store, or None when RIB_JOBS_DB is not set."""
+    global _store
+    if _store is None and config.JOBS_DB_PATH:
+        _store = JobStore(config.JOBS_DB_PATH)
+    return _store
+
+
+def get_job_workers() -> Optional[JobWorkers]:
+    global _workers
+    store = get_job_store()
+    if _workers is None and store is not None:
+        _workers = JobWorkers(store, get_executor(), config.JOB_WORKERS)
+    return _workers
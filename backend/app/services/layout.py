@@ -0,0 +1,166 @@
+"""
+Structured OCR result of one page.
+
+DocTR returns words with a bounding box and a recognition confidence.
+OcrPage keeps them in flat arrays (one row per word, in reading order)
+next to the page text, so the parser can look for values spatially next
+to their labels and weigh its score by what the OCR was sure of.
+"""
+import io
+import unicodedata
+from typing import Optional
+import numpy as np
+
+
+def normalize_word(word: str) -> str:
+    """Upper case, accents and punctuation removed ("Clé:" -> "CLE")."""
+    decomposed = unicodedata.normalize("NFKD", word.upper())
+    return ''.join(c for c in decomposed if c.isalnum() and c.isascii())
+
+
+class OcrPage:
+    """
+    Words of a page with boxes (x0, y0, x1, y1, relative to the page size),
+    confidences and DocTR line index. Pages built from plain text (PDF text
+    layer, old stored texts) have no geometry.
+    """
+    __slots__ = ("text", "words", "boxes", "confidences", "lines", "_normalized")
+
+    def __init__(self, words: list[str], boxes: Optional[np.ndarray] = None,
+                 confidences: Optional[np.ndarray] = None, lines: Optional[np.ndarray] = None,
+                 text: Optional[str] = None):
+        self.words = tuple(words)
+        self.boxes = None if boxes is None else np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.confidences = None if confidences is None else np.asarray(confidences, dtype=np.float32)
+        self.lines = np.zeros(len(self.words), dtype=np.int32) if lines is None else np.asarray(lines, dtype=np.int32)
+        self.text = text if text is not None else self._join_lines()
+        self._normalized = None
+
+    def _join_lines(self) -> str:
+        """Same layout as the historical OCR text: words + space, newline per line."""
+        if not self.words:
+            return ""
+        parts = []
+        previous = self.lines[0]
+        for word, line in zip(self.words, self.lines):
+            if line != previous:
+                parts.append("\n" * int(line - previous))
+                previous = line
+            parts.append(word + " ")
+        parts.append("\n")
+        return ''.join(parts)
+
+    @classmethod
+    def from_doctr(cls, page) -> "OcrPage":
+        words, boxes, confidences, lines = [], [], [], []
+        line_index = 0
+        for block in page.blocks:
+            for line in block.lines:
+                for word in line.words:
+                    (x0, y0), (x1, y1) = word.geometry
+                    words.append(word.value)
+                    boxes.append((x0, y0, x1, y1))
+                    confidences.append(word.confidence)
+                    lines.append(line_index)
+                line_index += 1
+        text = ''.join(''.join(word.value + " " for word in line.words) + "\n"
+                       for block in page.blocks for line in block.lines)
+        return cls(words, np.array(boxes, dtype=np.float32), np.array(confidences, dtype=np.float32),
+                   np.array(lines, dtype=np.int32), text)
+
+    @classmethod
+    def from_text(cls, text: str) -> "OcrPage":
+        words, lines = [], []
+        for index, line in enumerate(text.split("\n")):
+            for word in line.split():
+                words.append(word)
+                lines.append(index)
+        return cls(words, lines=np.array(lines, dtype=np.int32), text=text)
+
+    @property
+    def has_geometry(self) -> bool:
+        return self.boxes is not None and len(self.words) > 0
+
+    @property
+    def normalized(self) -> tuple[str, ...]:
+        if self._normalized is None:
+            self._normalized = tuple(normalize_word(word) for word in self.words)
+        return self._normalized
+
+    # --- Serialization (OCR text store) ---
+
+    def layout_bytes(self) -> Optional[bytes]:
+        """Words, boxes, confidences and lines as a compressed npz, None without geometry."""
+        if not self.has_geometry:
+            return None
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, words=np.array(self.words, dtype=str), boxes=self.boxes,
+                            confidences=self.confidences, lines=self.lines)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_stored(cls, text: str, layout: Optional[bytes]) -> "OcrPage":
+        if not layout:
+            return cls.from_text(text)
+        with np.load(io.BytesIO(layout), allow_pickle=False) as data:
+            return cls(data["words"].tolist(), data["boxes"], data["confidences"], data["lines"], text)
+
+    # --- Spatial queries (pages with geometry only) ---
+
+    def find(self, *labels: str) -> list[int]:
+        """Indices of the words whose normalized form is one of `labels`."""
+        return [idx for idx, word in enumerate(self.normalized) if word in labels]
+
+    def _center_y(self, idx) -> np.ndarray:
+        return (self.boxes[idx, 1] + self.boxes[idx, 3]) / 2
+
+    def same_row(self, idx: int) -> np.ndarray:
+        """Words vertically aligned with word `idx` (any DocTR line), left to right."""
+        height = self.boxes[idx, 3] - self.boxes[idx, 1]
+        centers = self._center_y(slice(None))
+        row = np.flatnonzero(np.abs(centers - centers[idx]) <= height / 2)
+        return row[np.argsort(self.boxes[row, 0])]
+
+    def right_of(self, idx: int, max_gap: float = 0.25) -> np.ndarray:
+        """Words on the row of `idx` starting after it, up to the first gap wider than `max_gap`."""
+        row = [k for k in self.same_row(idx) if self.boxes[k, 0] >= self.boxes[idx, 2] - 1e-3]
+        kept, edge = [], self.boxes[idx, 2]
+        for k in row:
+            if self.boxes[k, 0] - edge > max_gap:
+                break
+            kept.append(k)
+            edge = self.boxes[k, 2]
+        return np.array(kept, dtype=np.int64)
+
+    def row_below(self, idx: int, max_distance: float = 3.0) -> np.ndarray:
+        """
+        Nearest row under word `idx` (within `max_distance` word heights),
+        left to right.
+        """
+        height = self.boxes[idx, 3] - self.boxes[idx, 1]
+        centers = self._center_y(slice(None))
+        gaps = centers - centers[idx]
+        below = np.flatnonzero((gaps > height / 2) & (gaps <= max_distance * height))
+        if not len(below):
+            return below
+        return self.same_row(below[np.argmin(gaps[below])])
+
+    def span_confidence(self, value: str) -> Optional[float]:
+        """
+        Lowest recognition confidence among the words spelling `value`
+        (spaces and punctuation ignored), None if not found.
+        """
+        if self.confidences is None or not value:
+            return None
+        owners = []
+        for idx, word in enumerate(self.normalized):
+            owners.extend([idx] * len(word))
+        start = ''.join(self.normalized).find(value)
+        if start < 0:
+            return None
+        return float(self.confidences[sorted(set(owners[start:start + len(value)]))].min())
+
+    def mean_confidence(self) -> Optional[float]:
+        if self.confidences is None or not len(self.confidences):
+            return None
+        return float(self.confidences.mean())
@@ -0,0 +1,158 @@
+"""
+Stage latency histograms and counters, exposed at /metrics in the
+Prometheus text format.
+
+Code times a stage with `timed(stage)` (or `StageLaps` for consecutive
+stages of one function). Inside `collect()`, durations go to a per-page
+dict instead of the histograms: the pipeline returns it with the page
+result, so stages run in a worker process are observed in the serving
+process (`observe_timings`) and can be sent back to the client.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+# Histogram upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        for idx, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[idx] += 1
+                break
+        self.total += seconds
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: dict[str, Histogram] = {}
+        self._counters: dict[tuple[str, tuple], float] = {}
+        # name -> (help, type, callable returning {labels tuple: value})
+        self._callbacks: dict[str, tuple[str, str, Callable[[], dict]]] = {}
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def callback(self, name: str, help_text: str, read: Callable[[], dict], kind: str = "gauge"):
+        """
+        Register a metric read at scrape time (state kept elsewhere, e.g. the
+        result cache): `read` returns {labels tuple: value}.
+        """
+        self._callbacks[name] = (help_text, kind, read)
+
+    def render(self) -> str:
+        lines = [
+            "# HELP rib_stage_seconds Duration of pipeline stages",
+            "# TYPE rib_stage_seconds histogram",
+        ]
+        with self._lock:
+            stages = {stage: (list(h.counts), h.total, h.count) for stage, h in sorted(self._stages.items())}
+            counters = sorted(self._counters.items())
+        for stage, (counts, total, count) in stages.items():
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, counts):
+                cumulative += bucket_count
+                lines.append(f'rib_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'rib_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'rib_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'rib_stage_seconds_count{{stage="{stage}"}} {count}')
+
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{name}{_labels(labels)} {value:g}")
+
+        for name, (help_text, kind, read) in sorted(self._callbacks.items()):
+            try:
+                values = read()
+            except Exception as e:
+                print(f"Error reading metric {name}: {e}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values.items():
+                lines.append(f"{name}{_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+REGISTRY = MetricsRegistry()
+_local = threading.local()
+
+
+def record(stage: str, seconds: float):
+    timings = getattr(_local, "timings", None)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+    else:
+        REGISTRY.observe(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+class StageLaps:
+    """Times consecutive stages: each lap() records the time since the previous one."""
+
+    def __init__(self):
+        self._last = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        record(stage, now - self._last)
+        self._last = now
+
+
+@contextmanager
+def collect() -> Iterator[dict]:
+    """Gather the stages timed in this thread into a {stage: seconds} dict."""
+    previous = getattr(_local, "timings", None)
+    _local.timings = {}
+    try:
+        yield _local.timings
+    finally:
+        _local.timings = previous
+
+
+def observe_timings(timings: Optional[dict]):
+    for stage, seconds in (timings or {}).items():
+        REGISTRY.observe(stage, seconds)
+
+
+def timings_ms(timings: dict) -> dict:
+    """Per-stage breakdown sent to clients, in milliseconds."""
+    return {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()}
@@ -1,38 +1,131 @@
-from doctr.io import DocumentFile
-from doctr.models import ocr_predictor
+import os
+import threading
+import time
+from typing import Optional
+import cv2
 import numpy as np
+from app.core import config
+from app.services.layout import OcrPage
+from app.services.metrics import record, timed
+
+# Number of pages sent to DocTR in a single forward pass
+DEFAULT_BATCH_SIZE = 4
+
+
+def time_module(module, stage: str):
+    """Record the forward passes of a torch module (DocTR sub-predictor) as `stage`."""
+    if not hasattr(module, "register_forward_hook"):
+        return
+    started = threading.local()
+    module.register_forward_pre_hook(lambda _module, _args: setattr(started, "at", time.perf_counter()))
+    module.register_forward_hook(lambda _module, _args, _output: record(stage, time.perf_counter() - started.at))
+
+def load_local_predictor(models_dir: str, det_arch: str, reco_arch: str):
+    """
+    Offline mode: build the predictor from weights saved by
+    scripts/export_models.py (<models_dir>/<arch>.pt), without any download.
+    """
+    import torch
+    from doctr.models import detection, recognition, ocr_predictor
+
+    models = []
+    for module, arch in ((detection, det_arch), (recognition, reco_arch)):
+        path = os.path.join(models_dir, f"{arch}.pt")
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Missing OCR weights {path} (run scripts/export_models.py)")
+        model = getattr(module, arch)(pretrained=False, pretrained_backbone=False)
+        model.load_state_dict(torch.load(path, map_location="cpu"))
+        models.append(model)
+    return ocr_predictor(det_arch=models[0], reco_arch=models[1], pretrained=False)
+
+
+def quantize_recognition(predictor):
+    """
+    Dynamic int8 quantization of the recognition model (its LSTM and linear
+    layers), for CPU inference. Detection convolutions are left in float.
+    """
+    import torch
+
+    reco = predictor.reco_predictor
+    reco.model = torch.quantization.quantize_dynamic(reco.model, {torch.nn.LSTM, torch.nn.Linear}, dtype=torch.qint8)
+    return predictor
+
+
+def load_predictor(profile: str):
+    """DocTR predictor of an OCR profile (see config.OCR_PROFILES)."""
+    det_arch, reco_arch, quantized = config.ocr_profile(profile)
+    if config.OCR_MODELS_DIR:
+        model = load_local_predictor(config.OCR_MODELS_DIR, det_arch, reco_arch)
+    else:
+        from doctr.models import ocr_predictor
+        model = ocr_predictor(det_arch=det_arch, reco_arch=reco_arch, pretrained=True)
+    if quantized:
+        model = quantize_recognition(model)
+    return model
+
 
 class OCRService:
-    _instance = None
-    _model = None
-
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(OCRService, cls).__new__(cls)
-            # Initialize model only once
-            print("Loading DocTR model...")
-            cls._model = ocr_predictor(det_arch='db_resnet50', reco_arch='crnn_vgg16_bn', pretrained=True)
-            print("DocTR model loaded.")
-        return cls._instance
-
-    def predict(self, image: np.ndarray) -> str:
+    """One instance (and DocTR model) per OCR profile, loaded on first use."""
+    _instances: dict = {}
+    _lock = threading.Lock()
+
+    def __new__(cls, profile: Optional[str] = None):
+        profile = profile or config.OCR_PROFILE
+        # Warm-up and the first requests may race to create an instance
+        with cls._lock:
+            instance = cls._instances.get(profile)
+            if instance is None:
+                # Initialize each model only once (doctr/torch imported here, not when the module is imported)
+                print(f"Loading DocTR model ({profile})..." + (f" (offline, {config.OCR_MODELS_DIR})" if config.OCR_MODELS_DIR else ""))
+                model = load_predictor(profile)
+                time_module(getattr(model, "det_predictor", None), "ocr_detection")
+                time_module(getattr(model, "reco_predictor", None), "ocr_recognition")
+                instance = super(OCRService, cls).__new__(cls)
+                instance.profile = profile
+                instance._model = model
+                cls._instances[profile] = instance
+                print(f"DocTR model loaded ({profile}).")
+        return instance
+
+    @classmethod
+    def is_loaded(cls, profile: Optional[str] = None) -> bool:
+        return (profile or config.OCR_PROFILE) in cls._instances
+
+    def predict(self, image: np.ndarray) -> OcrPage:
         """
-        Run OCR on the image and return full extracted text.
+        Run OCR on the image and return its words, boxes and confidences.
         """
-        try:
-            # The predictor __call__ supports List[np.ndarray] directly
-            result = self._model([image])
-        except Exception as e:
-            print(f"ERROR in OCR: {e}")
-            raise e
-        
-        # Aggregating text result
-        full_text = ""
-        for page in result.pages:
-            for block in page.blocks:
-                for line in block.lines:
-                    for word in line.words:
-                        full_text += word.value + " "
-                    full_text += "\n"
-        
-        return full_text
+        return self.predict_batch([image], batch_size=1)[0]
+
+    def predict_batch(self, images: list[np.ndarray], batch_size: int = DEFAULT_BATCH_SIZE) -> list[OcrPage]:
+        """
+        Run OCR on several pages, `batch_size` pages per DocTR call.
+        Returns one OcrPage per page, in the same order as `images`.
+        """
+        batch_size = max(1, batch_size)
+        pages = []
+        for start in range(0, len(images), batch_size):
+            chunk = images[start:start + batch_size]
+            try:
+                # The predictor __call__ supports List[np.ndarray] directly
+                with timed("ocr"):
+                    result = self._model(chunk)
+            except Exception as e:
+                print(f"ERROR in OCR: {e}")
+                raise e
+            pages.extend(OcrPage.from_doctr(page) for page in result.pages)
+        return pages
+
+
+def warm_up_model(profile: Optional[str] = None) -> float:
+    """
+    Load the model and run one inference on a small synthetic page, so the
+    first real request does not pay for loading and torch kernel selection.
+    Returns the duration in seconds.
+    """
+    started = time.perf_counter()
+    page = np.full((600, 900, 3), 255, dtype=np.uint8)
+    cv2.putText(page, "IBAN FR76 3000 4000 0312 3456 7890 143", (30, 200),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 0, 0), 2, cv2.LINE_AA)
+    OCRService(profile).predict(page)
+    return time.perf_counter() - started
@@ -1,55 +1,126 @@
 import re
-import json
-import os
+import time
+from types import MappingProxyType
+from typing import Optional
+import numpy as np
 from app.models.schemas import RibData, ValidationStatus, AnalyzeResponse
+from app.services.bank_registry import get_bank_registry
+from app.core.config import CORRECTION_BUDGET_MS, CORRECTION_MAX_COST
+from app.services.checksum import IBAN_LENGTHS, iban_check_digits, is_plausible_iban, scan_ibans
+from app.services.correction import CONFUSIONS, CORRECTABLE_COUNTRIES, best_correction
+from app.services.layout import OcrPage
+from app.services.metrics import StageLaps
 from schwifty import IBAN, BIC
 from stdnum import iban as stdnum_iban
 
-def anonymize_text_for_debug(text: str, iban: str = None, bic: str = None, 
-                              bank_code: str = None, branch_code: str = None, 
-                              account_number: str = None, key: str = None) -> str:
-    """
-    Anonymize sensitive data in text for safe debugging.
-    Replaces real values with fictitious but valid ones (correct RIB key).
-    """
-    anon_text = text
-    
-    # Generate a fake but valid French IBAN
-    fake_bank = "11111"
-    fake_branch = "22222"
-    fake_account = "33333333333"
-    
-    # Calculate correct RIB key for fake values (inline to avoid circular import)
-    bank_val = int(fake_bank)
-    branch_val = int(fake_branch)
-    account_numeric = ''.join(c if c.isdigit() else '0' for c in fake_account)
-    account_val = int(account_numeric)
-    result = (89 * (bank_val % 97)) + (15 * (branch_val % 97)) + (3 * (account_val % 97))
-    calculated_key = 97 - (result % 97)
-    if calculated_key == 97:
-        calculated_key = 0
-    fake_key = f"{calculated_key:02d}"
-    
-    # Build fake IBAN (simplified - using hardcoded valid test IBAN)
-    fake_iban = f"FR7611111222223333333333344"  # Valid test IBAN
-    fake_bic = "XXXXFR99XXX"
-    
-    # Replace real data with fake
-    if iban:
-        anon_text = anon_text.replace(iban, fake_iban)
-    if bic:
-        anon_text = anon_text.replace(bic, fake_bic)
-    if bank_code:
-        anon_text = anon_text.replace(bank_code, fake_bank)
-    if branch_code:
-        anon_text = anon_text.replace(branch_code, fake_branch)
-    if account_number:
-        anon_text = anon_text.replace(account_number, fake_account)
-    if key:
-        anon_text = anon_text.replace(key, fake_key)
-    
-    return anon_text
+# --- Pattern / lookup table registry ---
+# Built once at import time and never mutated: parse_rib only reads them.
+
+VALID_COUNTRY_CODES = frozenset(IBAN_LENGTHS)
+
+# Letters commonly read by OCR instead of digits (C -> 0 for LCL cases)
+OCR_DIGIT_REPLACEMENTS = MappingProxyType({
+    'O': '0', 'Q': '0', 'D': '0', 'I': '1', 'L': '1', 'Z': '2', 'B': '8', 'S': '5', 'C': '0',
+})
+OCR_DIGIT_TABLE = str.maketrans(dict(OCR_DIGIT_REPLACEMENTS))
+
+# Letter to number conversion table for French RIB keys (official spec)
+RIB_LETTER_TABLE = str.maketrans({
+    'A': '1', 'J': '1',
+    'B': '2', 'K': '2', 'S': '2',
+    'C': '3', 'L': '3', 'T': '3',
+    'D': '4', 'M': '4', 'U': '4',
+    'E': '5', 'N': '5', 'V': '5',
+    'F': '6', 'O': '6', 'W': '6',
+    'G': '7', 'P': '7', 'X': '7',
+    'H': '8', 'Q': '8', 'Y': '8',
+    'I': '9', 'R': '9', 'Z': '9',
+})
 
+RE_NON_ALNUM = re.compile(r'[^A-Z0-9]')
+RE_NON_ALNUM_SPACE = re.compile(r'[^A-Z0-9\s]')
+RE_NON_DIGIT = re.compile(r'[^0-9]')
+
+# Detection method reported for each kind of Strategy 1 hit
+IBAN_HIT_METHODS = MappingProxyType({
+    "none": "Direct Extraction",
+    "body": "OCR Correction",
+    "key": "OCR Correction (Key)",
+})
+RE_IBAN_PREFIX = re.compile(r'IBAN.{0,60}?([A-Z]{2}\d{2})')
+
+# Starts of IBANs the correction search may repair (check digits possibly misread)
+RE_CORRECTABLE_START = re.compile(
+    r'(?=(%s)[0-9%s]{2})' % ('|'.join(sorted(CORRECTABLE_COUNTRIES)), ''.join(sorted(CONFUSIONS)))
+)
+RE_IBAN_LABEL = re.compile(r'IBAN')
+CORRECTION_MAX_WINDOWS = 6
+# Characters after the country code given to the search (one extra for deletions)
+CORRECTION_WINDOW = max(IBAN_LENGTHS[country] for country in CORRECTABLE_COUNTRIES) - 1
+# Confidence lost per unit of edit cost of a repaired IBAN
+CORRECTION_CONFIDENCE_PENALTY = 10
+
+# RIB components next to their labels
+RE_RIB_BANK = re.compile(r'BANQUE.*?(\d{5})')
+RE_RIB_BRANCH = re.compile(r'GUICHET.*?(\d{5})')
+RE_RIB_ACCOUNT = re.compile(r'(?:NODECOMPTE|NOCOMPTE|NUMERODECOMPTE|COMPTE).*?([A-Z0-9]{11})')
+RE_RIB_KEY = re.compile(r'(?:CLE|RIB|CL)(\d{2})')
+# The block starts at a digit: label letters ("CLEF", "N°", "DE") are never read as values
+RE_GROUPED_LABELS = re.compile(
+    r'(?:BANQUE|GUICHET|COMPTE|CLE|RIB|CL|IDENTIFIANT){3,}.*?([0-9][0-9%s]{4}[A-Z0-9]{18,28})' % ''.join(OCR_DIGIT_REPLACEMENTS)
+)
+
+# BIC right after the IBAN (up to 60 characters of labels/noise in between)
+RE_BIC_AFTER_IBAN = re.compile(r'(?:[A-Z\s]{0,60}?)([A-Z]{4}[A-Z]{2}[A-Z0-9]{2}(?:[A-Z0-9]{3})?)')
+RE_BIC = re.compile(r'([A-Z]{4}[A-Z]{2}[A-Z0-9]{2}(?:[A-Z0-9]{3})?)')
+BIC_AFTER_IBAN_BLACKLIST = frozenset({
+    "IQUEMENT", "PAIEMENT", "FICTIF", "CONFORME", "BANKIDEN", "DOMICILI", "TITULAIR", "NUMBER", "ACCOUNT",
+})
+# Expanded with partial labels to avoid "DENTITEBA" etc.
+BIC_BLACKLIST = BIC_AFTER_IBAN_BLACKLIST | frozenset({
+    "RELEVE", "IDENTITE", "BANQUE", "AGENCE", "NUMERO", "GUICHET",
+    "POURTOUT", "DENTITE", "IDENTIT", "IBAN", "SWIFT", "ADDRESS", "OWNER",
+})
+# Labels glued after a BIC8 (e.g. CMCIFRPPDOM -> CMCIFRPP)
+BIC_GLUED_SUFFIXES = frozenset({'DOM', 'TIT', 'NAM', 'ADR', 'ADD', 'IBAN', 'BIC'})
+
+# Bank names, stopping before civility or keywords to avoid eating the Owner Name
+# e.g. "CIC WITTENHEIM MLE LILY..." -> "CIC WITTENHEIM"
+_BANK_STOP_LOOKAHEAD = r'(?=\s+(?:M\.|MME|MLE|MLLE|MR|TITULAIRE|COMPTE|IBAN|BIC))'
+BANK_PATTERNS = tuple(re.compile(pattern) for pattern in (
+    r'(CIC\s+[A-Z\s]+?)' + _BANK_STOP_LOOKAHEAD,
+    r'(CREDIT\s+AGRICOLE(?:\s+[A-Z]+)?)',
+    r'(BANQUE\s+POPULAIRE(?:\s+[A-Z]+)?)',
+    r'(CR\s+[A-Z\s]+)' + _BANK_STOP_LOOKAHEAD,
+    r'(BNP\s+PARIBAS)',
+    r'(SOCIETE\s+GENERALE)',
+    r'(LA\s+BANQUE\s+POSTALE)',
+    r'(CAISSE\s+D[\'\s]?EPARGNE)',
+    r'(BRED)',
+    r'(LCL)',
+    r'(BOURSORAMA)',
+    r'(REVOLUT)',
+))
+
+# Owner name: civility (strongest signal) or label
+RE_OWNER_CIVILITY = re.compile(r'(?:^|\n)\s*(M\.|MME|MR|MLLE|MLE)\s+([A-Z\s\-]{3,30})', re.MULTILINE)
+RE_OWNER_LABEL = re.compile(r'(?:TITULAIRE|NOM)(?:\s*(?:DU|DE)?\s*COMPTE)?(?:\s*\(?ACCOUNT\s*OWNER\)?)?\s*[:.\-]?\s*([A-Z\s\-]{3,30})')
+RE_OWNER_INNER_CIVILITY = re.compile(r'(M\.|MME|MR|MLLE|MLE)\s+([A-Z\s\-]{3,30})')
+OWNER_BANK_PREFIXES = tuple(re.compile(pattern) for pattern in (r'^CIC\s', r'^CREDIT\sAGRICOLE', r'^BNP'))
+OWNER_BLACKLIST = ("DOMICILIATION", "ADRESSE", "BANQUE", "COMPTE", "IBAN", "BIC", "ACCOUNT", "OWNER", "RELEVE", "BANK_DETECTED")
+OWNER_STOP_WORDS = ("IBAN", "BIC", "ADRESSE", "CHEZ", "BANQUE", "DOMICILIATION", "SWIFT", "ACCOUNT", "OWNER")
+
+# RIB table header ("Banque | Guichet | N° de compte | Clé RIB") and value lengths
+RIB_TABLE_LABELS = MappingProxyType({
+    'BANQUE': 'bank', 'ETABLISSEMENT': 'bank', 'GUICHET': 'branch', 'COMPTE': 'account', 'CLE': 'key',
+})
+RIB_TABLE_LENGTHS = MappingProxyType({'bank': 5, 'branch': 5, 'account': 11, 'key': 2})
+BIC_LABELS = ('BIC', 'SWIFT', 'BICSWIFT')
+OWNER_LABELS = ('TITULAIRE',)
+# Label words skipped before the owner name ("Titulaire du compte : ...")
+OWNER_LABEL_FILLERS = frozenset({'', 'DU', 'DE', 'COMPTE', 'ACCOUNT', 'OWNER'})
+# Share of the score kept whatever the OCR confidence (0 -> x0.5, 1 -> x1)
+OCR_CONFIDENCE_FLOOR = 0.5
 
 def clean_iban(text: str) -> str:
     return text.replace(" ", "").replace("-", "").upper()
@@ -72,6 +143,13 @@ def validate_iban_checksum(iban_str: str) -> tuple[bool, str]:
         except:
             return False, str(e)
 
+def is_valid_iban(iban_str: str) -> bool:
+    """
+    Checksum validation for hot loops: the arithmetic check rejects almost
+    every candidate, schwifty only confirms the ones that pass it.
+    """
+    return is_plausible_iban(iban_str) and validate_iban_checksum(iban_str)[0]
+
 def extract_iban_components(iban_str: str) -> dict:
     """
     Extract IBAN components using schwifty.
@@ -97,28 +175,8 @@ def validate_french_rib_key(bank_code: str, branch_code: str, account_number: st
         return False, "Missing components for RIB key validation"
     
     try:
-        # Letter to number conversion table for French RIB (official spec)
-        letter_map = {
-            'A': '1', 'J': '1',
-            'B': '2', 'K': '2', 'S': '2',
-            'C': '3', 'L': '3', 'T': '3',
-            'D': '4', 'M': '4', 'U': '4',
-            'E': '5', 'N': '5', 'V': '5',
-            'F': '6', 'O': '6', 'W': '6',
-            'G': '7', 'P': '7', 'X': '7',
-            'H': '8', 'Q': '8', 'Y': '8',
-            'I': '9', 'R': '9', 'Z': '9'
-        }
-        
-        # Convert account number letters to digits
-        account_numeric = ''
-        for char in account_number.upper():
-            if char.isdigit():
-                account_numeric += char
-            elif char.isalpha():
-                account_numeric += letter_map.get(char, '0')
-            else:
-                account_numeric += '0'
+        # Convert account number letters to digits, anything else to 0
+        account_numeric = RE_NON_DIGIT.sub('0', account_number.upper().translate(RIB_LETTER_TABLE))
         
         # Calculate key using French RIB formula
         bank = int(bank_code)
@@ -141,20 +199,118 @@ def validate_french_rib_key(bank_code: str, branch_code: str, account_number: st
         return False, f"RIB Validation Error: {str(e)}"
 
 
-def parse_rib(raw_text: str) -> AnalyzeResponse:
+def find_iban_prefix(text_nospace: str) -> str:
+    """Country code + check digits written near the IBAN label, FR76 by default"""
+    prefix_match = RE_IBAN_PREFIX.search(text_nospace)
+    if prefix_match:
+        cand_prefix = prefix_match.group(1)
+        if cand_prefix[:2] in VALID_COUNTRY_CODES:
+            return cand_prefix
+    return "FR76"
+
+
+def correction_windows(text_nospace: str, grouped_block: str = None) -> list[tuple[str, str, bool]]:
+    """
+    (country, characters after the country code, check digits read)
+    candidates for the correction search: starts after an IBAN label first,
+    then the digits after grouped RIB labels, then any other start.
+    """
+    starts = [m.start() for m in RE_CORRECTABLE_START.finditer(text_nospace)]
+    labels = [m.end() for m in RE_IBAN_LABEL.finditer(text_nospace)]
+    near_label = [start for start in starts if any(0 <= start - end <= 60 for end in labels)]
+    windows = [(text_nospace[start:start + 2], text_nospace[start + 2:start + 2 + CORRECTION_WINDOW], True)
+               for start in near_label]
+    if grouped_block:
+        # RIB table without IBAN: the BBAN only
+        windows.append((find_iban_prefix(text_nospace)[:2], grouped_block, False))
+    windows += [(text_nospace[start:start + 2], text_nospace[start + 2:start + 2 + CORRECTION_WINDOW], True)
+                for start in starts if start not in near_label]
+    return windows[:CORRECTION_MAX_WINDOWS]
+
+
+def layout_rib_table(page: OcrPage) -> Optional[tuple[str, str, str, str]]:
+    """
+    (bank, branch, account, key) read from a RIB table: the row under the
+    "Banque | Guichet | N° de compte | Clé" header, each word assigned to the
+    nearest header column.
+    """
+    for anchor in page.find('GUICHET'):
+        columns = {}
+        for idx in page.same_row(anchor):
+            field = RIB_TABLE_LABELS.get(page.normalized[idx])
+            if field and field not in columns:
+                columns[field] = (page.boxes[idx, 0] + page.boxes[idx, 2]) / 2
+        if len(columns) < len(RIB_TABLE_LENGTHS):
+            continue
+        fields = list(columns)
+        centers = np.array([columns[field] for field in fields])
+        parts = {field: '' for field in fields}
+        for idx in page.row_below(anchor):
+            center = (page.boxes[idx, 0] + page.boxes[idx, 2]) / 2
+            parts[fields[int(np.argmin(np.abs(centers - center)))]] += page.normalized[idx]
+        # Letters only allowed in the account number
+        for field in ('bank', 'branch', 'key'):
+            parts[field] = parts[field].translate(OCR_DIGIT_TABLE)
+        if all(len(parts[field]) == length for field, length in RIB_TABLE_LENGTHS.items()) \
+                and (parts['bank'] + parts['branch'] + parts['key']).isdigit():
+            return parts['bank'], parts['branch'], parts['account'], parts['key']
+    return None
+
+
+def layout_label_words(page: OcrPage, labels: tuple[str, ...], skip: frozenset = frozenset()) -> list[int]:
+    """
+    Words written after a label on the same row (or, if none, on the row
+    below starting under the label), leading `skip` words removed.
+    """
+    for label in page.find(*labels):
+        words = [idx for idx in page.right_of(label)]
+        while words and page.normalized[words[0]] in skip:
+            words.pop(0)
+        if not words:
+            below = page.row_below(label)
+            words = [idx for idx in below if page.boxes[idx, 0] >= page.boxes[label, 0] - 0.02]
+        if words:
+            return words
+    return []
+
+
+def layout_bic(page: OcrPage, words: list[int]) -> Optional[str]:
+    """
+    BIC among the words after its label: the first word, joined with the
+    next ones while they still fit in a BIC (OCR may split "BNPA FRPP XXX").
+    """
+    bic, joined = None, ''
+    for idx in words:
+        joined += page.normalized[idx]
+        # Label glued after a BIC8 (e.g. CMCIFRPPDOM -> CMCIFRPP): nothing follows
+        glued = joined[8:] in BIC_GLUED_SUFFIXES
+        if glued:
+            joined = joined[:8]
+        if len(joined) > 11:
+            break
+        if len(joined) in (8, 11) and RE_BIC.fullmatch(joined) and not any(bad in joined for bad in BIC_BLACKLIST):
+            bic = joined
+        if glued:
+            break
+    return bic
+
+
+def parse_rib(raw_text: str, layout: Optional[OcrPage] = None) -> AnalyzeResponse:
+    """
+    Extract IBAN, BIC, owner and bank from the text of a page. `layout`
+    (OCR words with boxes and confidences) enables the spatial strategies,
+    tried before the sliding windows over RIB tables, and weighs the score
+    by the OCR confidence.
+    """
+    spatial = layout is not None and layout.has_geometry
     confidence = 0.0
     status = ValidationStatus.INVALID
     
-    # Regex Patterns
-    iban_pattern = re.compile(r'([A-Z]{2}\d{2}[A-Z0-9]{10,30})')
-    bic_pattern = re.compile(r'([A-Z]{4}[A-Z]{2}[A-Z0-9]{2}([A-Z0-9]{3})?)')
-    
     raw_upper = raw_text.upper()
 
     
     # Clean text
-    text_nospace = re.sub(r'[^A-Z0-9]', '', raw_upper)
-    text_clean = re.sub(r'[^A-Z0-9\s]', '', raw_upper)
+    text_nospace = RE_NON_ALNUM.sub('', raw_upper)
     
     # Initialize all result variables
     found_iban = None
@@ -169,73 +325,30 @@ def parse_rib(raw_text: str) -> AnalyzeResponse:
     rib_account_number = None
     rib_key = None
     detection_method = "Unknown"
-
-    valid_country_codes = {'FR', 'BE', 'DE', 'ES', 'IT', 'GB', 'CH', 'LU', 'NL', 'AT', 'PT', 'IE', 'SE', 'DK', 'FI', 'NO', 'PL', 'CZ', 'HU', 'SK', 'SI', 'HR', 'EE', 'LV', 'LT', 'MT', 'CY', 'GR', 'BG', 'RO', 'MC', 'SM', 'LI', 'IS'}
+    laps = StageLaps()
 
     # Strategy 1: Find IBANs in nospace string
-    potential_matches = re.findall(r'(?=([A-Z]{2}\d{2}[A-Z0-9]{10,30}))', text_nospace)
-    potential_matches = sorted(potential_matches, key=lambda x: (0 if x.startswith('FR') else 1, x))
+    # One linear pass reports every checksum-valid prefix, with OCR letter
+    # corrections for French IBANs (whole body, or key digits only)
+    hits = scan_ibans(text_nospace, OCR_DIGIT_REPLACEMENTS)
+    # French IBANs first, then by candidate text
+    hits.sort(key=lambda hit: (0 if hit.iban.startswith('FR') else 1, text_nospace[hit.start:hit.start + 34]))
     
-    for candidate in potential_matches:
-        if candidate[:2] not in valid_country_codes:
-            continue
-
-        valid_iban = None
-        max_len = min(len(candidate), 34)
-        min_len = 15
-        is_french = candidate.startswith('FR')
-        
-        for length in range(max_len, min_len - 1, -1):
-            sub_candidate = candidate[:length]
-            is_valid, _ = validate_iban_checksum(sub_candidate)
-            if is_valid:
-                if sub_candidate.startswith('FR') and len(sub_candidate) != 27:
-                    continue
-                valid_iban = sub_candidate
-                detection_method = "Direct Extraction"
-                break
-            
-            # OCR Correction for French IBANs
-            if is_french:
-                # Add C -> 0 for LCL cases
-                replacements = {'O': '0', 'Q': '0', 'D': '0', 'I': '1', 'L': '1', 'Z': '2', 'B': '8', 'S': '5', 'C': '0'}
-                header = sub_candidate[:2]
-                body = ''.join(replacements.get(char, char) for char in sub_candidate[2:])
-                corrected = header + body
-                if corrected != sub_candidate:
-                    is_valid_corr, _ = validate_iban_checksum(corrected)
-                    if is_valid_corr:
-                        if corrected.startswith('FR') and len(corrected) != 27:
-                            continue
-                        valid_iban = corrected
-                        detection_method = "OCR Correction"
-                        break
-                
-                # Special Case: Key correction (last 2 digits)
-                # If everything else looks okay but checksum fails, try fixing the key digits
-                if len(sub_candidate) == 27:
-                    body_main = sub_candidate[2:25]
-                    key_part = sub_candidate[25:27]
-                    fixed_key = ''.join(replacements.get(char, char) for char in key_part)
-                    if fixed_key != key_part:
-                        corrected_key = header + body_main + fixed_key
-                        if validate_iban_checksum(corrected_key)[0]:
-                            valid_iban = corrected_key
-                            detection_method = "OCR Correction (Key)"
-                            break
-
-        if valid_iban:
-            found_iban = valid_iban
+    for hit in hits:
+        # Final confirmation (country-specific BBAN format) by schwifty
+        if validate_iban_checksum(hit.iban)[0]:
+            found_iban = hit.iban
+            detection_method = IBAN_HIT_METHODS[hit.correction]
             confidence += 80 
-            status = ValidationStatus.VALID if validate_iban_checksum(found_iban)[0] else ValidationStatus.INVALID
+            status = ValidationStatus.VALID
             break 
 
     # Strategy 2: Reconstruct IBAN from RIB components
     if not found_iban:
-        rb_bank = re.search(r'BANQUE.*?(\d{5})', text_nospace)
-        rb_branch = re.search(r'GUICHET.*?(\d{5})', text_nospace)
-        rb_account = re.search(r'(?:NODECOMPTE|NOCOMPTE|NUMERODECOMPTE|COMPTE).*?([A-Z0-9]{11})', text_nospace)
-        rb_key = re.search(r'(?:CLE|RIB|CL)(\d{2})', text_nospace)
+        rb_bank = RE_RIB_BANK.search(text_nospace)
+        rb_branch = RE_RIB_BRANCH.search(text_nospace)
+        rb_account = RE_RIB_ACCOUNT.search(text_nospace)
+        rb_key = RE_RIB_KEY.search(text_nospace)
         
         if rb_bank and rb_branch and rb_account and rb_key:
             rib_bank_code = rb_bank.group(1)
@@ -246,68 +359,108 @@ def parse_rib(raw_text: str) -> AnalyzeResponse:
             rib_body = rib_bank_code + rib_branch_code + rib_account_number + rib_key
             
             # Find prefix ONLY if it's a valid country code and near labels
-            prefix = "FR76"
-            prefix_match = re.search(r'IBAN.{0,60}?([A-Z]{2}\d{2})', text_nospace)
-            if prefix_match:
-                cand_prefix = prefix_match.group(1)
-                if cand_prefix[:2] in valid_country_codes:
-                    prefix = cand_prefix
-            
-            reconstructed = prefix + rib_body
-            if validate_iban_checksum(reconstructed)[0]:
+            reconstructed = find_iban_prefix(text_nospace) + rib_body
+            if is_valid_iban(reconstructed):
                 found_iban = reconstructed
                 status = ValidationStatus.VALID
                 confidence = 85
                 detection_method = "Reconstructed (Found in Text)" if reconstructed in text_nospace else "Reconstructed"
 
+    laps.lap("parse_iban_scan")
+
+    # Strategy 3a: RIB table read spatially (OCR layout)
+    if not found_iban and spatial:
+        table = layout_rib_table(layout)
+        if table:
+            bank, branch, acc, key = table
+            country = find_iban_prefix(text_nospace)[:2]
+            if country not in CORRECTABLE_COUNTRIES:
+                country = 'FR'
+            bban = bank + branch + acc + key
+            reconstructed = country + iban_check_digits(country, bban) + bban
+            if validate_french_rib_key(bank, branch, acc, key)[0] and is_valid_iban(reconstructed):
+                found_iban = reconstructed
+                status = ValidationStatus.VALID
+                confidence = 90
+                detection_method = "Reconstructed (Layout)"
+                rib_bank_code, rib_branch_code, rib_account_number, rib_key = bank, branch, acc, key
+
+    laps.lap("parse_layout_table")
+
     # Strategy 3: Grouped Labels followed by digits (Robust Window Search)
+    grouped_labels = None
     if not found_iban:
         # Capture ALPHANUMERIC block (to handle C -> 0 errors)
-        grouped_labels = re.search(r'(?:BANQUE|GUICHET|COMPTE|CLE|RIB|CL|IDENTIFIANT){3,}.*?([A-Z0-9]{23,33})', text_nospace)
+        grouped_labels = RE_GROUPED_LABELS.search(text_nospace)
         if grouped_labels:
             raw_block = grouped_labels.group(1)
             # Apply OCR digit corrections to the block
-            replacements = {'O': '0', 'Q': '0', 'D': '0', 'I': '1', 'L': '1', 'Z': '2', 'B': '8', 'S': '5', 'C': '0'}
-            raw_digits = ''.join(replacements.get(c, c) for c in raw_block if c.isdigit() or c in replacements)
-            
-            # Try all 23-digit windows in the corrected block
+            raw_digits = ''.join(c for c in raw_block if c.isdigit() or c in OCR_DIGIT_REPLACEMENTS).translate(OCR_DIGIT_TABLE)
+            prefix = find_iban_prefix(text_nospace)
+
+            # Sliding 23-digit windows: text pages, or OCR pages whose table
+            # could not be read by columns (Strategy 3a)
             for i in range(len(raw_digits) - 22):
                 window = raw_digits[i:i+23]
                 bank, branch, acc, key = window[0:5], window[5:10], window[10:21], window[21:23]
-                
+
                 # Check reconstruction
-                prefix = "FR76"
-                prefix_match = re.search(r'IBAN.{0,60}?([A-Z]{2}\d{2})', text_nospace)
-                if prefix_match:
-                    cand_prefix = prefix_match.group(1)
-                    if cand_prefix[:2] in valid_country_codes:
-                        prefix = cand_prefix
-                
                 reconstructed = prefix + bank + branch + acc + key
-                if validate_iban_checksum(reconstructed)[0]:
+                if is_valid_iban(reconstructed):
                     found_iban = reconstructed
                     status = ValidationStatus.VALID
                     confidence = 90
                     detection_method = "Reconstructed (Grouped Labels - Valid)"
                     rib_bank_code, rib_branch_code, rib_account_number, rib_key = bank, branch, acc, key
                     break
-            
-            # Fallback for grouped labels: take first 23 digits even if invalid
-            if not found_iban and len(raw_digits) >= 23:
-                bank, branch, acc, key = raw_digits[0:5], raw_digits[5:10], raw_digits[10:21], raw_digits[21:23]
-                
-                prefix = "FR76"
-                prefix_match = re.search(r'IBAN.{0,60}?([A-Z]{2}\d{2})', text_nospace)
-                if prefix_match:
-                    cand_prefix = prefix_match.group(1)
-                    if cand_prefix[:2] in valid_country_codes:
-                        prefix = cand_prefix
-                
-                found_iban = prefix + bank + branch + acc + key
-                status = ValidationStatus.INVALID
-                confidence = 40
-                detection_method = "Reconstructed (Grouped Labels - Invalid Checksum)"
-                rib_bank_code, rib_branch_code, rib_account_number, rib_key = bank, branch, acc, key
+
+
+    laps.lap("parse_grouped_labels")
+
+    # Strategy 3b: Bounded OCR-confusion search (substitutions, one missing/extra char)
+    correction_inferred = False
+    check_computed = False
+    if not found_iban and CORRECTION_BUDGET_MS > 0:
+        started = time.perf_counter()
+        windows = correction_windows(text_nospace, grouped_labels.group(1) if grouped_labels else None)
+        # Letters read for digits are verified by the checksums
+        correction = best_correction(windows, CORRECTION_MAX_COST, CORRECTION_BUDGET_MS)
+        if correction is None:
+            # Then digits solved from the checksum: a guess, reported as a warning
+            budget_left = CORRECTION_BUDGET_MS - (time.perf_counter() - started) * 1000
+            correction = best_correction(windows, CORRECTION_MAX_COST, budget_left, verified_only=False)
+            correction_inferred = correction is not None
+        # RIB without IBAN: a repair only passed the RIB key, the check digits are computed from it
+        check_computed = correction is not None and correction.check_computed and bool(correction.edits)
+        iban = correction.iban if correction else ''
+        if (correction and validate_iban_checksum(iban)[0]
+                and validate_french_rib_key(iban[4:9], iban[9:14], iban[14:25], iban[25:27])[0]):
+            found_iban = correction.iban
+            status = ValidationStatus.WARNING if correction_inferred or check_computed else ValidationStatus.VALID
+            edit_count = len(correction.edits)
+            if edit_count:
+                confidence += max(40, 80 - CORRECTION_CONFIDENCE_PENALTY * correction.cost)
+                detection_method = f"OCR Correction (Search, {edit_count} edit{'s' if edit_count > 1 else ''})"
+            else:
+                # RIB table read as is (account letters kept), check digits computed
+                confidence = 90
+                detection_method = "Reconstructed (Grouped Labels - Valid)"
+            if correction_inferred:
+                validation_details.append(f"OCR Correction: inferred from the checksum, not verified ({', '.join(correction.edits)})")
+            elif check_computed:
+                validation_details.append(f"OCR Correction: only verified by the RIB key, IBAN check digits computed ({', '.join(correction.edits)})")
+
+    # Fallback for grouped labels: take first 23 digits even if invalid
+    if not found_iban and grouped_labels and len(raw_digits) >= 23:
+        bank, branch, acc, key = raw_digits[0:5], raw_digits[5:10], raw_digits[10:21], raw_digits[21:23]
+
+        found_iban = prefix + bank + branch + acc + key
+        status = ValidationStatus.INVALID
+        confidence = 40
+        detection_method = "Reconstructed (Grouped Labels - Invalid Checksum)"
+        rib_bank_code, rib_branch_code, rib_account_number, rib_key = bank, branch, acc, key
+
+    laps.lap("parse_correction")
 
     # --- 2. BIC Extraction (Improved) ---
     found_bic = None
@@ -315,59 +468,44 @@ def parse_rib(raw_text: str) -> AnalyzeResponse:
     # Strategy E: BIC following IBAN (with optional intermediate labels)
     # Regex: IBAN + (Optional Labels/Noise) + BIC
     if found_iban:
-        escaped_iban = re.escape(found_iban)
-        # Allow up to 60 characters of noise between IBAN and BIC in text_nospace
-        bic_after_iban = re.search(escaped_iban + r'(?:[A-Z\s]{0,60}?)' + r'([A-Z]{4}[A-Z]{2}[A-Z0-9]{2}(?:[A-Z0-9]{3})?)', text_nospace)
+        bic_after_iban = None
+        iban_pos = text_nospace.find(found_iban)
+        while iban_pos != -1 and bic_after_iban is None:
+            bic_after_iban = RE_BIC_AFTER_IBAN.match(text_nospace, iban_pos + len(found_iban))
+            iban_pos = text_nospace.find(found_iban, iban_pos + 1)
         
         if bic_after_iban:
              potential = bic_after_iban.group(1)
-             blacklist = {"IQUEMENT", "PAIEMENT", "FICTIF", "CONFORME", "BANKIDEN", "DOMICILI", "TITULAIR", "NUMBER", "ACCOUNT"}
              
-             if len(potential) in [8, 11] and not any(bad in potential for bad in blacklist):
+             if len(potential) in [8, 11] and not any(bad in potential for bad in BIC_AFTER_IBAN_BLACKLIST):
                 final_bic = potential
                 # Handle "glued" text (e.g. CMCIFRPPDOM -> CMCIFRPP)
-                if len(potential) == 11 and potential[8:] in {'DOM', 'TIT', 'NAM', 'ADR', 'ADD', 'IBAN', 'BIC'}:
+                if len(potential) == 11 and potential[8:] in BIC_GLUED_SUFFIXES:
                     final_bic = potential[:8]
                 found_bic = final_bic
                 confidence += 20
 
+    # Strategy E2: BIC written next to its label (OCR layout)
+    if not found_bic and spatial:
+        found_bic = layout_bic(layout, layout_label_words(layout, BIC_LABELS))
+        if found_bic:
+            confidence += 15
+
     # Strategy F: General BIC fallback (if Strategy E failed)
     if not found_bic:
         # Search for any string matching BIC pattern in text_nospace
-        all_bics = re.findall(r'([A-Z]{4}[A-Z]{2}[A-Z0-9]{2}(?:[A-Z0-9]{3})?)', text_nospace)
-        for cand in all_bics:
-            # blacklist expanded with partial labels to avoid "DENTITEBA" etc.
-            blacklist = {
-                "IQUEMENT", "PAIEMENT", "FICTIF", "CONFORME", "BANKIDEN", "DOMICILI", "TITULAIR", 
-                "NUMBER", "ACCOUNT", "RELEVE", "IDENTITE", "BANQUE", "AGENCE", "NUMERO", "GUICHET",
-                "POURTOUT", "DENTITE", "IDENTIT", "IBAN", "SWIFT", "ADDRESS", "OWNER"
-            }
-            if not any(bad in cand for bad in blacklist):
+        for cand in RE_BIC.findall(text_nospace):
+            if not any(bad in cand for bad in BIC_BLACKLIST):
                 found_bic = cand
                 confidence += 10
                 break
 
 
+    laps.lap("parse_bic")
+
     # Strategy 4: Bank Name Extraction (from text)
-    # Refined to stop before civility or keywords to avoid eating the Owner Name
-    # e.g. "CIC WITTENHEIM MLE LILY..." -> "CIC WITTENHEIM"
-    stop_lookahead = r'(?=\s+(?:M\.|MME|MLE|MLLE|MR|TITULAIRE|COMPTE|IBAN|BIC))'
-    bank_patterns = [
-        r'(CIC\s+[A-Z\s]+?)' + stop_lookahead, 
-        r'(CREDIT\s+AGRICOLE(?:\s+[A-Z]+)?)', 
-        r'(BANQUE\s+POPULAIRE(?:\s+[A-Z]+)?)',
-        r'(CR\s+[A-Z\s]+)' + stop_lookahead,
-        r'(BNP\s+PARIBAS)',
-        r'(SOCIETE\s+GENERALE)', 
-        r'(LA\s+BANQUE\s+POSTALE)', 
-        r'(CAISSE\s+D[\'\s]?EPARGNE)',
-        r'(BRED)', 
-        r'(LCL)', 
-        r'(BOURSORAMA)', 
-        r'(REVOLUT)'
-    ]
-    for pattern in bank_patterns:
-        match = re.search(pattern, raw_upper)
+    for pattern in BANK_PATTERNS:
+        match = pattern.search(raw_upper)
         if match:
             potential_bank = match.group(1).strip()
             # Safety: don't let it be too long (address included?)
@@ -378,35 +516,34 @@ def parse_rib(raw_text: str) -> AnalyzeResponse:
 
     # Strategy 5: Owner Name Extraction
     # Updated to include 'MLE' and better filtering
-    civ_match = re.search(r'(?:^|\n)\s*(M\.|MME|MR|MLLE|MLE)\s+([A-Z\s\-]{3,30})', raw_upper, re.MULTILINE)
-    label_match = re.search(r'(?:TITULAIRE|NOM)(?:\s*(?:DU|DE)?\s*COMPTE)?(?:\s*\(?ACCOUNT\s*OWNER\)?)?\s*[:.\-]?\s*([A-Z\s\-]{3,30})', raw_upper) # Use raw_upper for regex spaces
+    civ_match = RE_OWNER_CIVILITY.search(raw_upper)
+    label_match = RE_OWNER_LABEL.search(raw_upper) # Use raw_upper for regex spaces
     
     raw_owner = None
+    owner_words = layout_label_words(layout, OWNER_LABELS, OWNER_LABEL_FILLERS) if spatial and not civ_match else []
     
     # Priority: Civility (M. Name) - Strongest signal
     if civ_match:
         raw_owner = f"{civ_match.group(1)} {civ_match.group(2)}"
         
-    # Priority: Label (TITULAIRE...)
-    elif label_match:
-        cand = label_match.group(1).strip()
+    # Priority: Label (TITULAIRE...), read spatially when the OCR layout is known
+    elif owner_words or label_match:
+        if owner_words:
+            # Name right of or under the label, whatever the reading order
+            cand = RE_NON_ALNUM_SPACE.sub('', ' '.join(layout.words[idx] for idx in owner_words).upper()).strip()
+        else:
+            cand = label_match.group(1).strip()
         
         # CLEANUP: If the candidate starts with a Bank Name (e.g. CIC WITTENHEIM...), remove it
         # This happens if "TITULAIRE" is followed by Bank Address on next line
-        for bank_pat in [r'^CIC\s', r'^CREDIT\sAGRICOLE', r'^BNP']:
-            if re.match(bank_pat, cand):
-                # Try to find what comes AFTER the bank name in this candidate string
-                # This is hard if we don't know where bank name ends exactly in 'cand'
-                # Simplification: If cand seems to BE a bank, discard it and look for civility in it?
-                # or just fail this match type
-                cand = "BANK_DETECTED" # validation below will kill it
-                break
+        if any(bank_pat.match(cand) for bank_pat in OWNER_BANK_PREFIXES):
+            # Simplification: If cand seems to BE a bank, fail this match type
+            cand = "BANK_DETECTED" # validation below will kill it
 
-        blacklist = ["DOMICILIATION", "ADRESSE", "BANQUE", "COMPTE", "IBAN", "BIC", "ACCOUNT", "OWNER", "RELEVE", "BANK_DETECTED"]
-        if not any(sw in cand for sw in blacklist) and len(cand) >= 3:
+        if not any(sw in cand for sw in OWNER_BLACKLIST) and len(cand) >= 3:
              # Extra check: DOES it contain a civility? "CIC WITTENHEIM MLE LILY"
              # If yes, extract from civility
-             inner_civ = re.search(r'(M\.|MME|MR|MLLE|MLE)\s+([A-Z\s\-]{3,30})', cand)
+             inner_civ = RE_OWNER_INNER_CIVILITY.search(cand)
              if inner_civ:
                  raw_owner = f"{inner_civ.group(1)} {inner_civ.group(2)}"
              else:
@@ -414,37 +551,31 @@ def parse_rib(raw_text: str) -> AnalyzeResponse:
 
     if raw_owner:
         found_owner = ' '.join(raw_owner.strip().split()) # Normalize spaces
-        stop_words = ["IBAN", "BIC", "ADRESSE", "CHEZ", "BANQUE", "DOMICILIATION", "SWIFT", "ACCOUNT", "OWNER"]
-        for sw in stop_words:
+        for sw in OWNER_STOP_WORDS:
             if sw in found_owner:
                 found_owner = found_owner.split(sw)[0].strip()
 
+    laps.lap("parse_owner_bank")
+
     # --- Final Data Lookup & Validation ---
-    def load_bank_codes(filename="banks_fr.json"):
-        try:
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            json_path = os.path.join(base_dir, "resources", filename)
-            if os.path.exists(json_path):
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            print(f"DEBUG: Error loading {filename}: {e}")
-        return {}
-
-    bank_codes = load_bank_codes("banks_fr.json")
-    bic_codes = load_bank_codes("bics_fr.json")
+    registry = get_bank_registry()
     
     if found_iban and len(found_iban) >= 9:
         bcode = found_iban[4:9]
-        if bcode in bank_codes:
-            found_bank = bank_codes[bcode]
+        bank_name = registry.bank_name(bcode)
+        if bank_name:
+            found_bank = bank_name
+            # Branch-level name when a guichet dataset is installed
+            branch_name = registry.branch_name(bcode, found_iban[9:14]) if found_iban.startswith('FR') else None
+            if branch_name:
+                found_bank = f"{bank_name} ({branch_name})"
         else:
             found_bank = f"Unknown (Code {bcode})"
 
     # If bank is still unknown, try identifying via BIC (using first 8 chars)
     if found_bank.startswith("Unknown") and found_bic and len(found_bic) >= 8:
-        bic_8 = found_bic[:8].upper()
-        found_bank = bic_codes.get(bic_8, "Unknown")
+        found_bank = registry.bic_name(found_bic) or "Unknown"
+    laps.lap("reference_lookup")
 
     if found_iban:
         is_v, msg = validate_iban_checksum(found_iban)
@@ -461,15 +592,23 @@ def parse_rib(raw_text: str) -> AnalyzeResponse:
             rib_key_valid = is_v
             if not is_v: validation_details.append(f"RIB Key: {msg}")
 
-    # Anonymize logs (kept for internal logic if needed)
-    try:
-        anon = anonymize_text_for_debug(text_nospace, iban=found_iban, bic=found_bic, bank_code=rib_bank_code, branch_code=rib_branch_code, account_number=rib_account_number, key=rib_key)
-        # Log removed for cleaner console/GUI
-    except: pass
+    # OCR confidence of the IBAN words (whole page if the IBAN was rebuilt)
+    ocr_confidence = None
+    if layout is not None and layout.confidences is not None:
+        if found_iban:
+            ocr_confidence = layout.span_confidence(found_iban)
+            if ocr_confidence is None:
+                ocr_confidence = layout.span_confidence(found_iban[4:])
+        if ocr_confidence is None:
+            ocr_confidence = layout.mean_confidence()
+    if ocr_confidence is not None:
+        confidence = min(100.0, confidence) * (OCR_CONFIDENCE_FLOOR + (1 - OCR_CONFIDENCE_FLOOR) * ocr_confidence)
+    laps.lap("parse_validation")
 
     return AnalyzeResponse(
-        status=ValidationStatus.VALID if found_iban and checksum_valid else ValidationStatus.WARNING if found_iban else ValidationStatus.INVALID,
-        confidence_score=min(100.0, confidence),
+        status=ValidationStatus.VALID if found_iban and checksum_valid and not (correction_inferred or check_computed) else ValidationStatus.WARNING if found_iban else ValidationStatus.INVALID,
+        confidence_score=round(min(100.0, confidence), 1),
+        ocr_confidence=None if ocr_confidence is None else round(ocr_confidence, 3),
         extraction_method=detection_method,
         checksum_valid=checksum_valid,
         rib_key_valid=rib_key_valid,
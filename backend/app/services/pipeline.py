@@ -0,0 +1,123 @@
+"""
+Page processing pipeline (preprocess -> OCR -> parse).
+
+These functions are blocking and are meant to run inside the worker pool
+(see app.services.executor), never directly on the event loop. They only
+take and return picklable values so they also work in a process pool.
+"""
+from typing import Iterator, Optional
+import numpy as np
+from app.core import config
+from app.services.ocr import OCRService
+from app.services.image import preprocess_image
+from app.services.layout import OcrPage
+from app.services.metrics import collect, timed
+from app.services.parser import parse_rib
+from app.services.text_store import get_text_store, image_hash
+
+
+def recognize_pages(images: list[np.ndarray], batch_size: int, profile: Optional[str] = None) -> list[Optional[OcrPage]]:
+    """OCR a chunk of pages with a single batched call, None for pages that failed."""
+    ocr_service = OCRService(profile)
+    try:
+        with timed("preprocess"):
+            processed_images = [preprocess_image(image) for image in images]
+        return ocr_service.predict_batch(processed_images, batch_size=batch_size)
+    except Exception as e:
+        print(f"Error on OCR batch of {len(images)} pages: {e}")
+        # Retry page by page so one bad page does not drop the whole chunk
+        pages = []
+        for idx, image in enumerate(images):
+            try:
+                pages.append(ocr_service.predict(preprocess_image(image)))
+            except Exception as page_error:
+                print(f"Error on page {idx}: {page_error}")
+                pages.append(None)
+        return pages
+
+
+def process_pages(images: list[np.ndarray], batch_size: int, doc_hash: Optional[str] = None,
+                  page_numbers: Optional[list[int]] = None, profile: Optional[str] = None) -> list[Optional[dict]]:
+    """
+    Run the full pipeline on a chunk of pages.
+    Returns one AnalyzeResponse dict per page, or None for pages that failed
+    (including pages that could not be rendered, passed as None).
+    Each result carries its stage durations in "timings" (seconds), the
+    batched OCR stages being shared evenly between the pages of the chunk.
+    `profile` selects the OCR models (config.OCR_PROFILE by default) and
+    `page_numbers` gives the page index of each image in document `doc_hash`
+    (their positions by default).
+
+    When the OCR text store is enabled, pages already recognized by the
+    same models skip DocTR, and new texts are saved for later reparsing.
+    """
+    profile = profile or config.OCR_PROFILE
+    model_id = config.ocr_model_id(profile)
+    store = get_text_store()
+    pages: list[Optional[OcrPage]] = [None] * len(images)
+    hashes = []
+    with collect() as chunk_timings:
+        if store is not None:
+            with timed("text_store"):
+                hashes = [image_hash(image) if image is not None else None for image in images]
+                pages = [store.get(h, model_id) if h else None for h in hashes]
+
+        missing = [idx for idx, page in enumerate(pages) if page is None and images[idx] is not None]
+        if missing:
+            recognized = recognize_pages([images[idx] for idx in missing], batch_size, profile)
+            for idx, page in zip(missing, recognized):
+                pages[idx] = page
+                if store is not None and page is not None:
+                    with timed("text_store"):
+                        store.put(hashes[idx], page, model_id)
+
+        if store is not None and doc_hash:
+            with timed("text_store"):
+                for idx, h in enumerate(hashes):
+                    if pages[idx] is not None:
+                        store.link_page(doc_hash, page_numbers[idx] if page_numbers else idx, h)
+
+    page_count = max(1, sum(image is not None for image in images))
+    shared = {stage: seconds / page_count for stage, seconds in chunk_timings.items()}
+
+    results = []
+    for idx, page in enumerate(pages):
+        if page is None:
+            results.append(None)
+            continue
+        try:
+            with collect() as page_timings:
+                result = parse_rib(page.text, layout=page).dict()
+            result["ocr_profile"] = profile
+            result["timings"] = merge_timings(shared, page_timings)
+            results.append(result)
+        except Exception as e:
+            print(f"Error parsing page {idx}: {e}")
+            results.append(None)
+    return results
+
+
+def merge_timings(*timings: Optional[dict]) -> dict:
+    """Sum of several {stage: seconds} dicts."""
+    merged: dict = {}
+    for part in timings:
+        for stage, seconds in (part or {}).items():
+            merged[stage] = merged.get(stage, 0.0) + seconds
+    return merged
+
+
+def reparse_stored(doc_hash: Optional[str] = None, limit: Optional[int] = None) -> Iterator[dict]:
+    """
+    Re-run parse_rib over the stored OCR text of documents, without OCR.
+    Yields {"doc_hash", "page_number", "result"} per stored page.
+    """
+    store = get_text_store()
+    if store is None:
+        raise RuntimeError("OCR text store is disabled (set RIB_TEXT_STORE)")
+    for doc, page_index, page in store.iter_pages(doc_hash=doc_hash, limit=limit):
+        try:
+            result = parse_rib(page.text, layout=page).dict()
+        except Exception as e:
+            print(f"Error reparsing {doc} page {page_index}: {e}")
+            continue
+        yield {"doc_hash": doc, "page_number": page_index + 1, "result": result}
@@ -0,0 +1,117 @@
+"""
+Persistent store of the raw OCR result of every page (text, and word
+boxes/confidences when the page came from DocTR).
+
+Results are keyed by the hash of the page image and the OCR model identity,
+so a page is never recognized twice by the same model. Documents keep a
+link to their pages, which lets `reparse` re-run parse_rib on an archive
+without touching DocTR.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Iterator, Optional
+import numpy as np
+from app.core import config
+from app.services.layout import OcrPage
+
+
+def image_hash(image: np.ndarray) -> str:
+    """SHA-256 of the pixels and shape of a page image."""
+    digest = hashlib.sha256(str(image.shape).encode())
+    digest.update(memoryview(np.ascontiguousarray(image)).cast("B"))
+    return digest.hexdigest()
+
+
+class OcrTextStore:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # Several worker processes may share the file
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS ocr_text ("
+            "image_hash TEXT NOT NULL, model_id TEXT NOT NULL, created REAL NOT NULL, text BLOB NOT NULL, "
+            "PRIMARY KEY (image_hash, model_id))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS document_pages ("
+            "doc_hash TEXT NOT NULL, page_index INTEGER NOT NULL, image_hash TEXT NOT NULL, "
+            "PRIMARY KEY (doc_hash, page_index))"
+        )
+        # Stores created before word geometry was kept
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(ocr_text)")}
+        if "layout" not in columns:
+            self._db.execute("ALTER TABLE ocr_text ADD COLUMN layout BLOB")
+        self._db.commit()
+
+    def get(self, img_hash: str, model_id: str = config.OCR_MODEL_ID) -> Optional[OcrPage]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT text, layout FROM ocr_text WHERE image_hash = ? AND model_id = ?", (img_hash, model_id)
+            ).fetchone()
+        return self._page(*row) if row else None
+
+    def put(self, img_hash: str, page: OcrPage, model_id: str = config.OCR_MODEL_ID):
+        blob = zlib.compress(page.text.encode("utf-8"), 6)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO ocr_text (image_hash, model_id, created, text, layout) VALUES (?, ?, ?, ?, ?)",
+                (img_hash, model_id, time.time(), blob, page.layout_bytes()),
+            )
+            self._db.commit()
+
+    @staticmethod
+    def _page(text_blob: bytes, layout: Optional[bytes]) -> OcrPage:
+        return OcrPage.from_stored(zlib.decompress(text_blob).decode("utf-8"), layout)
+
+    def link_page(self, doc_hash: str, page_index: int, img_hash: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO document_pages (doc_hash, page_index, image_hash) VALUES (?, ?, ?)",
+                (doc_hash, page_index, img_hash),
+            )
+            self._db.commit()
+
+    def iter_pages(self, model_id: str = config.OCR_MODEL_ID, doc_hash: Optional[str] = None,
+                   limit: Optional[int] = None) -> Iterator[tuple[str, int, OcrPage]]:
+        """Yield (doc_hash, page_index, page) of stored document pages."""
+        query = (
+            "SELECT d.doc_hash, d.page_index, t.text, t.layout FROM document_pages d "
+            "JOIN ocr_text t ON t.image_hash = d.image_hash AND t.model_id = ?"
+        )
+        params: list = [model_id]
+        if doc_hash:
+            query += " WHERE d.doc_hash = ?"
+            params.append(doc_hash)
+        query += " ORDER BY d.doc_hash, d.page_index"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        # Separate cursor on a private connection: the caller may be slow to consume
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            for doc, page_index, blob, layout in db.execute(query, params):
+                yield doc, page_index, self._page(blob, layout)
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            texts = self._db.execute("SELECT COUNT(*) FROM ocr_text").fetchone()[0]
+            documents = self._db.execute("SELECT COUNT(DISTINCT doc_hash) FROM document_pages").fetchone()[0]
+        return {"texts": texts, "documents": documents}
+
+
+_store: OcrTextStore | None = None
+
+
+def get_text_store() -> Optional[OcrTextStore]:
+    """Shared store, or None when RIB_TEXT_STORE is not set."""
+    global _store
+    if _store is None and config.TEXT_STORE_PATH:
+        _store = OcrTextStore(config.TEXT_STORE_PATH)
+    return _store
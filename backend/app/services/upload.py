@@ -0,0 +1,252 @@
+"""
+Uploaded files spooled to disk.
+
+The multipart request body is parsed while it is received: each file part
+is written straight to its own temporary file, hashed on the way and cut
+off at the size limit, so an oversized upload is never stored in full and
+no file is copied twice. PDFs are then opened from their path and images
+decoded through a memory map.
+"""
+import hashlib
+import os
+import tempfile
+from typing import Optional
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from python_multipart.multipart import MultipartParser, parse_options_header
+from app.core import config
+
+# Form fields other than files (file_ids, priority) are small
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class InvalidUpload(Exception):
+    pass
+
+
+class SpooledUpload:
+    """Temporary copy of an upload, removed by close()."""
+
+    def __init__(self, path: str, size: int, sha256: str, filename: Optional[str], content_type: Optional[str],
+                 error: Optional[str] = None):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+        self.content_type = content_type
+        # Set instead of a copy when the file was not stored (too large)
+        self.error = error
+
+    @property
+    def is_pdf(self) -> bool:
+        return self.content_type == "application/pdf"
+
+    def close(self):
+        if not self.path:
+            return
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def max_upload_bytes() -> int:
+    return config.MAX_UPLOAD_MB * 1024 * 1024
+
+
+def too_large_message(limit: int) -> str:
+    return f"File larger than {limit // (1024 * 1024)} MB"
+
+
+class _FilePart:
+    """File part being received: its temporary file and running hash."""
+
+    def __init__(self, field: str, filename: str, content_type: Optional[str], directory: Optional[str]):
+        self.field = field
+        self.filename = filename
+        self.content_type = content_type
+        fd, self.path = tempfile.mkstemp(prefix="rib-", dir=directory or None)
+        self.target = os.fdopen(fd, "wb")
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.error = None
+
+    def write(self, data: bytes):
+        if self.error is None:
+            self.digest.update(data)
+            self.target.write(data)
+
+    def discard(self, error: str):
+        self.error = error
+        self.target.close()
+        _remove(self.path)
+
+    def upload(self) -> SpooledUpload:
+        if self.error is not None:
+            return SpooledUpload("", self.size, "", self.filename, self.content_type, self.error)
+        self.target.close()
+        return SpooledUpload(self.path, self.size, self.digest.hexdigest(), self.filename, self.content_type)
+
+
+def _remove(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class ReceivedForm:
+    """Files and text fields of a multipart request, in request order."""
+
+    def __init__(self, files: list[tuple[str, SpooledUpload]], fields: list[tuple[str, str]]):
+        self._files = files
+        self._fields = fields
+
+    def uploads(self, name: str) -> list[SpooledUpload]:
+        return [upload for field, upload in self._files if field == name]
+
+    def values(self, name: str) -> list[str]:
+        return [value for field, value in self._fields if field == name]
+
+    def close(self):
+        for _, upload in self._files:
+            upload.close()
+
+
+class _UploadReceiver:
+    """python-multipart callbacks writing file parts to their spool files."""
+
+    def __init__(self, directory: Optional[str], limit: int, skip_too_large: bool, max_files: Optional[int]):
+        self.directory = directory
+        self.limit = limit
+        self.skip_too_large = skip_too_large
+        self.max_files = max_files
+        # Closing boundary seen: the body was not cut off
+        self.complete = False
+        self.parts: list[_FilePart] = []
+        self.fields: list[tuple[str, str]] = []
+        # Data of the current chunk, written in the threadpool once the chunk is parsed
+        self.pending: list[tuple[_FilePart, bytes]] = []
+        self._headers: dict[bytes, bytes] = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._file: Optional[_FilePart] = None
+        self._field: Optional[tuple[str, bytearray]] = None
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_end": self.on_end,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        if b"name" not in options:
+            raise InvalidUpload('Form part without a "name"')
+        name = options[b"name"].decode("utf-8", "replace")
+        if b"filename" in options:
+            if self.max_files is not None and len(self.parts) >= self.max_files:
+                raise InvalidUpload(f"At most {self.max_files} file(s) per request")
+            content_type = self._headers.get(b"content-type")
+            self._file = _FilePart(name, options[b"filename"].decode("utf-8", "replace"),
+                                   content_type.decode("latin-1") if content_type else None, self.directory)
+            self.parts.append(self._file)
+        else:
+            self._file = None
+            self._field = (name, bytearray())
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._file is None:
+            self._field[1].extend(data[start:end])
+            if len(self._field[1]) > MAX_FIELD_BYTES:
+                raise InvalidUpload(f"Form field {self._field[0]} too large")
+            return
+        part = self._file
+        part.size += end - start
+        if part.error is not None:
+            return
+        if self.limit and part.size > self.limit:
+            if not self.skip_too_large:
+                raise UploadTooLarge(f"{part.filename}: {too_large_message(self.limit)}")
+            # Rest of the file read from the request but not stored
+            self.pending = [(pending, chunk) for pending, chunk in self.pending if pending is not part]
+            part.discard(too_large_message(self.limit))
+            return
+        self.pending.append((part, data[start:end]))
+
+    def on_part_end(self):
+        if self._file is None:
+            self.fields.append((self._field[0], self._field[1].decode("utf-8", "replace")))
+        self._file = self._field = None
+
+    def on_end(self):
+        self.complete = True
+
+    def flush(self):
+        for part, data in self.pending:
+            part.write(data)
+        self.pending = []
+
+
+async def receive_uploads(request: Request, directory: Optional[str] = None, limit: Optional[int] = None,
+                          skip_too_large: bool = False, max_files: Optional[int] = None) -> ReceivedForm:
+    """
+    Read a multipart/form-data request, spooling its files to temporary
+    files in `directory` (RIB_UPLOAD_DIR by default). A file over `limit`
+    bytes (RIB_MAX_UPLOAD_MB) raises UploadTooLarge as soon as the limit is
+    reached or, with `skip_too_large`, is dropped and returned with its
+    `error` set. With `max_files`, a Content-Length above what these files
+    may weigh is rejected before reading the body. Raises InvalidUpload on
+    a malformed body.
+    """
+    limit = max_upload_bytes() if limit is None else limit
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise InvalidUpload("Expected a multipart/form-data body")
+    length = request.headers.get("content-length", "")
+    if (limit and max_files is not None and not skip_too_large and length.isdigit()
+            and int(length) > max_files * limit + MAX_FIELD_BYTES):
+        raise UploadTooLarge(too_large_message(limit))
+
+    receiver = _UploadReceiver(directory or config.UPLOAD_DIR or None, limit, skip_too_large, max_files)
+    parser = MultipartParser(options[b"boundary"], receiver.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            # Disk writes and hashing off the event loop, once per received chunk
+            if receiver.pending:
+                await run_in_threadpool(receiver.flush)
+        parser.finalize()
+        if not receiver.complete:
+            raise InvalidUpload("Truncated multipart body")
+    except BaseException as e:
+        for part in receiver.parts:
+            part.target.close()
+            _remove(part.path)
+        if isinstance(e, ValueError):
+            raise InvalidUpload(f"Malformed multipart body: {e}") from e
+        raise
+    return ReceivedForm([(part.field, part.upload()) for part in receiver.parts], receiver.fields)
@@ -0,0 +1,100 @@
+"""
+Background warm-up of the OCR model and readiness state.
+
+The server starts answering as soon as it is bound; the models of the
+default OCR profile (and of the background jobs and cascade profiles) are
+loaded and exercised once in a background thread, in every worker process with
+RIB_EXECUTOR=process. /health/ready only succeeds once this is done.
+Profiles only asked by some requests are loaded on first use.
+"""
+import os
+import threading
+import time
+from typing import Optional
+from app.core import config
+from app.services.executor import PipelineExecutor
+from app.services.ocr import OCRService, warm_up_model
+
+
+# Process mode: give up waiting for every worker to answer after this long
+PROCESS_WARMUP_TIMEOUT = 900
+
+
+def warmup_profiles() -> list[str]:
+    """Default and jobs profiles, each preceded by its cascade profile."""
+    profiles = [config.OCR_PROFILE]
+    if config.JOBS_DB_PATH:
+        profiles.append(config.JOB_OCR_PROFILE)
+    profiles = [name for profile in profiles for name in (config.cascade_profile(profile), profile) if name]
+    return list(dict.fromkeys(profiles))
+
+
+def _warm_up_worker(profiles: list[str]) -> int:
+    for profile in profiles:
+        warm_up_model(profile)
+    return os.getpid()
+
+
+class Readiness:
+    """State of the OCR model: cold -> loading -> ready | failed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = "cold"
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        if self.state == "cold" and OCRService.is_loaded():
+            # Warm-up disabled: ready once a request loaded the model
+            return True
+        return self.state == "ready"
+
+    def start(self, executor: PipelineExecutor):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = "loading"
+            self._thread = threading.Thread(target=self._run, args=(executor,), name="rib-warmup", daemon=True)
+            self._thread.start()
+
+    def _run(self, executor: PipelineExecutor):
+        started = time.perf_counter()
+        profiles = warmup_profiles()
+        try:
+            if executor.mode == "process":
+                # Each worker process loads its own model (one at a time, see
+                # executor): submit rounds until every one of them has answered
+                warmed = set()
+                while len(warmed) < executor.max_workers:
+                    if time.perf_counter() - started > PROCESS_WARMUP_TIMEOUT:
+                        raise TimeoutError(f"only {len(warmed)}/{executor.max_workers} OCR workers answered")
+                    if warmed:
+                        time.sleep(1)
+                    futures = [executor.pool.submit(_warm_up_worker, profiles) for _ in range(executor.max_workers)]
+                    warmed.update(future.result() for future in futures)
+            else:
+                _warm_up_worker(profiles)
+        except Exception as e:
+            print(f"OCR warm-up failed: {e}")
+            self.error = str(e)
+            self.state = "failed"
+            return
+        self.seconds = round(time.perf_counter() - started, 2)
+        self.state = "ready"
+        print(f"OCR model ready ({self.seconds} s)")
+
+    def stats(self) -> dict:
+        return {"ready": self.ready, "state": "ready" if self.ready else self.state,
+                "warmup_seconds": self.seconds, "error": self.error,
+                "profile": config.OCR_PROFILE, "job_profile": config.JOB_OCR_PROFILE if config.JOBS_DB_PATH else None,
+                "offline_models": config.OCR_MODELS_DIR or None}
+
+
+_readiness = Readiness()
+
+
+def get_readiness() -> Readiness:
+    return _readiness
@@ -0,0 +1,91 @@
+"""
+Microbenchmark: IBAN candidate validation on noisy OCR text.
+
+Compares the previous approach (schwifty at every length from 34 down to
+15, exception-driven) with the arithmetic pre-check at the country length.
+
+Usage (from backend/):
+    python benchmarks/bench_iban_validation.py [--pages 200]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.checksum import IBAN_LENGTHS, is_plausible_iban
+from app.services.parser import validate_iban_checksum, is_valid_iban, parse_rib
+
+RE_CANDIDATES = re.compile(r'(?=([A-Z]{2}\d{2}[A-Z0-9]{10,30}))')
+
+
+def noisy_page(rng: random.Random) -> str:
+    """A statement-like page: transaction lines full of IBAN-like noise."""
+    lines = []
+    for _ in range(40):
+        ref = ''.join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789") for _ in range(rng.randint(10, 30)))
+        country = rng.choice(list(IBAN_LENGTHS))
+        lines.append(f"VIR SEPA {country}{rng.randint(10, 99)}{ref} {rng.randint(1, 9999)},{rng.randint(0, 99):02d}")
+    lines.append("IBAN FR76 3000 4000 0312 3456 7890 143")
+    return "\n".join(lines)
+
+
+def candidates_of(text: str) -> list[str]:
+    nospace = re.sub(r'[^A-Z0-9]', '', text.upper())
+    return [c for c in RE_CANDIDATES.findall(nospace) if c[:2] in IBAN_LENGTHS]
+
+
+def legacy_scan(candidates: list[str]) -> int:
+    found = 0
+    for candidate in candidates:
+        for length in range(min(len(candidate), 34), 14, -1):
+            if validate_iban_checksum(candidate[:length])[0]:
+                found += 1
+                break
+    return found
+
+
+def fast_scan(candidates: list[str]) -> int:
+    found = 0
+    for candidate in candidates:
+        length = IBAN_LENGTHS[candidate[:2]]
+        if len(candidate) >= length and is_valid_iban(candidate[:length]):
+            found += 1
+    return found
+
+
+def timed(fn, *args) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pages = [noisy_page(rng) for _ in range(args.pages)]
+    candidates = [c for page in pages for c in candidates_of(page)]
+    checks = sum(min(len(c), 34) - 14 for c in candidates)
+
+    legacy_time, legacy_found = timed(legacy_scan, candidates)
+    fast_time, fast_found = timed(fast_scan, candidates)
+    mod97_time, _ = timed(lambda: [is_plausible_iban(c[:IBAN_LENGTHS[c[:2]]]) for c in candidates])
+    parse_time, _ = timed(lambda: [parse_rib(page) for page in pages])
+
+    print(f"{len(pages)} pages, {len(candidates)} candidates ({checks} legacy length checks)")
+    print(f"legacy schwifty scan : {legacy_time * 1000:9.1f} ms  ({legacy_found} valid)")
+    print(f"mod-97 pre-check scan: {fast_time * 1000:9.1f} ms  ({fast_found} valid)")
+    print(f"  arithmetic only    : {mod97_time * 1000:9.1f} ms")
+    print(f"speedup              : {legacy_time / fast_time:9.1f}x")
+    print(f"parse_rib            : {parse_time / len(pages) * 1000:9.2f} ms/page")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""
+Benchmark suite of the extraction pipeline, results saved as JSON.
+
+Sections:
+- parse:      parse_rib throughput and accuracy on synthetic RIB texts
+              (clean and OCR-damaged IBANs)
+- render:     PDF page rendering throughput and memory allocated per
+              rendered page (synthetic scans and
+              frontend/ressources/RIB_TEST_ISO_*.pdf)
+- preprocess: cost of each preprocessing preset per resolution
+- profiles:   IBAN accuracy and OCR latency of each OCR model profile
+              (accurate, balanced, fast, fast-int8) on the same scans
+- e2e:        /api/v1/analyze latency percentiles under concurrent load
+              (in-process app with the real OCR model, or --url)
+Peak RSS is recorded for each section. The result cache and the OCR text
+store are disabled so every request runs the pipeline.
+
+Usage (from backend/):
+    python benchmarks/bench_pipeline.py --output bench.json
+    python benchmarks/bench_pipeline.py --only parse,render --compare bench.json
+    python benchmarks/bench_pipeline.py --only profiles --profiles accurate,fast-int8
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Measure the pipeline, not the caches (read by app.core.config at import)
+os.environ["RIB_CACHE_SIZE"] = "0"
+os.environ["RIB_CACHE_DB"] = ""
+os.environ["RIB_TEXT_STORE"] = ""
+os.environ["RIB_JOBS_DB"] = ""
+
+from app.core import config
+from app.services.image import close_pdf, open_pdf, preprocess_image, render_pdf_page, to_rgb
+from app.services.parser import parse_rib
+from benchmarks.synthetic import CORRUPTIONS, make_ribs, render_page, write_corpus
+
+SECTIONS = ("parse", "render", "preprocess", "profiles", "e2e")
+ISO_PDFS = sorted(glob.glob(os.path.join(BACKEND_DIR, "..", "frontend", "ressources", "RIB_TEST_ISO_*.pdf")))
+
+
+def percentiles(values: list[float]) -> dict:
+    """p50/p90/p99/max of durations in seconds, as milliseconds."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def at(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {name: round(at(fraction) * 1000, 2)
+            for name, fraction in (("p50_ms", 0.5), ("p90_ms", 0.9), ("p99_ms", 0.99), ("max_ms", 1.0))}
+
+
+def reset_peak_rss():
+    """Linux: restart the peak RSS (VmHWM) of this process so each section gets its own."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> dict:
+    """
+    Peak resident memory of this process (since the last reset on Linux,
+    process lifetime elsewhere) and of its finished children (worker processes).
+    """
+    peaks = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    peaks["self"] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return peaks
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    peaks.setdefault("self", round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1))
+    peaks["children"] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1)
+    return peaks
+
+
+def bench_parse(count: int, seed: int) -> dict:
+    ribs = make_ribs(count, seed)
+    parse_rib(ribs[0].text)  # warm-up (reference data, numpy tables)
+    by_kind = {kind: {"durations": [], "found": 0} for kind in CORRUPTIONS}
+    started = time.perf_counter()
+    for rib in ribs:
+        page_start = time.perf_counter()
+        result = parse_rib(rib.text)
+        stats = by_kind[rib.corruption]
+        stats["durations"].append(time.perf_counter() - page_start)
+        stats["found"] += result.data.iban == rib.iban
+    elapsed = time.perf_counter() - started
+
+    results = {"pages": count, "pages_per_s": round(count / elapsed, 1)}
+    for kind, stats in by_kind.items():
+        if stats["durations"]:
+            results[kind] = {"accuracy": round(stats["found"] / len(stats["durations"]), 3),
+                             **percentiles(stats["durations"])}
+    return results
+
+
+def render_all(path: str) -> tuple[int, float]:
+    pdf = open_pdf(path)
+    if pdf is None:
+        return 0, 0.0
+    try:
+        started = time.perf_counter()
+        for page_num in range(len(pdf)):
+            render_pdf_page(pdf, page_num, config.RENDER_SCALE, None, config.RENDER_MAX_SIDE)
+        return len(pdf), time.perf_counter() - started
+    finally:
+        close_pdf(pdf)
+
+
+def allocated_mb(fn, *args) -> tuple[float, float]:
+    """
+    (peak MB allocated during the call, MB of its result) as seen by
+    tracemalloc: numpy and ctypes buffers, not the internals of PIL.
+    """
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = fn(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return round((peak - baseline) / 1e6, 2), round(getattr(result, "nbytes", 0) / 1e6, 2)
+
+
+def render_allocations(path: str) -> tuple[float, float]:
+    """allocated_mb of rendering the first page of a PDF."""
+    pdf = open_pdf(path)
+    try:
+        return allocated_mb(render_pdf_page, pdf, 0, config.RENDER_SCALE, None, config.RENDER_MAX_SIDE)
+    finally:
+        close_pdf(pdf)
+
+
+def bench_render(corpus: list[dict]) -> dict:
+    results = {"scale": config.RENDER_SCALE, "max_side": config.RENDER_MAX_SIDE}
+    documents = [(os.path.basename(item["path"]), item["path"]) for item in corpus if item["kind"] == "scanned_pdf"]
+    documents += [(os.path.basename(path), path) for path in ISO_PDFS]
+    total_pages, total_time = 0, 0.0
+    for name, path in documents:
+        pages, elapsed = render_all(path)
+        if pages:
+            peak_mb, page_mb = render_allocations(path)
+            results[name] = {"pages": pages, "ms_per_page": round(elapsed / pages * 1000, 2),
+                             "page_mb": page_mb, "allocated_mb_per_page": peak_mb}
+            total_pages += pages
+            total_time += elapsed
+    results["pages_per_s"] = round(total_pages / total_time, 1) if total_time else None
+    return results
+
+
+def bench_preprocess(dpis: list[int], repeat: int, seed: int) -> dict:
+    from app.services.image import PREPROCESS_PRESETS
+
+    rng = random.Random(seed)
+    rib = make_ribs(1, seed)[0]
+    results = {}
+    for dpi in dpis:
+        page = to_rgb(render_page(rib, dpi, rng))
+        results[f"{dpi}dpi"] = row = {"shape": list(page.shape[:2])}
+        for preset in PREPROCESS_PRESETS:
+            durations = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                preprocess_image(page, preset)
+                durations.append(time.perf_counter() - started)
+            row[preset] = round(statistics.median(durations) * 1000, 2)
+    return results
+
+
+def bench_profiles(profiles: list[str], count: int, dpi: int, seed: int) -> dict:
+    """Per-page pipeline latency and IBAN accuracy of each OCR profile, all on the same scanned pages."""
+    from app.services.pipeline import process_pages
+
+    rng = random.Random(seed)
+    ribs = make_ribs(count, seed, corruptions=("clean",))
+    pages = [to_rgb(render_page(rib, dpi, rng)) for rib in ribs]
+    results = {"pages": count, "dpi": dpi}
+    for profile in profiles:
+        started = time.perf_counter()
+        try:
+            process_pages(pages[:1], 1, profile=profile)  # model loading is reported apart
+        except Exception as e:
+            print(f"Skipping profile {profile}: {e}")
+            results[profile] = {"error": str(e)}
+            continue
+        load_seconds = time.perf_counter() - started
+        durations, found = [], 0
+        for rib, page in zip(ribs, pages):
+            page_start = time.perf_counter()
+            result = process_pages([page], 1, profile=profile)[0]
+            durations.append(time.perf_counter() - page_start)
+            found += result is not None and result["data"]["iban"] == rib.iban
+        results[profile] = {"load_s": round(load_seconds, 2), "accuracy": round(found / count, 3),
+                            "pages_per_s": round(count / sum(durations), 2), **percentiles(durations)}
+    return results
+
+
+def post_file(client, url: str, path: str) -> tuple[float, int]:
+    content_type = "application/pdf" if path.endswith(".pdf") else "image/png"
+    with open(path, "rb") as f:
+        data = f.read()
+    started = time.perf_counter()
+    response = client.post(url, files={"file": (os.path.basename(path), data, content_type)})
+    # The whole NDJSON stream is read before the clock stops
+    _ = response.text
+    return time.perf_counter() - started, response.status_code
+
+
+def bench_e2e(corpus: list[dict], concurrency_levels: list[int], requests: int, url: str | None) -> dict:
+    files = [item["path"] for item in corpus if item["pages"] <= 5] + ISO_PDFS
+    results = {"executor": config.EXECUTOR_MODE, "max_workers": config.MAX_WORKERS, "files": len(files)}
+
+    endpoint = "/api/v1/analyze"
+    if url:
+        import httpx
+        client_factory = lambda: httpx.Client(base_url=url, timeout=600)
+    else:
+        from fastapi.testclient import TestClient
+        from app.main import app
+        shared = TestClient(app)
+        shared.__enter__()
+        client_factory = lambda: shared
+
+    try:
+        client = client_factory()
+        # Warm-up: model loading is not part of the latency
+        post_file(client, endpoint, files[0])
+        for concurrency in concurrency_levels:
+            local = threading.local()
+
+            def one(idx: int):
+                if not hasattr(local, "client"):
+                    local.client = client_factory()
+                return post_file(local.client, endpoint, files[idx % len(files)])
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                outcomes = list(pool.map(one, range(requests)))
+            elapsed = time.perf_counter() - started
+            ok = [duration for duration, status in outcomes if status == 200]
+            results[f"concurrency_{concurrency}"] = {
+                "requests": requests,
+                "ok": len(ok),
+                "rejected_503": sum(status == 503 for _, status in outcomes),
+                "requests_per_s": round(requests / elapsed, 2),
+                **percentiles(ok),
+            }
+    finally:
+        if not url:
+            shared.__exit__(None, None, None)
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def flatten(data: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(previous: dict, current: dict, threshold: float):
+    """Print the numeric results that changed by more than `threshold` (fraction)."""
+    old, new = flatten(previous["results"]), flatten(current["results"])
+    print(f"\nCompared with {previous.get('revision')} ({previous.get('date')}):")
+    for name in sorted(old.keys() & new.keys()):
+        if old[name] and abs(new[name] - old[name]) / abs(old[name]) > threshold:
+            print(f"  {name:60s} {old[name]:>10} -> {new[name]:>10} ({(new[name] / old[name] - 1) * 100:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--only", default=",".join(SECTIONS), help="Comma-separated sections to run")
+    parser.add_argument("--output", help="JSON file receiving the results")
+    parser.add_argument("--compare", help="Previous JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=10, help="Changes (%%) reported by --compare")
+    parser.add_argument("--workdir", help="Where the synthetic documents are written (temporary by default)")
+    parser.add_argument("--parse-pages", type=int, default=400)
+    parser.add_argument("--dpi", default="100,150,300")
+    parser.add_argument("--page-counts", default="1,5,20")
+    parser.add_argument("--profiles", default="accurate,balanced,fast,fast-int8", help="OCR profiles compared")
+    parser.add_argument("--profile-pages", type=int, default=20, help="Scanned pages per OCR profile")
+    parser.add_argument("--concurrency", default="1,4,8")
+    parser.add_argument("--requests", type=int, default=24, help="Requests per concurrency level")
+    parser.add_argument("--url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sections = [name for name in args.only.split(",") if name]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+    dpis = [int(value) for value in args.dpi.split(",")]
+    profiles = [value.strip().lower() for value in args.profiles.split(",") if value.strip()]
+    for profile in profiles:
+        try:
+            config.ocr_profile(profile)
+        except ValueError as e:
+            parser.error(str(e))
+    page_counts = [int(value) for value in args.page_counts.split(",")]
+
+    report = {
+        "revision": git_revision(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "pipeline_version": config.PIPELINE_VERSION,
+        "ocr_profile": config.OCR_PROFILE,
+        "results": {},
+        "peak_rss_mb": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="rib-bench-") as tmp:
+        corpus = []
+        if {"render", "e2e"} & set(sections):
+            corpus = write_corpus(args.workdir or tmp, dpis, page_counts, args.seed)
+        for name in sections:
+            print(f"Running {name}...", flush=True)
+            reset_peak_rss()
+            started = time.perf_counter()
+            if name == "parse":
+                result = bench_parse(args.parse_pages, args.seed)
+            elif name == "render":
+                result = bench_render(corpus)
+            elif name == "preprocess":
+                result = bench_preprocess(dpis, 5, args.seed)
+            elif name == "profiles":
+                result = bench_profiles(profiles, args.profile_pages, 150, args.seed)
+            else:
+                result = bench_e2e(corpus, [int(value) for value in args.concurrency.split(",")],
+                                   args.requests, args.url)
+            result["seconds"] = round(time.perf_counter() - started, 2)
+            report["results"][name] = result
+            report["peak_rss_mb"][name] = peak_rss_mb()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report, args.threshold / 100)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Synthetic RIB documents for the benchmarks.
+
+Every RIB gets a random French account with a valid RIB key and IBAN, and
+can be damaged the way OCR damages them (confusable letters, a wrong
+digit, a dropped or doubled character) before being laid out as text,
+rendered as a page image at a given DPI, or saved as an image-only
+("scanned") multi-page PDF.
+"""
+import os
+import random
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.services.checksum import iban_check_digits
+
+# (bank code, BIC, bank name) of the reference data
+BANKS = (
+    ("30004", "BNPAFRPPXXX", "BNP PARIBAS"),
+    ("30002", "CRLYFRPPXXX", "LCL"),
+    ("30003", "SOGEFRPPXXX", "SOCIETE GENERALE"),
+    ("20041", "PSSTFRPPXXX", "LA BANQUE POSTALE"),
+    ("10278", "CMCIFR2AXXX", "CREDIT MUTUEL"),
+)
+OWNERS = ("M JEAN DUPONT", "MME MARIE CURIE", "SARL LES ATELIERS REUNIS", "M PAUL MARTIN", "MLLE ANNE LEROY")
+
+# Damage applied to the IBAN before layout
+CORRUPTIONS = ("clean", "letters", "digit", "indel")
+# Digits OCR reads as letters
+DIGIT_LOOKALIKES = {"0": "O", "1": "I", "2": "Z", "5": "S", "8": "B", "6": "G"}
+# Digits OCR mistakes for other digits
+DIGIT_SWAPS = {"3": "8", "8": "3", "1": "7", "7": "1", "6": "5", "5": "6", "0": "8"}
+
+# A4 page, inches
+PAGE_SIZE = (8.27, 11.69)
+
+
+@dataclass
+class SyntheticRib:
+    iban: str
+    bic: str
+    owner: str
+    bank: str
+    corruption: str
+    text: str
+
+
+def rib_key(bank: str, branch: str, account: str) -> str:
+    return f"{97 - (89 * int(bank) + 15 * int(branch) + 3 * int(account)) % 97:02d}"
+
+
+def corrupt(iban: str, kind: str, rng: random.Random) -> str:
+    """Damage the BBAN part of an IBAN (country and check digits kept readable)."""
+    if kind == "clean":
+        return iban
+    chars = list(iban)
+    body = range(4, len(chars))
+    if kind == "letters":
+        slots = [idx for idx in body if chars[idx] in DIGIT_LOOKALIKES]
+        for idx in rng.sample(slots, min(len(slots), rng.randint(1, 2))):
+            chars[idx] = DIGIT_LOOKALIKES[chars[idx]]
+    elif kind == "digit":
+        slots = [idx for idx in body if chars[idx] in DIGIT_SWAPS]
+        if slots:
+            idx = rng.choice(slots)
+            chars[idx] = DIGIT_SWAPS[chars[idx]]
+    elif kind == "indel":
+        idx = rng.choice(list(body))
+        if rng.random() < 0.5:
+            del chars[idx]
+        else:
+            chars.insert(idx, chars[idx])
+    else:
+        raise ValueError(f"Unknown corruption: {kind}")
+    return "".join(chars)
+
+
+def grouped(value: str) -> str:
+    return " ".join(value[idx:idx + 4] for idx in range(0, len(value), 4))
+
+
+def make_rib(rng: random.Random, corruption: str = "clean") -> SyntheticRib:
+    bank, bic, bank_name = rng.choice(BANKS)
+    branch = f"{rng.randint(0, 99999):05d}"
+    account = f"{rng.randint(0, 10 ** 11 - 1):011d}"
+    key = rib_key(bank, branch, account)
+    bban = bank + branch + account + key
+    iban = "FR" + iban_check_digits("FR", bban) + bban
+    read = corrupt(iban, corruption, rng)
+    owner = rng.choice(OWNERS)
+    text = "\n".join([
+        "RELEVE D'IDENTITE BANCAIRE",
+        f"TITULAIRE : {owner}",
+        f"DOMICILIATION : {bank_name}",
+        "Code banque Code guichet Numero de compte Cle RIB",
+        f"{bank} {branch} {account} {key}",
+        f"IBAN : {grouped(read)}",
+        f"BIC : {bic}",
+    ])
+    return SyntheticRib(iban, bic, owner, bank_name, corruption, text)
+
+
+def make_ribs(count: int, seed: int = 42, corruptions=CORRUPTIONS) -> list[SyntheticRib]:
+    rng = random.Random(seed)
+    return [make_rib(rng, corruptions[idx % len(corruptions)]) for idx in range(count)]
+
+
+def render_page(rib: SyntheticRib, dpi: int = 150, rng: random.Random | None = None) -> np.ndarray:
+    """
+    A4 page image (BGR) of the RIB text. With `rng`, the page looks scanned:
+    slight rotation, blur and noise.
+    """
+    width, height = int(PAGE_SIZE[0] * dpi), int(PAGE_SIZE[1] * dpi)
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    scale = dpi / 150 * 0.7
+    line_height = int(dpi * 0.35)
+    for idx, line in enumerate(rib.text.split("\n")):
+        origin = (int(dpi * 0.6), int(dpi * 1.2) + idx * line_height)
+        cv2.putText(page, line, origin, cv2.FONT_HERSHEY_SIMPLEX, scale, (20, 20, 20), max(1, dpi // 100), cv2.LINE_AA)
+    if rng is not None:
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), rng.uniform(-1.5, 1.5), 1.0)
+        page = cv2.warpAffine(page, matrix, (width, height), borderValue=(255, 255, 255))
+        page = cv2.GaussianBlur(page, (3, 3), 0)
+        noise = np.random.default_rng(rng.randint(0, 2 ** 32 - 1)).normal(0, 8, page.shape)
+        page = np.clip(page + noise, 0, 255).astype(np.uint8)
+    return page
+
+
+def write_pdf(path: str, pages: list[np.ndarray], dpi: int):
+    """Image-only PDF, one page per image."""
+    images = [Image.fromarray(cv2.cvtColor(page, cv2.COLOR_BGR2RGB)) for page in pages]
+    images[0].save(path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+
+
+def write_corpus(directory: str, dpis=(100, 150, 300), page_counts=(1, 5, 20), seed: int = 42) -> list[dict]:
+    """
+    Scanned PDFs for every (dpi, page count) plus one PNG per dpi.
+    Returns their descriptions: path, kind, dpi, pages and expected IBANs.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    corpus = []
+    for dpi in dpis:
+        rib = make_rib(rng)
+        path = os.path.join(directory, f"rib_{dpi}dpi.png")
+        cv2.imwrite(path, render_page(rib, dpi, rng))
+        corpus.append({"path": path, "kind": "image", "dpi": dpi, "pages": 1, "ibans": [rib.iban]})
+        for count in page_counts:
+            ribs = [make_rib(rng) for _ in range(count)]
+            path = os.path.join(directory, f"rib_{dpi}dpi_{count}p.pdf")
+            write_pdf(path, [render_page(r, dpi, rng) for r in ribs], dpi)
+            corpus.append({"path": path, "kind": "scanned_pdf", "dpi": dpi, "pages": count,
+                           "ibans": [r.iban for r in ribs]})
+    return corpus
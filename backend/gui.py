@@ -1,6 +1,7 @@
 import os
 import sys
 import threading
+import multiprocessing
 import time
 import webbrowser
 import tkinter as tk
@@ -196,13 +197,19 @@ class RibFactoryGUI:
     def check_ocr_status(self):
         """Check if OCR model is loaded and mark it as ready."""
         try:
-            from app.services.ocr import OCRService
-            # Check if the singleton instance exists and model is loaded
-            if OCRService._instance is not None and OCRService._model is not None:
+            from app.services.warmup import get_readiness
+            # Same readiness as /health/ready (model loaded and warmed up in the background)
+            readiness = get_readiness()
+            if readiness.ready:
                 self.ocr_status_ind.configure(fg=self.success_color)
                 self.ocr_status_txt.configure(text="IA OCR: Prêt")
                 # Stop checking once ready
                 return
+            elif readiness.state == "failed":
+                self.ocr_status_ind.configure(fg="#e74c3c")
+                self.ocr_status_txt.configure(text="IA OCR: Erreur")
+                print(f"Chargement du modèle OCR impossible : {readiness.error}")
+                return
             else:
                 self.ocr_status_ind.configure(fg=self.warning_color)
                 self.ocr_status_txt.configure(text="IA OCR: Chargement...")
@@ -234,6 +241,8 @@ class RibFactoryGUI:
             os._exit(0)
 
 if __name__ == "__main__":
+    # Required for the OCR worker processes (RIB_EXECUTOR=process) in the PyInstaller build
+    multiprocessing.freeze_support()
     root = tk.Tk()
     # Attempt to set a generic icon if possible, else skip
     try:
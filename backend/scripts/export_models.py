@@ -0,0 +1,46 @@
+"""
+Save the pretrained OCR weights to a directory for the offline mode
+(RIB_OCR_MODELS_DIR): Docker images and the PyInstaller build then load
+them from disk instead of downloading them on first start.
+
+Usage (from backend/):
+    python -m scripts.export_models models/
+    python -m scripts.export_models models/ --profiles accurate,fast
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    from app.core import config
+
+    parser = argparse.ArgumentParser(description="Export the DocTR weights for RIB_OCR_MODELS_DIR")
+    parser.add_argument("directory", help="Destination directory (<arch>.pt files)")
+    parser.add_argument("--profiles", default=",".join(dict.fromkeys([config.OCR_PROFILE, config.JOB_OCR_PROFILE])),
+                        help="Comma-separated OCR profiles, or 'all' (default: RIB_OCR_PROFILE and RIB_JOB_OCR_PROFILE)")
+    args = parser.parse_args()
+
+    import torch
+    from doctr.models import detection, recognition
+
+    names = list(config.OCR_PROFILES) if args.profiles == "all" else args.profiles.split(",")
+    try:
+        # Quantized profiles are built from the float weights at load time
+        archs = {arch: module for name in names
+                 for module, arch in zip((detection, recognition), config.ocr_profile(name.strip().lower())[:2])}
+    except ValueError as e:
+        parser.error(str(e))
+
+    os.makedirs(args.directory, exist_ok=True)
+    for arch, module in archs.items():
+        path = os.path.join(args.directory, f"{arch}.pt")
+        model = getattr(module, arch)(pretrained=True)
+        torch.save(model.state_dict(), path)
+        print(f"{arch}: {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Re-run parse_rib over the OCR text store, without OCR.
+
+Usage (from backend/):
+    python -m scripts.reparse --db ocr_text.db [--doc SHA256] [--limit N] [--output results.ndjson]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-parse stored OCR text without running DocTR")
+    parser.add_argument("--db", default=os.getenv("RIB_TEXT_STORE", ""), help="OCR text store (RIB_TEXT_STORE)")
+    parser.add_argument("--doc", help="Only this document (SHA-256 of the uploaded file)")
+    parser.add_argument("--limit", type=int, help="Maximum number of pages")
+    parser.add_argument("--output", help="Write one JSON line per page to this file")
+    args = parser.parse_args()
+
+    if not args.db:
+        parser.error("--db or RIB_TEXT_STORE is required")
+    os.environ["RIB_TEXT_STORE"] = args.db
+
+    from app.services.pipeline import reparse_stored
+
+    counts = Counter()
+    start = time.perf_counter()
+    out = open(args.output, "w", encoding="utf-8") if args.output else None
+    try:
+        for item in reparse_stored(args.doc, args.limit):
+            status = item["result"]["status"]
+            counts[getattr(status, "value", status)] += 1
+            if out:
+                out.write(json.dumps(item) + "\n")
+    finally:
+        if out:
+            out.close()
+    elapsed = time.perf_counter() - start
+
+    total = sum(counts.values())
+    print(f"{total} pages reparsed in {elapsed:.2f}s")
+    for status, count in sorted(counts.items()):
+        print(f"  {status}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,15 @@
-from schwifty import IBAN
-
-def check_iban(s):
-    try:
-        IBAN(s)
-        return True
-    except:
-        return False
+from app.services.correction import search_corrections
 
 # The raw sequence from OCR might be FR76300020734400000040895C79 (27 chars)
 raw = "FR76300020734400000040895C79"
 
-# Let's try replacing C with 0
-cand1 = raw.replace('C', '0')
-print(f"Trying {cand1}: {check_iban(cand1)}")
-
-# In the raw text, bank code 3000 is followed by 2... maybe it's 30002
-# FR76 3000 2 07344 00000 04089 5 C 79?
-# Wait, look at the digits: 3000 2 07344 00004 0895 C79
-digits = "3000207344000040895C79" # 22 chars?
-# Reconstructed needs 23 digits.
-# Maybe a 0 is missing?
-for i in range(len(digits)+1):
-    for digit in "0123456789":
-        test_digits = digits[:i] + digit + digits[i:]
-        if len(test_digits) == 23:
-            test_iban = "FR76" + test_digits.replace('C', '0')
-            if check_iban(test_iban):
-                print(f"MATCH FOUND: {test_iban}")
+# Ranked repairs: C read instead of 0, missing or extra digit, look-alike digits.
+# Several repairs at the same lowest cost are ambiguous: the parser keeps none.
+# Only letter repairs are verified by the checksum; the parser ignores the others.
+for correction in search_corrections(raw[:2], raw[2:]):
+    print(f"{correction.iban} (cost {correction.cost}): {', '.join(correction.edits) or 'as read'}")
 
-# Also try the raw 27-char if a digit was interpreted as a letter
-# FR76 3000 2 07344 0000 4 089 5 C 7 9 -> too many?
+# RIB printed without its IBAN: the check digits are computed
+digits = "300020734400000040B9590"
+for correction in search_corrections("FR", digits, check_digits=False):
+    print(f"{correction.iban} (cost {correction.cost}): {', '.join(correction.edits) or 'as read'}")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests run from backend/ like the app itself (imports are `app.…`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
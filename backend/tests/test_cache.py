@@ -0,0 +1,106 @@
+import asyncio
+
+from app.core import config
+from app.models.schemas import ValidationStatus
+from app.services import document
+from app.services.cache import ResultCache
+
+PAGES = [{"page_number": 1, "status": "valid"}, {"page_number": 2, "status": "invalid"}]
+
+
+def store(cache: ResultCache, doc_hash: str = "doc", profile=None):
+    for index, page in enumerate(PAGES):
+        cache.set_page(doc_hash, index, page, profile)
+    cache.set_page_count(doc_hash, len(PAGES), profile)
+
+
+def test_hit_and_miss():
+    cache = ResultCache(version="v1")
+    assert cache.get_document("doc") is None
+    store(cache)
+    assert cache.get_document("doc") == PAGES
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_incomplete_document_is_a_miss():
+    cache = ResultCache(version="v1")
+    # Pages stored as they are analyzed, the count only once all are in
+    cache.set_page("doc", 0, PAGES[0])
+    assert cache.get_document("doc") is None
+    cache.set_page_count("doc", 2)
+    assert cache.get_document("doc") is None
+
+
+def test_pipeline_version_invalidates_disk_entries(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    store(ResultCache(db_path=db_path, version="v1"))
+    assert ResultCache(db_path=db_path, version="v2").get_document("doc") is None
+    # Same version after a restart: served from SQLite
+    assert ResultCache(db_path=db_path, version="v1").get_document("doc") == PAGES
+
+
+def test_profiles_are_cached_apart():
+    assert config.pipeline_version("fast") != config.pipeline_version("accurate")
+    assert config.pipeline_version("fast") != config.pipeline_version("fast-int8")
+    other = next(profile for profile in config.OCR_PROFILES if profile != config.OCR_PROFILE)
+    cache = ResultCache()
+    store(cache, profile=other)
+    assert cache.get_document("doc") is None
+    assert cache.get_document("doc", config.OCR_PROFILE) is None
+    assert cache.get_document("doc", other) == PAGES
+    store(cache)
+    assert cache.get_document("doc", config.OCR_PROFILE) == PAGES
+
+
+def test_memory_tier_is_bounded():
+    cache = ResultCache(max_entries=3, version="v1")
+    store(cache, "first")
+    store(cache, "second")
+    assert cache.stats()["memory_entries"] == 3
+    assert cache.get_document("first") is None
+    assert cache.get_document("second") == PAGES
+
+
+def test_first_valid_prefix():
+    cache = ResultCache(version="v1")
+    cache.set_page("doc", 0, PAGES[0])
+    cache.set_page_count("doc", 1, first_valid=True)
+    # Only served to first_valid requests
+    assert cache.get_document("doc") is None
+    assert cache.get_document("doc", first_valid=True) == PAGES[:1]
+    store(cache)
+    assert cache.get_document("doc", first_valid=True) == PAGES
+
+
+def analyze(monkeypatch, cache, statuses, order=None):
+    """document_results in first_valid mode over pages of the given statuses, analyzed in `order`."""
+    class Source:
+        page_count = len(statuses)
+
+        def probe_order(self):
+            return order
+
+    async def stream_document(source, executor, doc_hash, profile, order, batch_size):
+        for idx in order or range(len(statuses)):
+            yield idx, {"status": statuses[idx], "checksum_valid": True, "rib_key_valid": True}
+
+    monkeypatch.setattr(document, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(document, "stream_document", stream_document)
+
+    async def run():
+        return [result async for result in document.document_results(
+            Source(), True, None, "doc", first_valid=True, probe=order is not None)]
+    return asyncio.run(run())
+
+
+def test_first_valid_run_is_cached(monkeypatch):
+    cache = ResultCache(version="v1")
+    statuses = [ValidationStatus.INVALID, ValidationStatus.VALID, ValidationStatus.INVALID]
+    assert len(analyze(monkeypatch, cache, statuses)) == 2
+    assert cache.get_document("doc") is None
+    assert [page["page_number"] for page in cache.get_document("doc", first_valid=True)] == [1, 2]
+
+    # Probed straight to page 2: page 1 was never analyzed, nothing to replay
+    cache = ResultCache(version="v1")
+    assert len(analyze(monkeypatch, cache, statuses, order=[1, 0, 2])) == 1
+    assert cache.get_document("doc", first_valid=True) is None
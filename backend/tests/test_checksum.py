@@ -0,0 +1,99 @@
+import random
+import string
+
+from schwifty import IBAN
+
+from app.services.checksum import IBAN_LENGTHS, iban_check_digits, is_plausible_iban, scan_ibans
+
+ALPHABET = string.digits + string.ascii_uppercase
+CORRECTIONS = {"O": "0", "I": "1", "S": "5", "B": "8"}
+
+
+def schwifty_valid(candidate: str) -> bool:
+    try:
+        IBAN(candidate)
+    except ValueError:
+        return False
+    return True
+
+
+def schwifty_checksum_ok(candidate: str) -> bool:
+    """schwifty's length and mod-97 checks (the BBAN format is confirmed by the parser afterwards)."""
+    try:
+        iban = IBAN(candidate, allow_invalid=True)
+        return len(candidate) == iban.spec.iban_length and iban.numeric % 97 == 1
+    except ValueError:
+        return False
+
+
+def random_iban(rng: random.Random) -> str:
+    country = rng.choice(sorted(IBAN_LENGTHS))
+    bban = ''.join(rng.choice(string.digits if rng.random() < 0.8 else ALPHABET)
+                   for _ in range(IBAN_LENGTHS[country] - 4))
+    return country + iban_check_digits(country, bban) + bban
+
+
+def random_text(rng: random.Random) -> str:
+    """Noise with valid IBANs, damaged ones and country-code look-alikes."""
+    parts = []
+    for _ in range(rng.randint(1, 6)):
+        kind = rng.random()
+        if kind < 0.4:
+            parts.append(random_iban(rng))
+        elif kind < 0.6:
+            iban = list(random_iban(rng))
+            iban[rng.randrange(4, len(iban))] = rng.choice(ALPHABET)
+            parts.append(''.join(iban))
+        else:
+            parts.append(rng.choice(sorted(IBAN_LENGTHS)) + ''.join(rng.choice(ALPHABET)
+                                                                      for _ in range(rng.randint(0, 40))))
+    return ''.join(parts)
+
+
+def brute_force(text: str) -> set:
+    """(start, iban) of every substring schwifty accepts as an IBAN."""
+    hits = set()
+    for start in range(len(text) - 3):
+        length = IBAN_LENGTHS.get(text[start:start + 2])
+        if length and start + length <= len(text) and schwifty_valid(text[start:start + length]):
+            hits.add((start, text[start:start + length]))
+    return hits
+
+
+def test_scan_matches_schwifty_on_random_texts():
+    rng = random.Random(12)
+    found = 0
+    for _ in range(300):
+        text = random_text(rng)
+        raw = {(hit.start, hit.iban) for hit in scan_ibans(text) if hit.correction == "none"}
+        # Nothing schwifty accepts is missed, nothing failing its checksum is reported
+        assert brute_force(text) <= raw, text
+        assert all(schwifty_checksum_ok(iban) for _, iban in raw), text
+        found += len(raw)
+    assert found > 100
+
+
+def test_ocr_letters_are_corrected_on_french_ibans():
+    rng = random.Random(13)
+    letters = str.maketrans({digit: letter for letter, digit in CORRECTIONS.items()})
+    for _ in range(300):
+        bban = ''.join(rng.choice(string.digits) for _ in range(23))
+        iban = "FR" + iban_check_digits("FR", bban) + bban
+        damaged = iban[:4] + bban.translate(letters)
+        hits = scan_ibans(damaged + "BIC", CORRECTIONS)
+        assert all(schwifty_checksum_ok(hit.iban) for hit in hits)
+        if damaged != iban:
+            assert iban in [hit.iban for hit in hits if hit.correction == "body"]
+
+
+def test_plausibility_matches_schwifty():
+    rng = random.Random(14)
+    for _ in range(2000):
+        candidate = random_iban(rng)
+        if rng.random() < 0.5:
+            chars = list(candidate)
+            chars[rng.randrange(len(chars))] = rng.choice(ALPHABET)
+            candidate = ''.join(chars)
+        assert is_plausible_iban(candidate) == schwifty_checksum_ok(candidate), candidate
+        if schwifty_valid(candidate):
+            assert is_plausible_iban(candidate)
@@ -0,0 +1,13 @@
+import sys
+
+from app.core import config
+
+
+def test_bundled_models_dir(tmp_path, monkeypatch):
+    assert config.bundled_models_dir() == ""
+    monkeypatch.setattr(sys, "frozen", True, raising=False)
+    monkeypatch.setattr(sys, "_MEIPASS", str(tmp_path), raising=False)
+    # Build without exported weights: download as before
+    assert config.bundled_models_dir() == ""
+    (tmp_path / "models").mkdir()
+    assert config.bundled_models_dir() == str(tmp_path / "models")
@@ -0,0 +1,116 @@
+import random
+
+from app.models.schemas import ValidationStatus
+from app.services.checksum import iban_check_digits
+from app.services.correction import best_correction, search_corrections
+from app.services.parser import is_valid_iban, parse_rib
+
+IBAN = "FR7630002073440000004089590"
+LOOKALIKES = {"0": "O", "1": "I", "2": "Z", "5": "S", "8": "B", "6": "G"}
+
+
+def random_iban(rng: random.Random) -> str:
+    bank, branch, account = (f"{rng.randrange(10 ** n):0{n}d}" for n in (5, 5, 11))
+    key = 97 - (89 * int(bank) + 15 * int(branch) + 3 * int(account)) % 97
+    bban = f"{bank}{branch}{account}{key:02d}"
+    return "FR" + iban_check_digits("FR", bban) + bban
+
+
+def damage(iban: str, rng: random.Random, count: int, confusions: dict) -> str:
+    chars = list(iban)
+    slots = [k for k in range(4, len(chars)) if chars[k] in confusions]
+    for k in rng.sample(slots, min(count, len(slots))):
+        chars[k] = confusions[chars[k]]
+    return "".join(chars)
+
+
+def test_single_letter_confusion_is_recovered():
+    read = IBAN[:14] + "O" + IBAN[15:]
+    correction = best_correction([("FR", read[2:], True)])
+    assert correction.iban == IBAN
+    assert correction.edits == ("O>0@14",)
+
+
+def test_double_letter_confusion_is_recovered():
+    read = IBAN.replace("8", "B").replace("5", "S")
+    correction = best_correction([("FR", read[2:], True)])
+    assert correction.iban == IBAN
+    assert len(correction.edits) == 2
+
+
+def test_rib_without_iban_gets_check_digits():
+    correction = best_correction([("FR", "300020734400000040B9590", False)])
+    assert correction.iban == IBAN
+    assert correction.check_computed
+
+
+def test_other_characters_are_never_verified():
+    # "E" of a label read for a digit: the RIB key alone happens to pass
+    window = "E4092231181161989283657IBANFR764092"
+    assert search_corrections("FR", window, check_digits=False, verified_only=True) == []
+
+
+def test_digit_swap_is_ambiguous():
+    # 8 read as 3: several one-digit repairs pass both checksums, none is kept
+    read = IBAN.replace("4089", "4039")
+    assert IBAN in [c.iban for c in search_corrections("FR", read[2:], verified_only=False)]
+    assert best_correction([("FR", read[2:], True)]) is None
+    assert best_correction([("FR", read[2:], True)], verified_only=False) is None
+
+
+def test_letter_repairs_never_return_another_iban():
+    rng = random.Random(14)
+    recovered = 0
+    for _ in range(300):
+        iban = random_iban(rng)
+        read = damage(iban, rng, rng.randint(1, 2), LOOKALIKES)
+        if read == iban:
+            continue
+        correction = best_correction([("FR", read[2:] + "BIC", True)])
+        assert correction is None or correction.iban == iban
+        recovered += correction is not None
+    assert recovered >= 250
+
+
+def test_digit_swaps_are_never_reported_as_verified():
+    rng = random.Random(15)
+    swaps = {"3": "8", "8": "3", "1": "7", "7": "1", "6": "5", "5": "6"}
+    for _ in range(200):
+        read = damage(random_iban(rng), rng, rng.randint(1, 2), swaps)
+        if is_valid_iban(read):
+            # Another IBAN as printed: nothing to correct
+            continue
+        assert best_correction([("FR", read[2:] + "BIC", True)]) is None
+
+
+def test_parser_reports_letter_repair_as_valid():
+    # Z read for 2 in the bank code, G and C are real account letters
+    result = parse_rib("IBAN : FR19 Z004 1887 399G 1034 17C7 483\nBIC : BNPAFRPPXXX")
+    assert result.status == ValidationStatus.VALID
+    assert result.data.iban == "FR1920041887399G103417C7483"
+    assert result.extraction_method == "OCR Correction (Search, 1 edit)"
+
+
+def test_parser_reports_inferred_digit_as_warning():
+    # Last key digit lost: solved from the checksum, not verified by it
+    result = parse_rib("IBAN : FR76 9999 9500 6846 8107 5052 59\nBIC : CRLYFRPP")
+    assert result.data.iban == "FR7699999500684681075052596"
+    assert result.status == ValidationStatus.WARNING
+    assert any("not verified" in detail for detail in result.validation_details)
+
+
+def test_label_letter_is_not_read_as_a_digit():
+    # One digit dropped in both the IBAN line and the table row
+    text = ("Banque Guichet Compte Clef\n40922 31181 16198928365 7\n"
+            "IBAN : FR76 4092 2311 8116 1989 2836 57\nBIC : CRLYFRPP")
+    result = parse_rib(text)
+    assert result.status != ValidationStatus.VALID
+    assert result.data.iban != "FR7604092231181161989283657"
+
+
+def test_parser_reports_rib_only_repair_as_warning():
+    # T read for 7 in a table without IBAN: only the RIB key checks it
+    result = parse_rib("Banque Guichet Compte Clé\n30002 0T344 00000040895 90\nBIC : CRLYFRPP")
+    assert result.data.iban == IBAN
+    assert result.status == ValidationStatus.WARNING
+    assert any("only verified by the RIB key" in detail for detail in result.validation_details)
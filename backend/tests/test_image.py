@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from app.services.image import PDFIUM_LOCK, find_rib_region, open_pdf, preprocess_image
+from app.services.metrics import collect
+
+
+def text_pdf(lines) -> bytes:
+    """One-page A4 PDF with Helvetica text lines given as (y, text)."""
+    ops = "".join(f"BT /F1 11 Tf 60 {y} Td ({text}) Tj ET\n" for y, text in lines).encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 5 0 R >> >> "
+        b"/Contents 4 0 R >>",
+        b"<< /Length %d >>\nstream\n" % len(ops) + ops + b"endstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    return out + b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+
+def rib_region(*lines):
+    pdf = open_pdf(text_pdf(lines))
+    with PDFIUM_LOCK:
+        return find_rib_region(pdf[0])
+
+
+def test_rib_region_around_labels():
+    bottom, top = rib_region((300, "IBAN : FR76 3000 4000 0100 0123 4567 830"), (280, "BIC/SWIFT : BNPAFRPP"))
+    assert bottom < 280 and 300 < top < 400
+
+
+def test_rib_region_ignores_labels_inside_words():
+    # "bicyclette" at the top of the page would stretch the band over most of it
+    with_word = rib_region((800, "Assurance bicyclette"), (300, "IBAN : FR76 3000 4000 0100 0123 4567 830"),
+                           (280, "BIC : BNPAFRPP"))
+    assert with_word == rib_region((300, "IBAN : FR76 3000 4000 0100 0123 4567 830"), (280, "BIC : BNPAFRPP"))
+    assert rib_region((800, "Assurance bicyclette")) is None
+
+
+def test_preprocess_stages_are_timed():
+    page = np.full((3000, 2000, 3), 255, dtype=np.uint8)
+    with collect() as timings:
+        processed = preprocess_image(page, "quality")
+    assert max(processed.shape) < 3000
+    assert set(timings) == {"preprocess_downscale", "preprocess_deskew", "preprocess_denoise"}
+
+    with collect() as timings:
+        assert preprocess_image(page, "none") is page
+    assert timings == {}
+
+
+def test_unknown_preset():
+    with pytest.raises(ValueError):
+        preprocess_image(np.zeros((10, 10, 3), dtype=np.uint8), "sharp")
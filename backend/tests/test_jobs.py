@@ -0,0 +1,147 @@
+import asyncio
+import json
+import sqlite3
+
+from app.services import jobs
+from app.services.jobs import JobStore, JobWorkers
+from app.services.upload import SpooledUpload
+
+
+def queue(store: JobStore, priority: int = 0, files: int = 1, activate: bool = True) -> str:
+    job_id = store.create(priority)
+    for position in range(files):
+        path = f"{store.job_dir(job_id)}/{position}.pdf"
+        open(path, "wb").close()
+        store.add_file(job_id, position, SpooledUpload(path, 0, f"{job_id}-{position}", f"{position}.pdf",
+                                                       "application/pdf"))
+    if activate:
+        store.activate(job_id)
+    return job_id
+
+
+def file_status(store: JobStore, job_id: str) -> list[str]:
+    return [row[0] for row in store._db.execute(
+        "SELECT status FROM job_files WHERE job_id = ? ORDER BY position", (job_id,))]
+
+
+def fake_pages(pages: int, during_first=None):
+    """analyze_document stand-in yielding `pages` results, calling `during_first` while on page 1."""
+    async def analyze_document(path, is_pdf, executor, doc_hash, profile=None):
+        for page in range(1, pages + 1):
+            if page == 1 and during_first is not None:
+                during_first()
+            yield {"page_number": page, "status": "valid"}
+    return analyze_document
+
+
+def drain(store: JobStore, until, monkeypatch, timeout: float = 5.0):
+    """Run one worker until `until()` is true."""
+    monkeypatch.setattr(jobs, "POLL_SECONDS", 0.01)
+
+    async def run():
+        workers = JobWorkers(store, executor=None, count=1)
+        await workers.start()
+        try:
+            deadline = asyncio.get_running_loop().time() + timeout
+            while not until():
+                assert asyncio.get_running_loop().time() < deadline, "worker stalled"
+                await asyncio.sleep(0.01)
+        finally:
+            await workers.stop()
+    asyncio.run(run())
+
+
+def test_claim_order(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    low = queue(store, priority=0, files=2)
+    high = queue(store, priority=5)
+    later_high = queue(store, priority=5)
+    queue(store, priority=9, activate=False)  # still uploading
+    order = []
+    while (claimed := store.claim()) is not None:
+        order.append(claimed[:2])
+    assert order == [(high, 0), (later_high, 0), (low, 0), (low, 1)]
+
+
+def test_recover_requeues_running_files(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job_id = queue(store, files=2)
+    uploading = queue(store, activate=False)
+    store.claim()
+    store.add_result(job_id, 0, {"page_number": 1})
+    assert file_status(store, job_id) == ["running", "queued"]
+
+    assert store.recover() == 1
+    assert file_status(store, job_id) == ["queued", "queued"]
+    assert store.results(job_id) == []
+    assert store.summary(uploading) is None
+
+
+def test_recover_cancelled_running_files(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job_id = queue(store, files=2)
+    store.claim()
+    store.add_result(job_id, 0, {"page_number": 1})
+    store.cancel(job_id)
+    assert file_status(store, job_id) == ["running", "cancelled"]
+
+    # Stopped before the worker saw the cancel: not queued again, spool file removed
+    assert store.recover() == 0
+    assert file_status(store, job_id) == ["cancelled", "cancelled"]
+    assert len(store.results(job_id)) == 1
+    assert store.summary(job_id)["status"] == "cancelled"
+    assert list((tmp_path / "jobs.db.files" / job_id).iterdir()) == []
+
+
+def test_worker_runs_the_queue(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job_id = queue(store, files=2)
+    monkeypatch.setattr(jobs, "analyze_document", fake_pages(2))
+    drain(store, lambda: store.summary(job_id)["status"] == "done", monkeypatch)
+    lines = [json.loads(line) for line in store.results(job_id)]
+    assert [(line["file_id"], line["page_number"]) for line in lines] == [("0", 1), ("0", 2), ("1", 1), ("1", 2)]
+
+
+def test_cancel_during_run(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job_id = queue(store, files=2)
+    monkeypatch.setattr(jobs, "analyze_document", fake_pages(5, during_first=lambda: store.cancel(job_id)))
+    drain(store, lambda: file_status(store, job_id)[0] not in ("queued", "running"), monkeypatch)
+    assert file_status(store, job_id) == ["cancelled", "cancelled"]
+    assert len(store.results(job_id)) == 1
+    assert store.summary(job_id)["status"] == "cancelled"
+
+
+def test_delete_during_run(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job_id = queue(store, files=2)
+    other = queue(store)
+    monkeypatch.setattr(jobs, "analyze_document", fake_pages(5, during_first=lambda: store.delete(job_id)))
+    # The deleted job gets no more lines and the worker moves on to the next job
+    drain(store, lambda: store.summary(other)["status"] == "done", monkeypatch)
+    assert store.summary(job_id) is None
+    assert store.results(job_id) == []
+    assert not (tmp_path / "jobs.db.files" / job_id).exists()
+
+
+def test_worker_survives_store_errors(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job_id = queue(store, files=2)
+    monkeypatch.setattr(jobs, "analyze_document", fake_pages(1))
+    claim, finish_file = store.claim, store.finish_file
+    failures = {"claim": 1, "finish_file": 1}
+
+    def flaky(name, method):
+        def call(*args):
+            if failures[name]:
+                failures[name] -= 1
+                raise sqlite3.OperationalError("database is locked")
+            return method(*args)
+        return call
+    monkeypatch.setattr(store, "claim", flaky("claim", claim))
+    monkeypatch.setattr(store, "finish_file", flaky("finish_file", finish_file))
+
+    # First file stuck running (until recover), the second one still processed
+    drain(store, lambda: file_status(store, job_id)[1] == "done", monkeypatch)
+    assert file_status(store, job_id) == ["running", "done"]
+    assert store.recover() == 1
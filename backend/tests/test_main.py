@@ -0,0 +1,36 @@
+from fastapi.testclient import TestClient
+
+from app import main
+from app.core import config
+
+
+def client_with_frontend(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "OCR_WARMUP", False)
+    (tmp_path / "index.html").write_text("<html>spa</html>")
+    return TestClient(main.create_app(str(tmp_path)))
+
+
+def test_readiness_probe_is_not_served_by_the_spa(tmp_path, monkeypatch):
+    client = client_with_frontend(tmp_path, monkeypatch)
+    response = client.get("/health/ready")
+    # OCR never warmed up here: JSON 503, not index.html with 200
+    assert response.status_code == 503
+    assert response.headers["content-type"].startswith("application/json")
+    assert response.json()["ready"] is False
+
+
+def test_service_routes_come_before_the_spa(tmp_path, monkeypatch):
+    client = client_with_frontend(tmp_path, monkeypatch)
+    health = client.get("/health")
+    assert health.status_code == 200 and health.json()["status"] == "ok"
+    metrics = client.get("/metrics")
+    assert metrics.headers["content-type"].startswith("text/plain")
+    assert "rib_ocr_ready 0" in metrics.text
+
+
+def test_spa_catch_all_still_serves_the_frontend(tmp_path, monkeypatch):
+    client = client_with_frontend(tmp_path, monkeypatch)
+    assert client.get("/").text == "<html>spa</html>"
+    assert client.get("/some/client/route").text == "<html>spa</html>"
+    assert client.get("/api/v1/unknown").status_code == 404
+    assert client.get("/health/").status_code == 404
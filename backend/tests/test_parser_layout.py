@@ -0,0 +1,68 @@
+import numpy as np
+
+from app.models.schemas import ValidationStatus
+from app.services.layout import OcrPage
+from app.services.parser import parse_rib
+
+IBAN = "FR7630004000010001234567830"
+HEADER = (0.20, [(0.05, "Banque"), (0.20, "Guichet"), (0.35, "N°"), (0.39, "de"), (0.43, "compte"),
+                 (0.65, "Clé"), (0.70, "RIB")])
+
+
+def page(rows, confidence=0.95) -> OcrPage:
+    """Words at (x, y), one DocTR line per row."""
+    words, boxes, lines = [], [], []
+    for line, (y, row) in enumerate(rows):
+        for x, word in row:
+            words.append(word)
+            boxes.append((x, y, x + 0.012 * len(word), y + 0.02))
+            lines.append(line)
+    return OcrPage(words, np.array(boxes), np.full(len(words), confidence), np.array(lines))
+
+
+def test_rib_table_read_by_columns():
+    rib = page([
+        (0.05, [(0.05, "BNP"), (0.10, "PARIBAS")]),
+        (0.10, [(0.05, "Titulaire"), (0.20, "du"), (0.25, "compte"), (0.35, ":"), (0.40, "PAUL"), (0.47, "MARTIN")]),
+        HEADER,
+        (0.24, [(0.05, "30004"), (0.20, "00001"), (0.36, "00012345678"), (0.66, "30")]),
+        (0.30, [(0.05, "BIC"), (0.10, "BNPAFRPP")]),
+    ])
+    result = parse_rib(rib.text, layout=rib)
+    assert result.status == ValidationStatus.VALID
+    assert result.data.iban == IBAN
+    assert result.extraction_method == "Reconstructed (Layout)"
+    assert result.data.owner_name == "PAUL MARTIN"
+    assert result.data.bic == "BNPAFRPP"
+    assert result.ocr_confidence == 0.95
+
+
+def test_layout_table_keeps_account_letters():
+    rib = page([HEADER, (0.24, [(0.05, "30002"), (0.20, "96404"), (0.36, "72E10452656"), (0.66, "29")])])
+    result = parse_rib(rib.text, layout=rib)
+    assert result.extraction_method == "Reconstructed (Layout)"
+    assert result.data.iban[4:] == "300029640472E1045265629"
+
+
+def test_sliding_windows_when_columns_fail():
+    # A stray "12" before the values: no column read, a shifted 23-digit window still passes
+    rib = page([HEADER, (0.24, [(0.01, "12"), (0.05, "30004"), (0.20, "00001"), (0.36, "00012345678"),
+                                (0.66, "30")])])
+    assert parse_rib(rib.text).data.iban == IBAN
+
+    result = parse_rib(rib.text, layout=rib)
+    assert result.status == ValidationStatus.VALID
+    assert result.data.iban == IBAN
+    assert result.extraction_method == "Reconstructed (Grouped Labels - Valid)"
+
+
+def test_bic_next_to_label_stops_at_the_next_word():
+    rows = {
+        "BNPAFRPP": [(0.10, "BNPAFRPP"), (0.25, "DOMICILIATION")],
+        "CMCIFRPP": [(0.10, "CMCIFRPP"), (0.25, "IBAN"), (0.30, "FR76")],
+        "AGRIFRPP882": [(0.10, "AGRI"), (0.16, "FRPP"), (0.22, "882")],
+        "CEPAFRPP": [(0.10, "CEPAFRPPDOM")],
+    }
+    for bic, words in rows.items():
+        rib = page([(0.30, [(0.05, "BIC"), *words])])
+        assert parse_rib(rib.text, layout=rib).data.bic == bic
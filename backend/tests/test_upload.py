@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+
+import pytest
+from fastapi import Request
+from fastapi.testclient import TestClient
+
+from app import main
+from app.core import config
+from app.services import jobs, upload
+from app.services.jobs import JobStore
+from app.services.upload import UploadTooLarge, receive_uploads
+
+PDF = b"%PDF-1.4 " + bytes(range(256)) * 40
+BOUNDARY = "rib-test-boundary"
+
+
+def multipart(*parts) -> bytes:
+    """Body of (name, value) fields and (name, filename, content) files."""
+    body = b""
+    for part in parts:
+        disposition = f'form-data; name="{part[0]}"'
+        if len(part) == 3:
+            disposition += f'; filename="{part[1]}"\r\nContent-Type: application/pdf'
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode()
+        body += (part[-1] if isinstance(part[-1], bytes) else part[-1].encode()) + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def receive(body: bytes, chunk: int = 1000, length: int = None, **options):
+    """receive_uploads over `body` sent in `chunk`-byte messages; also returns the messages read."""
+    chunks = [body[k:k + chunk] for k in range(0, len(body), chunk)]
+    sent = []
+
+    async def messages():
+        data = chunks[len(sent)]
+        sent.append(data)
+        return {"type": "http.request", "body": data, "more_body": len(sent) < len(chunks)}
+
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode()),
+               (b"content-length", str(len(body) if length is None else length).encode())]
+    request = Request({"type": "http", "method": "POST", "headers": headers}, messages)
+    try:
+        return asyncio.run(receive_uploads(request, **options)), len(sent)
+    except UploadTooLarge:
+        return None, len(sent)
+
+
+def test_files_written_while_received(tmp_path):
+    form, _ = receive(multipart(("files", "a.pdf", PDF), ("file_ids", "a"), ("files", "b.pdf", PDF[:100]),
+                                ("file_ids", "b")), directory=str(tmp_path))
+    first, second = form.uploads("files")
+    with open(first.path, "rb") as copy:
+        assert copy.read() == PDF
+    assert (first.filename, first.size, first.sha256) == ("a.pdf", len(PDF), hashlib.sha256(PDF).hexdigest())
+    assert second.size == 100 and second.is_pdf
+    assert form.values("file_ids") == ["a", "b"]
+    form.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_reading_stops_at_the_limit(tmp_path):
+    body = multipart(("file", "big.pdf", PDF))
+    form, read = receive(body, directory=str(tmp_path), limit=2000)
+    assert form is None
+    # Rejected after about 2 kB of a 10 kB body, partial copy removed
+    assert read <= 3
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_announced_length_rejected_before_reading(tmp_path):
+    body = multipart(("file", "big.pdf", PDF))
+    form, read = receive(body, length=10 ** 9, directory=str(tmp_path), limit=len(PDF), max_files=1)
+    assert form is None and read == 0
+
+
+def test_too_large_file_skipped(tmp_path):
+    form, _ = receive(multipart(("files", "big.pdf", PDF), ("files", "small.pdf", PDF[:100])),
+                      directory=str(tmp_path), limit=2000, skip_too_large=True)
+    big, small = form.uploads("files")
+    assert big.error == "File larger than 0 MB" and not big.path
+    assert small.error is None and small.size == 100
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "OCR_WARMUP", False)
+    monkeypatch.setattr(config, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(upload, "max_upload_bytes", lambda: 1024)
+    return TestClient(main.create_app(str(tmp_path / "no-frontend")))
+
+
+def test_analyze_answers_413(client, tmp_path):
+    response = client.post("/api/v1/analyze", files={"file": ("rib.pdf", PDF, "application/pdf")})
+    assert response.status_code == 413
+    assert "larger than" in response.json()["detail"]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_batch_reports_too_large_file(client, tmp_path):
+    response = client.post("/api/v1/analyze/batch", files={"files": ("rib.pdf", PDF, "application/pdf")},
+                           data={"file_ids": "x"})
+    assert response.status_code == 200
+    assert response.json() == {"file_id": "x", "file_name": "rib.pdf", "error": "File larger than 0 MB"}
+
+
+def test_jobs(client, tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(jobs, "_store", store)
+    monkeypatch.setattr(jobs, "_workers", None)
+
+    files = [("files", ("small.pdf", PDF[:512], "application/pdf")), ("files", ("big.pdf", PDF, "application/pdf"))]
+    response = client.post("/api/v1/jobs", files=files)
+    assert response.status_code == 413
+    assert response.json()["detail"].startswith("big.pdf")
+    # The partly uploaded job is dropped with its files
+    assert store.recent() == []
+    assert list((tmp_path / "jobs.db.files").iterdir()) == []
+
+    # Priority applied when the job is activated
+    response = client.post("/api/v1/jobs", files=files[:1], data={"priority": "3"})
+    assert (response.json()["priority"], response.json()["files"]) == (3, 1)
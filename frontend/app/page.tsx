@@ -6,11 +6,14 @@ import { UploadZone } from "../components/UploadZone";
 import { RibResult } from "../components/RibResult";
 import { RibTable } from "../components/RibTable";
 import { RibDetailModal } from "../components/RibDetailModal";
-import { analyzeRib, AnalyzeResponse } from "../lib/api";
+import { analyzeRibBatch, AnalyzeResponse } from "../lib/api";
 import * as XLSX from "xlsx";
 
 import { v4 as uuidv4 } from "uuid";
 
+// Files sent per /analyze/batch request
+const BATCH_SIZE = 20;
+
 interface ProcessedFile {
   id: string;
   file: File;
@@ -42,60 +45,80 @@ export default function Home() {
   const processQueue = async (queue: ProcessedFile[]) => {
     setIsProcessing(true);
 
-    for (const queueItem of queue) {
+    // One batch request per BATCH_SIZE files: the server schedules their
+    // pages over all its OCR workers instead of one file at a time
+    for (let start = 0; start < queue.length; start += BATCH_SIZE) {
+      const batch = queue.slice(start, start + BATCH_SIZE);
+      const batchIds = new Set(batch.map((queueItem) => queueItem.id));
       setItems((prev) =>
         prev.map((item) =>
-          item.id === queueItem.id ? { ...item, status: "processing" } : item,
+          batchIds.has(item.id) ? { ...item, status: "processing" } : item,
         ),
       );
 
       try {
-        let firstResult = true;
-        await analyzeRib(queueItem.file, (res) => {
-          setItems((prev) => {
-            const index = prev.findIndex(
-              (p) => p.id === queueItem.id && p.status === "processing",
-            );
-
-            if (firstResult && index !== -1) {
-              // Replace the processing placeholder with the first real result
-              firstResult = false;
-              const newItems = [...prev];
-              newItems[index] = {
-                ...newItems[index],
-                status: "done",
-                response: res,
-              };
-              return newItems;
-            } else {
-              // Append additional results (for multi-page)
-              return [
-                ...prev,
-                {
-                  id: uuidv4(),
-                  file: queueItem.file,
+        const answered = new Set<string>();
+        await analyzeRibBatch(
+          batch,
+          (res) => {
+            const queueItem = batch.find((b) => b.id === res.file_id);
+            if (!queueItem) return;
+            const firstResult = !answered.has(queueItem.id);
+            answered.add(queueItem.id);
+            setItems((prev) => {
+              const index = prev.findIndex(
+                (p) => p.id === queueItem.id && p.status === "processing",
+              );
+
+              if (firstResult && index !== -1) {
+                // Replace the processing placeholder with the first real result
+                const newItems = [...prev];
+                newItems[index] = {
+                  ...newItems[index],
                   status: "done",
                   response: res,
-                },
-              ];
-            }
-          });
-        });
+                };
+                return newItems;
+              } else {
+                // Append additional results (for multi-page)
+                return [
+                  ...prev,
+                  {
+                    id: uuidv4(),
+                    file: queueItem.file,
+                    status: "done",
+                    response: res,
+                  },
+                ];
+              }
+            });
+          },
+          (error) => {
+            answered.add(error.file_id);
+            setItems((prev) =>
+              prev.map((item) =>
+                item.id === error.file_id
+                  ? { ...item, status: "error", error: `Erreur Serveur: ${error.error}` }
+                  : item,
+              ),
+            );
+          },
+        );
 
-        // If no results were returned but analyzeRib finished without error
+        // Files of the batch without any result
         setItems((prev) =>
           prev.map((item) =>
-            item.id === queueItem.id && item.status === "processing"
+            batchIds.has(item.id) && item.status === "processing"
               ? { ...item, status: "done" }
               : item,
           ),
         );
       } catch (err: any) {
-        console.error("DEBUG: Error in processQueue for item execution:", err);
+        console.error("DEBUG: Error in processQueue for batch execution:", err);
         const errorMsg = err.message || "Erreur inconnue";
         setItems((prev) =>
           prev.map((item) =>
-            item.id === queueItem.id
+            batchIds.has(item.id) && item.status === "processing"
               ? { ...item, status: "error", error: errorMsg }
               : item,
           ),
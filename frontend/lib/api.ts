@@ -11,41 +11,42 @@ export interface AnalyzeResponse {
   extraction_method?: string | null;
   checksum_valid: boolean;
   rib_key_valid?: boolean | null;
+  ocr_confidence?: number | null;
   validation_details?: string[] | null;
   page_number?: number | null;
+  file_id?: string | null;
+  file_name?: string | null;
+  ocr_profile?: string | null;
+  timings?: Record<string, number> | null;
   data: RibData;
   message: string | null;
 }
 
-export async function analyzeRib(
-  file: File, 
-  onResult: (result: AnalyzeResponse) => void
-): Promise<void> {
-  const formData = new FormData();
-  formData.append('file', file);
-
-  const response = await fetch('/api/v1/analyze', {
-    method: 'POST',
-    body: formData,
-  });
+// Batch line for a file that could not be analyzed
+export interface BatchError {
+  file_id: string;
+  file_name: string | null;
+  error: string;
+}
 
-  if (!response.ok) {
-    let errorMessage = 'Erreur lors de l\'analyse';
-    try {
-      const errorData = await response.json();
-      if (errorData.detail) {
-        errorMessage = `Erreur Serveur: ${typeof errorData.detail === 'string' ? errorData.detail : JSON.stringify(errorData.detail)}`;
-      } else {
-        errorMessage = `Erreur HTTP ${response.status}: ${response.statusText}`;
-      }
-    } catch (e) {
+async function responseError(response: Response): Promise<Error> {
+  let errorMessage = 'Erreur lors de l\'analyse';
+  try {
+    const errorData = await response.json();
+    if (errorData.detail) {
+      errorMessage = `Erreur Serveur: ${typeof errorData.detail === 'string' ? errorData.detail : JSON.stringify(errorData.detail)}`;
+    } else {
       errorMessage = `Erreur HTTP ${response.status}: ${response.statusText}`;
     }
-    console.error("Backend Error Response:", errorMessage);
-    throw new Error(errorMessage);
+  } catch (e) {
+    errorMessage = `Erreur HTTP ${response.status}: ${response.statusText}`;
   }
+  console.error("Backend Error Response:", errorMessage);
+  return new Error(errorMessage);
+}
 
-  // Handle Streaming Response (NDJSON)
+// Handle Streaming Response (NDJSON)
+async function readNdjson(response: Response, onLine: (line: any) => void): Promise<void> {
   const reader = response.body?.getReader();
   if (!reader) {
     throw new Error("Impossible de lire le flux de réponse");
@@ -67,8 +68,7 @@ export async function analyzeRib(
     for (const line of lines) {
       if (line.trim()) {
         try {
-          const result = JSON.parse(line) as AnalyzeResponse;
-          onResult(result);
+          onLine(JSON.parse(line));
         } catch (e) {
           console.error("Erreur de parsing NDJSON:", e, line);
         }
@@ -79,10 +79,60 @@ export async function analyzeRib(
   // Process any remaining text in buffer
   if (buffer.trim()) {
     try {
-      const result = JSON.parse(buffer) as AnalyzeResponse;
-      onResult(result);
+      onLine(JSON.parse(buffer));
     } catch (e) {
       console.error("Erreur de parsing NDJSON (final):", e, buffer);
     }
   }
 }
+
+export async function analyzeRib(
+  file: File, 
+  onResult: (result: AnalyzeResponse) => void
+): Promise<void> {
+  const formData = new FormData();
+  formData.append('file', file);
+
+  const response = await fetch('/api/v1/analyze', {
+    method: 'POST',
+    body: formData,
+  });
+
+  if (!response.ok) {
+    throw await responseError(response);
+  }
+
+  await readNdjson(response, (line) => onResult(line as AnalyzeResponse));
+}
+
+// Batch mode: all files in one request, the server spreads their pages over
+// its OCR workers. Results arrive in completion order, tagged with the id
+// given for their file.
+export async function analyzeRibBatch(
+  files: { id: string; file: File }[],
+  onResult: (result: AnalyzeResponse) => void,
+  onError: (error: BatchError) => void
+): Promise<void> {
+  const formData = new FormData();
+  for (const { id, file } of files) {
+    formData.append('files', file);
+    formData.append('file_ids', id);
+  }
+
+  const response = await fetch('/api/v1/analyze/batch', {
+    method: 'POST',
+    body: formData,
+  });
+
+  if (!response.ok) {
+    throw await responseError(response);
+  }
+
+  await readNdjson(response, (line) => {
+    if (line.error) {
+      onError(line as BatchError);
+    } else {
+      onResult(line as AnalyzeResponse);
+    }
+  });
+}